@@ -1,46 +1,365 @@
+import os
+import sys
+import csv
+import math
 import time
-import numpy as np
-import matplotlib.pyplot as plt
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import assign_students
+import result_cache
+from export_assignments import atomic_output
 
+# Number of random assignments of each dataset the proposed algorithm is compared to
+RANDOM_TRIALS = 1000
+# Numbers of students of the datasets in the data folder, used in our report
+DEFAULT_SIZES = (31, 62, 125, 250, 500, 1000)
+# Algorithms an experiment can run; random is RANDOM_TRIALS random assignments and deferred is deferred acceptance
+EXPERIMENT_ENGINES = ("proposed", "random", "optimal", "deferred")
+# Number of timed runs of the proposed algorithm on each dataset
+RUNTIME_RUNS = 10
+# Most preferences each student of a generated dataset lists
+GENERATED_RANKS = 64
+# Columns of the table of experiment results, one row per algorithm run or timed run
+RESULT_COLUMNS = ("experiment", "students", "projects", "engine", "seed", "run", "sum_preferences", "std",
+                  "top_1", "top_3", "worst", "seconds", "error")
 
-def get_sum_preferences() -> dict:
+
+def dataset_path(num_students: int) -> str:
+    """
+    Helper function to get the path to the dataset containing num_students students
+
+    A binary students file created by binary_students.py is used if there is one,
+    since it is opened without parsing the text file on every run.
+
+    Parameters
+    ----------
+    num_students: int
+        Number of students in the dataset
+
+    Returns
+    -------
+    str
+        Path to the dataset
+    """
+    binary_path = "data/" + str(num_students) + "students.bin"
+    if os.path.exists(binary_path):
+        return binary_path
+    return "data/" + str(num_students) + "students.txt"
+
+
+def load_dataset(num_students: int, seed: int = None, cache: result_cache.ResultCache = None) -> tuple:
+    """
+    Helper function to load the students of the dataset containing num_students students
+
+    Datasets that aren't in the data folder are generated with data_generator.generate_registered_students,
+    with each student listing GENERATED_RANKS preferences, so much larger cohorts can be studied.
+
+    Parameters
+    ----------
+    num_students: int
+        Number of students in the dataset
+    seed: int
+        Seed of a generated dataset
+    cache: result_cache.ResultCache
+        If provided, a dataset in the data folder is only parsed the first time it is loaded
+
+    Returns
+    -------
+    tuple
+        First entry is the students mapped to their preferences
+        Second entry is the projects to assign students to, or None to use every project students listed
+    """
+    path_to_file = dataset_path(num_students)
+    if os.path.exists(path_to_file):
+        if cache is not None:
+            return (cache.load_students(path_to_file), None)
+        return (assign_students.load_students(path_to_file), None)
+    # Imported here so numpy is only needed to generate datasets
+    import data_generator
+    students, registry = data_generator.generate_registered_students(num_students, math.ceil(num_students / 4),
+                                                                     seed, num_ranks=GENERATED_RANKS)
+    return (students, registry.project_list(None))
+
+
+def run_engine(students: dict, project_list: list, engine: str, seed: int,
+               cache: result_cache.ResultCache = None, trials: int = RANDOM_TRIALS) -> tuple:
+    """
+    Helper function to run one of EXPERIMENT_ENGINES on a dataset
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    project_list: list
+        Projects to assign students to, or None to use every project students listed
+    engine: str
+        One of EXPERIMENT_ENGINES
+    seed: int
+        Seed of the random assignments and of the lottery of deferred acceptance
+    cache: result_cache.ResultCache
+        If provided, the results of the proposed, optimal and deferred acceptance algorithms are reused from earlier runs
+    trials: int
+        Number of random assignments
+
+    Returns
+    -------
+    tuple
+        First entry is the sum of preferences, or the mean over the random assignments
+        Second entry is the standard deviation of the random sums of preferences, or None
+        Third entry is the outcome_analytics.outcome_report of the project assignments, or None for the
+        random assignments, which only keep their sums of preferences
+    """
+    projects = assign_students.initalize_projects(students, project_list)
+    if engine == "random":
+        # Imported here so numpy is only needed when used. The trials run in this process, since it is a worker already
+        import monte_carlo
+        summary = monte_carlo.summarize_trials(monte_carlo.run_monte_carlo(students, projects, trials, workers=1,
+                                                                           seed=seed))
+        return (summary["mean"], summary["std"], None)
+    name = {"proposed": "assign_students", "optimal": "optimally_assign_students",
+            "deferred": "deferred_acceptance_assign_students"}.get(engine)
+    if name is None:
+        raise ValueError("unknown engine " + repr(engine) + "; use one of " + ", ".join(EXPERIMENT_ENGINES))
+    # Deferred acceptance breaks ties between students with a seeded lottery
+    params = {"seed": seed} if engine == "deferred" else {}
+    if cache is not None:
+        result = cache.assign(students, name, project_list, **params)
+    else:
+        result = result_cache.run_engine(students, name, project_list, params)
+    if result is None:
+        raise ValueError(str(len(students)) + " students can't be assigned to " + str(len(projects))
+                         + " projects of 3 or 4 students")
+    # Imported here so numpy is only needed when used. Every algorithm's project assignments are measured the same way
+    import outcome_analytics
+    report = outcome_analytics.outcome_report(students, result[0])
+    return (report["sum_preferences"], None, report)
+
+
+def run_dataset(task: tuple) -> list:
+    """
+    Function to run every algorithm and seed of the experiments on one dataset, parsing it once
+
+    Runs in a worker process.
+
+    Parameters
+    ----------
+    task: tuple
+        Number of students in the dataset, seed of the dataset if it is generated or None, seeds of
+        the random assignments, names of the algorithms, the directory of the cache or None, and the
+        number of random assignments
+
+    Returns
+    -------
+    list
+        Row of RESULT_COLUMNS for each algorithm and seed, with the error of algorithms that failed
+    """
+    num_students, dataset_seed, seeds, engines, cache_directory, trials = task
+    cache = result_cache.ResultCache(cache_directory) if cache_directory is not None else None
+    students, project_list = load_dataset(num_students, dataset_seed, cache)
+    num_projects = len(assign_students.initalize_projects(students, project_list))
+    rows = []
+    for seed in seeds:
+        for engine in engines:
+            row = {"experiment": "sum_preferences", "students": len(students), "projects": num_projects,
+                   "engine": engine, "seed": seed, "run": None, "sum_preferences": None, "std": None,
+                   "top_1": None, "top_3": None, "worst": None, "seconds": None, "error": None}
+            start = time.perf_counter()
+            try:
+                row["sum_preferences"], row["std"], report = run_engine(students, project_list, engine, seed, cache,
+                                                                        trials)
+                if report is not None:
+                    row["top_1"], row["top_3"], row["worst"] = report["top_1"], report["top_3"], report["worst"]
+            except Exception as error:
+                # Report the error in the row so the other experiments still finish
+                row["error"] = type(error).__name__ + ": " + str(error)
+            row["seconds"] = time.perf_counter() - start
+            rows.append(row)
+    return rows
+
+
+def run_sum_preferences(sizes: list = DEFAULT_SIZES, engines: list = EXPERIMENT_ENGINES, seeds: list = (0,),
+                        workers: int = None, cache_directory: str = None, trials: int = RANDOM_TRIALS) -> list:
+    """
+    Function to find the sum of preferences of each algorithm on each dataset, running datasets in parallel
+
+    Each dataset is parsed once by the worker process running its algorithms. Datasets in the data
+    folder are shared by every seed, and generated datasets are generated once per seed.
+
+    Parameters
+    ----------
+    sizes: list
+        Numbers of students of the datasets
+    engines: list
+        Names of the algorithms in EXPERIMENT_ENGINES
+    seeds: list
+        Seeds of the random assignments and of generated datasets
+    workers: int
+        Number of worker processes; defaults to the number of CPUs
+    cache_directory: str
+        If provided, the directory of a result_cache.ResultCache keeping parsed datasets and the
+        results of the proposed and optimal algorithms between runs
+    trials: int
+        Number of random assignments of the random algorithm
+
+    Returns
+    -------
+    list
+        Row of RESULT_COLUMNS for each dataset, algorithm and seed
+    """
+    tasks = []
+    for num_students in sizes:
+        if os.path.exists(dataset_path(num_students)):
+            tasks.append((num_students, None, list(seeds), list(engines), cache_directory, trials))
+        else:
+            tasks.extend((num_students, seed, [seed], list(engines), cache_directory, trials) for seed in seeds)
+    workers = workers or os.cpu_count() or 1
+    # Run every dataset in this process if there is one worker, which avoids starting a pool
+    if workers == 1 or len(tasks) <= 1:
+        results = [run_dataset(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            results = list(executor.map(run_dataset, tasks))
+    return [row for rows in results for row in rows]
+
+
+def run_runtimes(sizes: list = DEFAULT_SIZES, runs: int = RUNTIME_RUNS, seed: int = 0,
+                 cache: result_cache.ResultCache = None) -> list:
+    """
+    Function to time the proposed algorithm on each dataset
+
+    The algorithm runs once before it is timed on each dataset, so the first timed run isn't slowed
+    down by warming up. Timed runs are made one at a time in this process, after any other experiments,
+    so they don't compete for the CPU. benchmark.py times each phase on larger generated datasets.
+
+    Parameters
+    ----------
+    sizes: list
+        Numbers of students of the datasets
+    runs: int
+        Number of timed runs on each dataset
+    seed: int
+        Seed of generated datasets
+    cache: result_cache.ResultCache
+        If provided, each dataset in the data folder is read back from the cache instead of parsed
+
+    Returns
+    -------
+    list
+        Row of RESULT_COLUMNS for each dataset and timed run
+    """
+    rows = []
+    for num_students in sizes:
+        # Load each dataset once, since the algorithm doesn't change the students
+        students, project_list = load_dataset(num_students, seed, cache)
+        assign_students.assign_students(students, assign_students.initalize_projects(students, project_list))
+        for run in range(runs):
+            # Call helper function to initialize projects dictionary
+            projects = assign_students.initalize_projects(students, project_list)
+            start = time.perf_counter()
+            # Call algorithm
+            assign_students.assign_students(students, projects)
+            end = time.perf_counter()
+            rows.append({"experiment": "runtime", "students": len(students), "projects": len(projects),
+                         "engine": "proposed", "seed": seed, "run": run, "sum_preferences": None, "std": None,
+                         "top_1": None, "top_3": None, "worst": None, "seconds": end - start, "error": None})
+    return rows
+
+
+def write_results(rows: list, filename: str) -> None:
     """
-    Return the sum of preferences for the proposed and random algorithm on all datasets produced
+    Helper function to write the rows of experiment results to a CSV file with RESULT_COLUMNS
 
     Parameters
     ----------
+    rows: list
+        Rows of RESULT_COLUMNS
+    filename: str
+        Name of the CSV file
+
+    Returns
+    -------
     None
+    """
+    with atomic_output(filename) as file:
+        writer = csv.DictWriter(file, RESULT_COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_results(filename: str) -> list:
+    """
+    Helper function to read the rows of experiment results written by write_results
+
+    Parameters
+    ----------
+    filename: str
+        Name of the CSV file
 
     Returns
     -------
-    dict 
-        Dictionary where key is the number of students in dataset and value is 
-        a tuple. The first value in the tuple is the sum of preferences generated
-        by the proposed algorithm, and the second value is the sum of preferences
-        when students are randomly assigned to projects. 
-    """
-    # Create dictionary storing mapping of number of students in dataset to sum_preferences
-    dataset_sum_preferences = {}
-    # For each dataset created
-    for num_students in [31, 62, 125, 250, 500, 1000]:
-        # Track sum of preferences for proposed algorithm and random assignment
-        algorithm_sum_preferences = 0
-        random_sum_preferences = 0
-        # Call helper function to create dictionary of students mapped to their preferences
-        students = assign_students.load_students("data/" + str(num_students) + "students.txt")
-        # Call helper function to initialize projects dictionary
-        projects = assign_students.initalize_projects(students)
-        # Call proposed algorithm to assign students based on their preferences
-        projects, algorithm_sum_preferences = assign_students.assign_students(students, projects)
-        # Reload students and projects so can run random algorithm on dataset
-        students = assign_students.load_students("data/" + str(num_students) + "students.txt")
-        projects = assign_students.initalize_projects(students)
-        # Call function to randomly assign students to projects
-        projects, random_sum_preferences = assign_students.randomly_assign_students(students, projects)
-        # Store results in dictionary key mapped to a tuple
-        dataset_sum_preferences[num_students] = (algorithm_sum_preferences, random_sum_preferences)
-    return dataset_sum_preferences
+    list
+        Rows of RESULT_COLUMNS, with numbers converted back and empty cells as None
+    """
+    rows = []
+    with open(filename, newline="") as file:
+        for row in csv.DictReader(file):
+            for column in ("students", "projects", "seed", "run", "worst"):
+                row[column] = int(row[column]) if row[column] else None
+            for column in ("sum_preferences", "std", "top_1", "top_3", "seconds"):
+                row[column] = float(row[column]) if row[column] else None
+            row["error"] = row["error"] or None
+            rows.append(row)
+    return rows
+
+
+def mean_by(rows: list, experiment: str, engine: str, column: str) -> dict:
+    """
+    Helper function to average a column of the rows of one experiment and algorithm for each number of students
+
+    Parameters
+    ----------
+    rows: list
+        Rows of RESULT_COLUMNS
+    experiment: str
+        Experiment of the rows to average
+    engine: str
+        Algorithm of the rows to average
+    column: str
+        Column to average
+
+    Returns
+    -------
+    dict
+        Numbers of students mapped to the mean of the column, in increasing order
+    """
+    values = {}
+    for row in rows:
+        if row["experiment"] == experiment and row["engine"] == engine and row[column] is not None:
+            values.setdefault(row["students"], []).append(row[column])
+    return {num_students: sum(values[num_students]) / len(values[num_students]) for num_students in sorted(values)}
+
+
+def sum_preferences_by_size(rows: list) -> dict:
+    """
+    Helper function to collect the sums of preferences of each algorithm in the form plot_sum_preferences takes
+
+    Parameters
+    ----------
+    rows: list
+        Rows of RESULT_COLUMNS
+
+    Returns
+    -------
+    dict
+        Numbers of students mapped to the proposed, mean random, optimal and random standard deviation
+        sums of preferences averaged over seeds, with nan for algorithms that weren't run
+    """
+    columns = [mean_by(rows, "sum_preferences", "proposed", "sum_preferences"),
+               mean_by(rows, "sum_preferences", "random", "sum_preferences"),
+               mean_by(rows, "sum_preferences", "optimal", "sum_preferences"),
+               mean_by(rows, "sum_preferences", "random", "std")]
+    sizes = sorted(set().union(*columns))
+    return {num_students: tuple(column.get(num_students, math.nan) for column in columns) for num_students in sizes}
 
 
 def plot_sum_preferences(dataset_sum_preferences: dict) -> None:
@@ -52,80 +371,45 @@ def plot_sum_preferences(dataset_sum_preferences: dict) -> None:
     dataset_sum_preferences: dict
         Dictionary where key is the number of students in dataset and value is 
         a tuple. The first value in the tuple is the sum of preferences generated
-        by the proposed algorithm, and the second value is the sum of preferences
-        when students are randomly assigned to projects. 
+        by the proposed algorithm, the second value is the mean sum of preferences
+        of random assignments, the third value is the lowest possible sum of preferences
+        found by the optimal algorithm, and the fourth value is the standard deviation
+        of the random sums of preferences, drawn as error bars.
 
     Returns
     -------
     None
     """
+    # Imported here so matplotlib is only needed when plotting
+    import numpy as np
+    import matplotlib.pyplot as plt
     # Set up figure
     fig = plt.figure(dpi=500)
     ax = fig.add_axes([0,0,1,1])
-    x = np.arange(3)
+    x = np.arange(min(3, len(dataset_sum_preferences)))
     # Get y values from dictionary
     y = list(dataset_sum_preferences.values())
     y1 = [y1[0] for y1 in y]
     y2 = [y2[1] for y2 in y]
+    y3 = [y3[2] for y3 in y]
+    y2_std = [y2[3] for y2 in y]
     # Plot bars. Only plot first 3 values because later y values for y2 tower over other values
     ax.bar(x + 0.00, y1[0:3], color = 'dodgerblue', width=0.25)
-    ax.bar(x + 0.25, y2[0:3], color = 'tab:green', width=0.25)
+    ax.bar(x + 0.25, y2[0:3], yerr=y2_std[0:3], capsize=3, color = 'tab:green', width=0.25)
+    ax.bar(x + 0.50, y3[0:3], color = 'tab:orange', width=0.25)
     # Add Labels
     plt.xlabel('Number of Students in Dataset', fontweight='bold', color = 'black', fontsize='14', horizontalalignment='center')
     plt.ylabel('Sum of Preferences', fontweight='bold', color = 'black', fontsize='14')
     plt.title('Sum of Preferences Per Dataset', fontweight='bold', color = 'black', fontsize='14')
     plt.xticks(x, list(dataset_sum_preferences.keys())[0:3], fontsize="small")
     # Add legend
-    colors = {"Proposed": 'dodgerblue', "Random": 'tab:green'}         
+    colors = {"Proposed": 'dodgerblue', "Random": 'tab:green', "Optimal": 'tab:orange'}         
     labels = list(colors.keys())
     plt.legend(labels, title="Algorithm")
     # Save Plot
     fig.savefig('sum_preferences.png', bbox_inches='tight', pad_inches=0.25)
     
 
-def get_average_runtimes() -> dict:
-    """
-    Helper function to get average run times for algorithm on generated datasets.
-
-    Function runs the algorithm 10 times on each dataset and calculates average for 
-    each dataset.
-
-    Parameters
-    ----------
-    None
-
-    Returns
-    -------
-    dict 
-        Dictionary where key is the number of students in dataset and value is 
-        average run time of algorithm on dataset containing the number of students
-        speficied by the key
-    """
-    # Create dictionary to track average time spent running algorithm for each input size
-    times = {}
-    # For each dataset
-    for num_students in [31, 62, 125, 250, 500, 1000]:
-        # Create variable to track total time spent running algorithm on each dataset
-        sum_times = 0
-        # Run algorithm 10 times on each dataset
-        for run in range(10):
-            # Call helper function to create dictionary of students mapped to their preferences
-            students = assign_students.load_students("data/" + str(num_students) + "students.txt")
-            # Call helper function to initialize projects dictionary
-            projects = assign_students.initalize_projects(students)
-            # Get start time
-            start = time.time()
-            # Call algorithm
-            assign_students.assign_students(students, projects)
-            # Get end time
-            end = time.time()
-            # Add difference to sum_times
-            sum_times += end - start
-        # Add sum_times to dictionary mapping number of students to average time take 
-        times[num_students] = sum_times / 10
-    return times
-
-
 def plot_average_runtimes(times: dict) -> None:
     """
     Helper function to plot average runtimes and save as file
@@ -140,6 +424,9 @@ def plot_average_runtimes(times: dict) -> None:
     -------
     None
     """
+    # Imported here so matplotlib is only needed when plotting
+    import numpy as np
+    import matplotlib.pyplot as plt
     # Set up figure
     x = np.arange(len(times))
     y = times.values()
@@ -156,8 +443,60 @@ def plot_average_runtimes(times: dict) -> None:
     fig.savefig('runtimes.png', bbox_inches='tight', pad_inches=0.25)
 
 
+def plot_results(rows: list) -> None:
+    """
+    Function to plot the figures of whichever experiments are in the rows of results
+
+    Parameters
+    ----------
+    rows: list
+        Rows of RESULT_COLUMNS
+
+    Returns
+    -------
+    None
+    """
+    if any(row["experiment"] == "runtime" for row in rows):
+        plot_average_runtimes(mean_by(rows, "runtime", "proposed", "seconds"))
+    if any(row["experiment"] == "sum_preferences" for row in rows):
+        plot_sum_preferences(sum_preferences_by_size(rows))
+
+
 if __name__ == "__main__":
-    times = get_average_runtimes()
-    plot_average_runtimes(times)
-    dataset_sum_preferences = get_sum_preferences()
-    plot_sum_preferences(dataset_sum_preferences)
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Compare the algorithms on datasets of different sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="numbers of students of the datasets; sizes not in the data folder are generated")
+    parser.add_argument("--engines", nargs="+", choices=EXPERIMENT_ENGINES, default=list(EXPERIMENT_ENGINES),
+                        help="algorithms to find the sum of preferences of")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0],
+                        help="seeds of the random assignments and generated datasets")
+    parser.add_argument("--trials", type=int, default=RANDOM_TRIALS,
+                        help="random assignments of each dataset the random algorithm averages")
+    parser.add_argument("--runs", type=int, default=RUNTIME_RUNS,
+                        help="timed runs of the proposed algorithm on each dataset (0 to skip timing)")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--output", default="experiments.csv", help="CSV file to write the results to")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="parse datasets and run the algorithms again instead of using .assignment_cache")
+    parser.add_argument("--no-plot", action="store_true", help="only write the results, without Matplotlib")
+    parser.add_argument("--plot-only", metavar="CSV", help="plot the results written by an earlier run")
+    args = parser.parse_args()
+    if args.plot_only:
+        plot_results(read_results(args.plot_only))
+        sys.exit(0)
+    # Keep parsed datasets and results between runs of the analysis
+    cache_directory = None if args.no_cache else result_cache.DEFAULT_DIRECTORY
+    rows = run_sum_preferences(args.sizes, args.engines, args.seeds, args.workers, cache_directory, args.trials)
+    # Time the algorithm after the other experiments so nothing else is running
+    cache = result_cache.ResultCache(cache_directory) if cache_directory is not None else None
+    rows.extend(run_runtimes(args.sizes, args.runs, args.seeds[0], cache))
+    write_results(rows, args.output)
+    print("Results of", len(rows), "runs written to", args.output)
+    # Report the algorithms that failed on a dataset
+    for row in rows:
+        if row["error"] is not None:
+            print(str(row["students"]) + " students, " + row["engine"] + ", seed " + str(row["seed"]) + ":",
+                  row["error"], file=sys.stderr)
+    if not args.no_plot:
+        plot_results(rows)
@@ -0,0 +1,321 @@
+import sys
+import json
+import asyncio
+import argparse
+import assign_students
+import local_search
+from capacities import project_capacities, capacity_error
+from incremental_assignment import IncrementalAssignment
+
+
+class Cohort:
+    """
+    Students of one cohort kept in memory between requests, with their latest project assignments
+
+    Students are loaded once, and changes to their preferences repair the latest assignment
+    with IncrementalAssignment instead of assigning every student again.
+    """
+
+    def __init__(self, students: dict, project_list: list = None):
+        self.students = students
+        self.project_list = project_list
+        # Latest project assignments, or None until students are assigned
+        self.assignment = None
+
+    def assign(self, use_numpy: bool = False, improve: float = None) -> int:
+        """
+        Assign students to projects with the proposed algorithm, keeping the result for later requests
+
+        If improve is given, up to that many seconds are spent swapping and moving students afterwards.
+        """
+        if not self.students:
+            raise ValueError("the cohort has no students to assign")
+        projects = assign_students.initalize_projects(self.students, self.project_list)
+        result = assign_students.assign_students(self.students, projects, use_numpy=use_numpy)
+        if result is None:
+            raise ValueError(capacity_error(len(self.students), *project_capacities(projects)))
+        projects, sum_preferences = result
+        if improve is not None:
+            projects, sum_preferences = local_search.improve_assignment(self.students, projects, sum_preferences,
+                                                                        improve)
+        self.assignment = IncrementalAssignment(self.students, projects, sum_preferences)
+        return sum_preferences
+
+    def random_baseline(self, seed: int = None) -> int:
+        """
+        Sum of preferences of randomly assigning students to projects, without changing the kept assignment
+        """
+        if not self.students:
+            raise ValueError("the cohort has no students to assign")
+        projects = assign_students.initalize_projects(self.students, self.project_list)
+        # A seed only seeds this baseline, not the random module shared by every cohort
+        result = assign_students.randomly_assign_students(self.students, projects, seed=seed)
+        if result is None:
+            raise ValueError(capacity_error(len(self.students), *project_capacities(projects)))
+        return result[1]
+
+    def update(self, student, preferences: list = None, remove: bool = False) -> tuple:
+        """
+        Add, change or remove a student, repairing the kept assignment if there is one
+
+        Returns the projects whose students changed mapped to their students, and the sum of
+        preferences, or an empty dictionary and None if students haven't been assigned yet.
+        The update is checked before anything changes, so an update that fails changes nothing.
+        """
+        if remove and student not in self.students:
+            raise ValueError(str(student) + " is not in the cohort")
+        if not remove and not preferences:
+            raise ValueError("preferences are needed to add or change a student")
+        # Projects are numbers or labels, so lists and objects sent as preferences are rejected
+        if not remove and (not isinstance(preferences, list)
+                           or not all(isinstance(project, (int, str)) for project in preferences)):
+            raise ValueError("preferences must be a list of projects")
+        if self.assignment is None:
+            # Only the students change until they are assigned
+            if remove:
+                del self.students[student]
+            else:
+                self.students[student] = preferences
+            return ({}, None)
+        if remove:
+            return self.assignment.apply(removed=[student])
+        if student in self.students:
+            return self.assignment.apply(changed={student: preferences})
+        return self.assignment.apply(added={student: preferences})
+
+    def outcome(self) -> dict:
+        """
+        Measures of the kept assignment from outcome_analytics.outcome_report
+        """
+        if self.assignment is None:
+            raise ValueError("students haven't been assigned yet")
+        # Imported here so numpy is only needed when used
+        import outcome_analytics
+        return outcome_analytics.outcome_report(self.students, self.assignment.to_projects())
+
+    def fetch(self, student=None) -> dict:
+        """
+        Latest project of student and their preference for it, or every project's students if student is None
+        """
+        if self.assignment is None:
+            raise ValueError("students haven't been assigned yet")
+        if student is None:
+            return {"projects": self.assignment.to_projects(), "sum_preferences": self.assignment.sum_preferences}
+        if student not in self.assignment.project_of:
+            raise ValueError(str(student) + " is not in the cohort")
+        project = self.assignment.project_of[student]
+        return {"student": student, "project": project,
+                "preference": self.assignment.ranks.rank(student, project) + 1}
+
+
+def load_cohort(path_to_file: str) -> dict:
+    """
+    Function to load the students of a cohort so their preferences can be changed
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to a students file, which may be compressed or a binary students file
+
+    Returns
+    -------
+    dict
+        Dictionary of students mapped to lists of their preferences
+    """
+    # Students read from a binary students file can't be changed, so their preferences are copied into lists
+    return {name: list(preferences) for name, preferences in assign_students.load_students(path_to_file).items()}
+
+
+def handle_request(cohorts: dict, request: dict) -> dict:
+    """
+    Function to answer one request about the cohorts kept in memory
+
+    Parameters
+    ----------
+    cohorts: dict
+        Dictionary of cohort IDs mapped to their Cohort
+    request: dict
+        Request with an "op" of "load", "assign", "random", "update", "fetch", "unload" or "list",
+        the "cohort" it is about and the op's arguments. An "id" is copied to the response
+
+    Returns
+    -------
+    dict
+        Response with "ok" true and the op's results, or "ok" false and an "error"
+    """
+    response = {"id": request.get("id"), "ok": True}
+    try:
+        op = request["op"]
+        if op == "list":
+            response["cohorts"] = {cohort_id: len(cohort.students) for cohort_id, cohort in cohorts.items()}
+            return response
+        cohort_id = request["cohort"]
+        if op == "load":
+            # Load students from a file or from the request itself
+            if "path" in request:
+                students = load_cohort(request["path"])
+            else:
+                students = {name: list(preferences) for name, preferences in request["students"].items()}
+            cohorts[cohort_id] = Cohort(students, request.get("projects"))
+            response["students"] = len(students)
+            return response
+        if op == "unload":
+            del cohorts[cohort_id]
+            return response
+        if cohort_id not in cohorts:
+            raise ValueError("unknown cohort " + repr(cohort_id) + "; load it first")
+        cohort = cohorts[cohort_id]
+        if op == "assign":
+            response["sum_preferences"] = cohort.assign(request.get("numpy", False), request.get("improve"))
+            # Sending every project is only needed by clients that don't fetch students one at a time
+            if request.get("projects", False):
+                response["projects"] = cohort.assignment.to_projects()
+            if request.get("outcomes", False):
+                response["outcome"] = cohort.outcome()
+        elif op == "random":
+            response["sum_preferences"] = cohort.random_baseline(request.get("seed"))
+        elif op == "update":
+            changed, sum_preferences = cohort.update(request["student"], request.get("preferences"),
+                                                     request.get("remove", False))
+            response["changed"] = changed
+            response["sum_preferences"] = sum_preferences
+        elif op == "fetch":
+            response.update(cohort.fetch(request.get("student")))
+        else:
+            raise ValueError("unknown op " + repr(op))
+    except KeyError as error:
+        response = {"id": request.get("id"), "ok": False, "error": "missing " + str(error)}
+    except (ValueError, TypeError, OSError) as error:
+        response = {"id": request.get("id"), "ok": False, "error": str(error)}
+    except Exception as error:
+        # Any other error only fails its own request, so the server keeps answering the others
+        response = {"id": request.get("id"), "ok": False, "error": type(error).__name__ + ": " + str(error)}
+    return response
+
+
+def answer_line(cohorts: dict, line: bytes) -> bytes:
+    """
+    Helper function to answer one JSON line with one JSON line
+
+    Parameters
+    ----------
+    cohorts: dict
+        Dictionary of cohort IDs mapped to their Cohort
+    line: bytes
+        Request encoded as JSON
+
+    Returns
+    -------
+    bytes
+        Response encoded as JSON, ending with a newline
+    """
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+    except ValueError as error:
+        response = {"id": None, "ok": False, "error": "invalid request: " + str(error)}
+    else:
+        response = handle_request(cohorts, request)
+    # Project labels and student names are written as strings if they aren't JSON types
+    return json.dumps(response, default=str).encode() + b"\n"
+
+
+async def serve_client(cohorts: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Function to answer the requests of one client connected to the Unix socket until it disconnects
+
+    Requests are answered one at a time on the event loop, so each request sees every earlier
+    request of every client fully applied.
+
+    Parameters
+    ----------
+    cohorts: dict
+        Dictionary of cohort IDs mapped to their Cohort, shared by every client
+    reader: asyncio.StreamReader
+        Stream the client's requests are read from
+    writer: asyncio.StreamWriter
+        Stream the responses are written to
+
+    Returns
+    -------
+    None
+    """
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                writer.write(answer_line(cohorts, line))
+                await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_socket(cohorts: dict, path: str) -> None:
+    """
+    Function to answer requests from any number of clients connected to a Unix socket
+
+    Parameters
+    ----------
+    cohorts: dict
+        Dictionary of cohort IDs mapped to their Cohort
+    path: str
+        Path of the Unix socket
+
+    Returns
+    -------
+    None
+    """
+    server = await asyncio.start_unix_server(lambda reader, writer: serve_client(cohorts, reader, writer),
+                                             path=path, limit=2 ** 26)
+    print("Listening on", path, file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def serve_stdio(cohorts: dict, input=sys.stdin.buffer, output=sys.stdout.buffer) -> None:
+    """
+    Function to answer requests read from standard input, one JSON object per line, on standard output
+
+    Parameters
+    ----------
+    cohorts: dict
+        Dictionary of cohort IDs mapped to their Cohort
+    input: file
+        Binary file the requests are read from
+    output: file
+        Binary file the responses are written to
+
+    Returns
+    -------
+    None
+    """
+    for line in input:
+        if line.strip():
+            output.write(answer_line(cohorts, line))
+            output.flush()
+
+
+if __name__ == "__main__":
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Keep cohorts in memory and answer JSON-lines requests about them")
+    parser.add_argument("--socket", help="Unix socket to listen on (default: standard input and output)")
+    parser.add_argument("--preload", nargs="+", default=[], metavar="ID=PATH",
+                        help="cohorts to load before answering requests")
+    args = parser.parse_args()
+    cohorts = {}
+    # Load cohorts given on the command line so the first requests don't wait for them
+    for preload in args.preload:
+        cohort_id, _, path = preload.partition("=")
+        cohorts[cohort_id] = Cohort(load_cohort(path))
+    if args.socket:
+        try:
+            asyncio.run(serve_socket(cohorts, args.socket))
+        except KeyboardInterrupt:
+            pass
+    else:
+        serve_stdio(cohorts)
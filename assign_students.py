@@ -1,52 +1,156 @@
 import sys
+import argparse
+import gzip
+import lzma
 import math
+import time
+import heapq
+import itertools
 import random
+from roster import Roster, PreferenceRanks
+from cascade_stats import CascadeStats
+from capacities import project_capacities, capacity_error, solve_targets, load_capacities
+from registry import Registry
+import export_assignments
 
-def load_students(path_to_file: str) -> dict:
+def parse_student(line: str, top_k: int = None, registry=None) -> tuple:
+    """
+    Helper function to parse a line containing a student's name followed by their preferences
+
+    Parameters
+    ----------
+    line: str
+        Line from a file of students such as the sample data files
+    top_k: int
+        If provided, only the student's first top_k preferences are parsed
+    registry: Registry
+        If provided, the student's name and preferences are given as their IDs in registry.Registry
+
+    Returns
+    -------
+    tuple
+        First entry is the student's name
+        Second entry is the list of the student's preferences as project numbers
+
+    Raises
+    ------
+    ValueError
+        If the line does not contain a quoted name followed by at least one project number
+    """
+    # Find beginning ot student's name based on first '
+    name_start = line.find("'") + 1
+    # Find end of student's name based on second '
+    name_end = line.find("'", name_start)
+    if name_start == 0 or name_end == -1:
+        raise ValueError("student's name is not enclosed in single quotes")
+    # Extract student's name from the line
+    name = line[name_start:name_end]
+    # Split off only the preferences that are kept, leaving the rest of the line unsplit
+    if top_k is None:
+        fields = line[name_end + 1:].split()
+    else:
+        fields = line[name_end + 1:].split(None, top_k)[:top_k]
+    if len(fields) == 0:
+        raise ValueError("student " + repr(name) + " has no preferences")
+    if registry is not None:
+        # Look project numbers up by their text, only converting the ones read for the first time
+        preferences = registry.intern_fields(fields)
+        return (registry.student_id(name), preferences)
+    # Convert preferences straight to project numbers
+    preferences = [int(field) for field in fields]
+    return (name, preferences)
+
+
+def open_students_file(path_to_file: str):
+    """
+    Helper function to open a file of students for reading as text
+
+    Files ending in .gz or .xz are decompressed while they are read,
+    and a path of - reads from standard input.
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the file containing the students and their preferences
+
+    Returns
+    -------
+    file
+        File object to read lines from
+    """
+    # Read from standard input without closing it when done
+    if path_to_file == "-":
+        return open(sys.stdin.fileno(), closefd=False)
+    # Decompress compressed files while they are read
+    if path_to_file.endswith(".gz"):
+        return gzip.open(path_to_file, 'rt')
+    if path_to_file.endswith(".xz"):
+        return lzma.open(path_to_file, 'rt')
+    return open(path_to_file)
+
+
+def load_students(path_to_file: str, top_k: int = None, registry=None) -> dict:
     """
     Helper function to load in students from file
 
     Each line in the file should contain a student's name followed 
     by their list of preferences as in the sample data files.
-    This function reads in the students and their preferences and 
-    creates a dictionary mapping the student to their preferences.
+    This function reads in the students and their preferences one line 
+    at a time and creates a dictionary mapping the student to their preferences.
+    Lines that can't be parsed are reported and skipped.
+    Binary students files created by binary_students.py are also accepted, in
+    which case the preferences are memory-mapped instead of read in.
 
     Parameters
     ----------
     path_to_file: str
-        Path to the file containing the students and their preferences
+        Path to the file containing the students and their preferences.
+        Files ending in .gz or .xz are decompressed and - reads from standard input
+    top_k: int
+        If provided, only each student's first top_k preferences are kept, so memory
+        grows with the number of students times top_k instead of the number of projects
+    registry: Registry
+        If provided, students and projects are given integer IDs in registry.Registry as they
+        are read, and students are keyed by their ID with preferences listing project IDs
 
     Returns
     -------
     dict 
         Students mapped to their preferences
     """
+    # Open binary students files without parsing them. Imported here so numpy is only needed when used
+    if path_to_file.endswith(".bin"):
+        import binary_students
+        if binary_students.is_binary_students(path_to_file):
+            students = binary_students.load_binary_students(path_to_file)
+            return students if registry is None else registry.intern_students(students)
+    # Create dictionary to store mapping of students to their preferences
+    students = {}
     try:
         # Open the file
-        with open(path_to_file) as file:
-            # Read all the lines in 
-            lines = file.readlines()
-    except:
+        with open_students_file(path_to_file) as file:
+            # Process each line in the file as it is read
+            for line_number, line in enumerate(file, start=1):
+                # Skip blank lines
+                if not line.strip():
+                    continue
+                try:
+                    # Call helper function to extract the student's name and preferences from the line
+                    name, preferences = parse_student(line, top_k, registry)
+                except ValueError as error:
+                    # Report the line that couldn't be parsed and move on to the next one
+                    print(path_to_file + ":" + str(line_number) + ": skipping malformed line:", error, file=sys.stderr)
+                    continue
+                # Store mapping of student to their preferences
+                students[name] = preferences
+    except OSError:
         # Print an error message if there is an issue opening the file
         print("Please enter a valid path to a file containing the students", file=sys.stderr)
-    # Create dictionary to store mapping of students to their preferences
-    students = {}
-    # Process each line in the file
-    for line in lines:
-        # Find beginning ot student's name based on first '
-        name_start = line.find("'") + 1
-        # Find end of student's name based on second '
-        name_end = line.find("'", name_start)
-        # Extract student's name from the line
-        name = line[name_start:name_end]
-        # Extract students preferences from the line as an array
-        preferences = line[name_end + 2:].strip().split(" ")
-        # Store mapping of student to their preferences
-        students[name] = preferences
+        raise
     return students
 
 
-def initalize_projects(students: dict) -> dict:
+def initalize_projects(students: dict, project_list: list = None) -> dict:
     """
     Helper function to initialize dictionary of projects based on students preferences
 
@@ -54,20 +158,107 @@ def initalize_projects(students: dict) -> dict:
     ----------
     students: dict
         Dictionary of students mapped to their preferences
+    project_list: list
+        If provided, the projects students are assigned to, and other projects are dropped from
+        students' preferences. Otherwise the first student's preferences
+        are used if they list every project needed, or every project any student listed, in the
+        order projects first appear in students' preferences
 
     Returns
     -------
     dict 
         Projects dictionary where each project is mapped to empty list which will be filled with students assigned to the project
+
+    Raises
+    ------
+    ValueError
+        If project_list leaves students without any preferences
     """
+    # Projects listed explicitly may leave out projects students listed
+    explicit = project_list is not None
+    if project_list is None:
+        if hasattr(students, "project_labels"):
+            # Students loaded from a binary students file already hold every project
+            project_list = students.project_labels
+        else:
+            project_list = students[next(iter(students))]
+            # Unless the first student listed every project needed, collect every project listed by any student
+            if len(project_list) < math.ceil(len(students) / 4):
+                project_list = dict.fromkeys(itertools.chain.from_iterable(students.values()))
     # Declare dictionary to store project mapped to students assigned to it
     projects = {}
     # Initialize each project in projects to an empty list
-    for project in students[list(students.keys())[0]]:
+    for project in project_list:
         projects[project] = []
+    if explicit:
+        # Call helper function to drop the projects that aren't being assigned from students' preferences
+        drop_unlisted_projects(students, projects)
     return projects
 
 
+def drop_unlisted_projects(students: dict, projects: dict) -> None:
+    """
+    Helper function to drop projects that aren't being assigned from students' preferences, so each
+    student's first remaining preference is their first choice
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences, changed in place
+    projects: dict
+        Dictionary of the projects being assigned
+
+    Raises
+    ------
+    ValueError
+        If students are left without any preferences, or students read from a binary students file,
+        which can't be changed, list projects that aren't being assigned
+    """
+    if hasattr(students, "project_labels"):
+        # Binary students files hold every student's preferences for the same projects
+        missing = [project for project in students.project_labels if project not in projects]
+        if missing:
+            raise ValueError("students read from a binary students file list projects that aren't being "
+                             "assigned (" + ", ".join(map(str, missing)) + "); load them with a registry instead")
+        return
+    # Most cohorts only list projects being assigned, which one set of every listed project checks at once
+    if set(itertools.chain.from_iterable(students.values())).issubset(projects):
+        return
+    unranked = 0
+    for student, preferences in students.items():
+        # Keep the preferences of students who only list projects being assigned as they are
+        if not all(map(projects.__contains__, preferences)):
+            preferences = [project for project in preferences if project in projects]
+            students[student] = preferences
+            unranked += not preferences
+    if unranked:
+        raise ValueError(str(unranked) + " students don't list any of the projects being assigned")
+
+
+def record_phase(timings: dict, phase: str, start: int) -> int:
+    """
+    Helper function to record how long a phase of an algorithm took
+
+    Parameters
+    ----------
+    timings: dict
+        Dictionary of phases mapped to the nanoseconds spent in them, or None to not record anything
+    phase: str
+        Name of the phase
+    start: int
+        Time the phase started at from time.perf_counter_ns
+
+    Returns
+    -------
+    int
+        Time the phase ended at, which is when the next phase starts
+    """
+    end = time.perf_counter_ns()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0) + end - start
+    return end
+
+
 def initial_assignment(students: dict, projects: dict) -> dict:
     """
     Helper function to assign students to their first preference
@@ -91,57 +282,188 @@ def initial_assignment(students: dict, projects: dict) -> dict:
     return projects
 
 
-def assign_students_projects(students: dict, projects: dict, sorted_projects: list, start: int, 
-                                end: int, students_project: int, sum_preferences: int) -> tuple:
+def least_loaded_project(preferences: list, roster: Roster, limits) -> tuple:
+    """
+    Helper function to find a project for a student who has no preferences left to try
+
+    Parameters
+    ----------
+    preferences: list
+        The student's preferences
+    roster: Roster
+        Students assigned to each project
+    limits: int or dict
+        Number of students allowed per project, or projects mapped to their number of students allowed
+
+    Returns
+    -------
+    tuple
+        First entry is the project with the fewest students that has an opening
+        Second entry is the student's preference for it, where 0 is their first preference,
+        or the number of preferences they listed if they didn't list it
+
+    Raises
+    ------
+    ValueError
+        If no project has an opening
+    """
+    project = roster.least_loaded(limits)
+    if project is None:
+        raise ValueError("no project has an opening")
+    # Rank a project the student didn't list after all of their preferences
+    try:
+        return (project, preferences.index(project))
+    except ValueError:
+        return (project, len(preferences))
+
+
+def sort_projects_by_size(roster: Roster) -> list:
+    """
+    Helper function to sort projects by the number of students assigned to them in descending order
+
+    Projects are placed in a bucket for each number of students, so sorting takes time proportional
+    to the number of projects. Projects with the same number of students stay in the order of the
+    roster, like sorting them with sorted would.
+
+    Parameters
+    ----------
+    roster: Roster
+        Students assigned to each project
+
+    Returns
+    -------
+    list
+        List of projects descendingly sorted by the number of students assigned to them
+    """
+    # Group projects by their number of students
+    buckets = {}
+    for project in roster:
+        size = roster.size(project)
+        bucket = buckets.get(size)
+        if bucket is None:
+            buckets[size] = [project]
+        else:
+            bucket.append(project)
+    # Join the groups from the most students to the fewest
+    return [project for size in sorted(buckets, reverse=True) for project in buckets[size]]
+
+
+def assign_students_projects(students: dict, roster: Roster, sorted_projects: list, targets: dict,
+                             sum_preferences: int, stats: CascadeStats = None) -> tuple:
     """
     Helper function to assign students to projects 
 
+    Students in a project with more students than its target try their next preference one at a time,
+    from their second preference on, in the order they were assigned to the project, until the project
+    is down to its target. Projects only fill up while students are moved, so a preference that is full
+    stays full. Each student is therefore kept in a queue by the next of their preferences that may
+    have an opening, found by skipping the full ones, instead of every student trying every preference
+    in turn. Full preferences are only skipped up to twice the deepest preference tried so far, so
+    students aren't checked much deeper than the project needs. Students only move to projects
+    below their target and the targets add up to the number of students, so every project ends at
+    its target after one pass over the projects.
+
     Parameters
     ----------
     students: dict
         Dictionary of students mapped to their preferences
-    projects: dict
-        Dictionary of projects mapped to the students assigned to the project
+    roster: Roster
+        Students assigned to each project
     sorted_projects: list
         List of projects descendingly sorted by the number of students assigned to them
-    start: int
-        First project to check if has too many students assigned to it
-    end: int
-        Last project to check if has too many students assigned to it
-    students_project: int
-        Number of students allowed per project
+    targets: dict
+        Projects mapped to the number of students they should be assigned, from capacities.solve_targets
     sum_preferences: int
         Sum of students preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    stats: CascadeStats
+        If provided, students moved, failed probes, the deepest preference and preferences tried in each
+        project are counted in it
 
     Returns
     -------
     tuple 
-        First entry is projects dictionary where each project between start and end has been assigned at most students_project students
+        First entry is roster where each project has been assigned its target number of students
         Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd) 
     """
-    # For each project in the range provided
-    for i in range(start, end):
-        # Students second preference
-        num_preference = 1
+    # Number of students each project can still take, which is negative for projects with too many students.
+    # It is checked for every preference tried, so it is kept here instead of comparing sizes to targets
+    openings = {project: targets[project] - roster.size(project) for project in sorted_projects}
+    # For each project, from the most students to the fewest
+    for project in sorted_projects:
+        # Skip projects that don't have too many students
+        if openings[project] >= 0:
+            continue
+        # Every student over the target moves out once, so the project's moves are counted up front
+        if stats is not None:
+            stats.students_moved -= openings[project]
+        # Students in the order they were assigned to the project; students are queued by their position
+        order = roster.students(project)
+        # Queue of the positions of students trying each preference, every student trying their second preference first
+        queues = {1: list(range(len(order)))}
+        # Preferences with a queue, smallest first
+        depths = [1]
+        # Deepest preference full preferences are skipped up to
+        horizon = 1
         # While the current project has more students assigned to it than it should
-        while len(projects[sorted_projects[i]]) > students_project:
-            # Iterate through the students assigned to the project
-            for student in projects[sorted_projects[i]]:
-                # Get the students next preference
-                next_preference = students[student][num_preference]
-                # If the students next preference has an opening
-                if len(projects[next_preference]) < students_project:
-                    # Add current preference to sum preferences, reflecting student is getting a lower preference
-                    sum_preferences += num_preference 
-                    # Add student to their most prefered project that is available
-                    projects[next_preference].append(student)
-                    # Remove student from current project
-                    projects[sorted_projects[i]].remove(student)
-            num_preference += 1
-    return (projects, sum_preferences)
-
-
-def assign_students(students: dict, projects: dict) -> tuple:
+        while openings[project] < 0:
+            num_preference = heapq.heappop(depths)
+            # Students try a preference in the order they were assigned to the project
+            positions = queues.pop(num_preference)
+            positions.sort()
+            horizon = max(horizon, 2 * num_preference)
+            # Count each preference tried by the project's students and the deepest preference tried
+            if stats is not None:
+                stats.loop_iterations[project] = stats.loop_iterations.get(project, 0) + 1
+                stats.max_preference = max(stats.max_preference, num_preference)
+            for position in positions:
+                student = order[position]
+                preferences = students[student]
+                num_ranks = len(preferences)
+                if num_preference < num_ranks:
+                    next_preference = preferences[num_preference]
+                    # If the students next preference has an opening
+                    if openings[next_preference] > 0:
+                        # Add current preference to sum preferences, reflecting student is getting a lower preference
+                        sum_preferences += num_preference
+                        # Move student to their most prefered project that is available
+                        roster.move(student, project, next_preference)
+                        openings[next_preference] -= 1
+                        openings[project] += 1
+                        # Stop once the project has few enough students
+                        if openings[project] == 0:
+                            break
+                        continue
+                    # Skip the student's preferences that are full, since they stay full, and queue them again
+                    skip_to = num_preference + 1
+                    last = min(num_ranks, horizon + 1)
+                    while skip_to < last and openings[preferences[skip_to]] <= 0:
+                        skip_to += 1
+                    # The preference tried and every preference skipped were full
+                    if stats is not None:
+                        stats.failed_probes += skip_to - num_preference
+                    queue = queues.get(skip_to)
+                    if queue is None:
+                        queues[skip_to] = [position]
+                        heapq.heappush(depths, skip_to)
+                    else:
+                        queue.append(position)
+                else:
+                    # The student listed no more projects, so use the least loaded project with an opening
+                    next_preference, preference = least_loaded_project(preferences, roster, targets)
+                    sum_preferences += preference
+                    roster.move(student, project, next_preference)
+                    if stats is not None:
+                        stats.fallbacks += 1
+                    openings[next_preference] -= 1
+                    openings[project] += 1
+                    # Stop once the project has few enough students
+                    if openings[project] == 0:
+                        break
+    return (roster, sum_preferences)
+
+
+def assign_students(students: dict, projects: dict, use_numpy: bool = False, timings: dict = None,
+                    stats: CascadeStats = None, capacities=None, demand=None) -> tuple:
     """
     function to assign students to projects based on their preferences
 
@@ -151,45 +473,77 @@ def assign_students(students: dict, projects: dict) -> tuple:
         Dictionary of students mapped to their preferences
     projects: dict
         Dictionary of projects mapped to the students assigned to the project
+    use_numpy: bool
+        Whether to run the algorithm on integer preference matrices with numpy_engine,
+        which gives the same result and is faster for large numbers of students. Only
+        used if every student listed every project
+    timings: dict
+        If provided, the nanoseconds spent in the initial assignment, choosing each project's
+        number of students and moving students are added to it under initial_assignment,
+        solve_capacities and cascade
+    stats: CascadeStats
+        If provided, the work done moving students is counted in it and the phases are timed in stats.timings;
+        not filled in by numpy_engine
+    capacities: tuple or dict
+        Fewest and most students of every project as a (minimum, maximum) tuple, or projects mapped to
+        their own (minimum, maximum) as in capacities.project_capacities. Every project has 3 or 4 students
+        if not provided
+    demand: np.ndarray
+        If provided, the demand index of students and projects from demand_index.build_demand_index, whose
+        first choices order the projects and choose their targets before students are placed, instead of
+        sorting the projects by their number of students afterwards
 
     Returns
     -------
     tuple 
-        First entry is projects dictionary where each project has been assigned 3 or 4 students
+        First entry is projects dictionary where each project has been assigned between its fewest and most students
         Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd) 
     """
-    # If there are less than 6 students or not enough projects, return None
-    if len(students) < 6 or len(projects) != math.ceil(len(students) / 4):
+    # If the projects' capacities can't fit the students, return None
+    minimums, maximums = project_capacities(projects, capacities)
+    if capacity_error(len(students), minimums, maximums) is not None:
         return None
-    # Calculate number of projects that will be assigned 3 students
-    num_projects_of_three = (4 - len(students) % 4) % 4
+    # Use the preference matrix engine if requested and every student listed every project.
+    # Imported here so numpy is only needed when used
+    if use_numpy and all(len(preferences) == len(projects) for preferences in students.values()):
+        import numpy_engine
+        return numpy_engine.assign_students(students, projects, capacities)
+    # Time the phases in stats if no other timings are requested
+    if stats is not None and timings is None:
+        timings = stats.timings
+    start = time.perf_counter_ns()
+    if demand is not None:
+        # Imported here so numpy is only needed when used
+        import demand_index
+        # Every student starts in their first preference, so the first choices already tell which
+        # projects will have too many students and in what order they are emptied
+        sorted_projects, targets = demand_index.predict_overflow(demand, projects, minimums, maximums, len(students))
+        start = record_phase(timings, "solve_capacities", start)
     # Call helper function to assign student to their first preference
     projects = initial_assignment(students, projects)
     # Create sum of preferences variable to track performance of algorithm
     # A lower value means more students got their higher prefered projects 
     # Initially, each student gets first preference, so sum of preferences is the number of students
     sum_preferences = len(students)
-    # Sort projects by the number of students assigned to them in descending order
-    sorted_projects = sorted(projects, key=lambda k: len(projects[k]), reverse=True)
-    # Call helper function to assign students to projects, allowing at most 4 students per project in range
-    projects, sum_preferences = assign_students_projects(students, projects, sorted_projects, 0, 
-                                    len(projects) - num_projects_of_three - 1, 4, sum_preferences)
-    # Sort projects by the number of students assigned to them in descending order
-    sorted_projects = sorted(projects, key=lambda k: len(projects[k]), reverse=True)
-    # Create variable to track number of projects with 3 students assigned to them
-    current_num_projects_of_three = 0
-    # Calculate number of projects with 3 students assigned to them
-    for project in sorted_projects:
-        if len(projects[project]) == 3:
-            current_num_projects_of_three += 1
-    # If there aren't enough projects with 3 students, call function to assign students until each project has 3 or 4 students
-    if current_num_projects_of_three != num_projects_of_three:
-        projects, sum_preferences = assign_students_projects(students, projects, sorted_projects, 
-                                        len(projects) - num_projects_of_three, len(projects), 3, sum_preferences)
+    # Track students assigned to each project in a roster so students can be moved in constant time
+    roster = Roster(projects)
+    start = record_phase(timings, "initial_assignment", start)
+    if demand is None:
+        # Sort projects by the number of students assigned to them in descending order
+        sorted_projects = sort_projects_by_size(roster)
+        # Choose how many students each project ends up with, giving the popular projects their most students
+        targets = solve_targets(sorted_projects, minimums, maximums, len(students))
+        start = record_phase(timings, "solve_capacities", start)
+    # Call helper function to move students out of projects until each project has its target number of students
+    roster, sum_preferences = assign_students_projects(students, roster, sorted_projects, targets, sum_preferences,
+                                                       stats)
+    # Write students assigned to each project back to projects
+    projects = roster.to_projects(projects)
+    record_phase(timings, "cascade", start)
     return (projects, sum_preferences)
 
 
-def random_initial_assignment(students: dict, projects: dict) -> tuple:
+def random_initial_assignment(students: dict, projects: dict, ranks: PreferenceRanks = None, rng=random) -> tuple:
     """
     Helper function to assign students to a random project
 
@@ -199,6 +553,10 @@ def random_initial_assignment(students: dict, projects: dict) -> tuple:
         Dictionary of students mapped to their preferences
     projects: dict
         Dictionary of projects mapped to the students assigned to the project
+    ranks: PreferenceRanks
+        If provided, each student's preference for their random project is recorded in it
+    rng: random.Random
+        Generator drawing the random projects; the random module's generator if not provided
 
     Returns
     -------
@@ -212,7 +570,7 @@ def random_initial_assignment(students: dict, projects: dict) -> tuple:
     # Assign each student to a random project
     for student in students:
         # Selected a random project from students preferences
-        random_preference = random.randint(0, len(students[student]) - 1)
+        random_preference = rng.randint(0, len(students[student]) - 1)
         # Get random project based on random_preference
         random_project = students[student][random_preference]
         # Add random_preference + 1 to sum_preferences since a
@@ -220,11 +578,14 @@ def random_initial_assignment(students: dict, projects: dict) -> tuple:
         sum_preferences += random_preference + 1
         # Assign student to random project
         projects[random_project].append(student)
+        # Record student's preference for random project
+        if ranks is not None:
+            ranks.record(student, random_project, random_preference)
     return (projects, sum_preferences)
 
 
-def randomly_assign_students_projects(students: dict, projects: dict, sorted_projects: list, start: int, 
-                                end: int, students_project: int, sum_preferences: int) -> tuple:
+def randomly_assign_students_projects(students: dict, roster: Roster, ranks: PreferenceRanks, sorted_projects: list,
+                                      targets: dict, sum_preferences: int, rng=random) -> tuple:
     """
     Helper function to randomly assign students to projects 
 
@@ -232,50 +593,66 @@ def randomly_assign_students_projects(students: dict, projects: dict, sorted_pro
     ----------
     students: dict
         Dictionary of students mapped to their preferences
-    projects: dict
-        Dictionary of projects mapped to the students assigned to the project
+    roster: Roster
+        Students assigned to each project
+    ranks: PreferenceRanks
+        Lookup of the position of each project in each student's preferences
     sorted_projects: list
         List of projects descendingly sorted by the number of students assigned to them
-    start: int
-        First project to check if has too many students assigned to it
-    end: int
-        Last project to check if has too many students assigned to it
-    students_project: int
-        Number of students allowed per project
+    targets: dict
+        Projects mapped to the number of students they should be assigned, from capacities.solve_targets
     sum_preferences: int
         Sum of students preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    rng: random.Random
+        Generator drawing the random projects; the random module's generator if not provided
 
     Returns
     -------
     tuple 
-        First entry is projects dictionary where each project between start and end has been assigned at most students_project students
+        First entry is roster where each project has been assigned its target number of students
         Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd) 
     """
-    # For each project in the range provided
-    for i in range(start, end):
+    # For each project, from the most students to the fewest
+    for project in sorted_projects:
         # While the current project has more students assigned to it than it should
-        while len(projects[sorted_projects[i]]) > students_project:
+        while roster.size(project) > targets[project]:
+            moved = False
             # Iterate through the students assigned to the project
-            for student in projects[sorted_projects[i]]:
+            for student in roster.students(project):
                 # Get a random preference from the student's list of preferences
-                random_preference = random.randint(0, len(students[student]) - 1)
+                random_preference = rng.randint(0, len(students[student]) - 1)
                 # Get random project based on random_preference
                 random_project = students[student][random_preference]
                 # If the students random preference has an opening
-                if len(projects[random_project]) < students_project:
-                    # Get student's preference for current project
-                    current_preference = students[student].index(sorted_projects[i]) + 1
+                if roster.size(random_project) < targets[random_project]:
+                    # Look up student's preference for current project
+                    current_preference = ranks.rank(student, project) + 1
                     # Add difference between current and random preference to sum
                     # Student could be more or less happy with new project since it's random
                     sum_preferences += random_preference + 1 - current_preference 
-                    # Add student to random project that has openning
-                    projects[random_project].append(student)
-                    # Remove student from current project
-                    projects[sorted_projects[i]].remove(student)
-    return (projects, sum_preferences)
-
-
-def randomly_assign_students(students: dict, projects: dict) -> tuple:
+                    # Move student to random project that has openning
+                    roster.move(student, project, random_project)
+                    # Record student's preference for random project
+                    ranks.record(student, random_project, random_preference)
+                    moved = True
+                    # Stop once the project has few enough students
+                    if roster.size(project) <= targets[project]:
+                        break
+            # If nobody could move, the projects students listed may all be full, so move
+            # a student who didn't list every project to the least loaded project with an opening
+            if not moved:
+                student = next((student for student in roster.students(project)
+                                if len(students[student]) < len(roster)), None)
+                if student is not None:
+                    random_project, random_preference = least_loaded_project(students[student], roster, targets)
+                    sum_preferences += random_preference - ranks.rank(student, project)
+                    roster.move(student, project, random_project)
+                    ranks.record(student, random_project, random_preference)
+    return (roster, sum_preferences)
+
+
+def randomly_assign_students(students: dict, projects: dict, timings: dict = None, capacities=None,
+                             seed: int = None) -> tuple:
     """
     Function to randomly assign students to projects
 
@@ -285,46 +662,60 @@ def randomly_assign_students(students: dict, projects: dict) -> tuple:
         Dictionary of students mapped to their preferences
     projects: dict
         Dictionary of projects mapped to the students assigned to the project
+    timings: dict
+        If provided, the nanoseconds spent in the initial assignment, choosing each project's
+        number of students and moving students are added to it under initial_assignment,
+        solve_capacities and cascade
+    capacities: tuple or dict
+        Fewest and most students of every project as a (minimum, maximum) tuple, or projects mapped to
+        their own (minimum, maximum) as in capacities.project_capacities. Every project has 3 or 4 students
+        if not provided
+    seed: int
+        Seed of the generator drawing the random projects; the random module's generator draws them
+        if not provided, so random.seed also seeds it
 
     Returns
     -------
     tuple 
-        First entry is projects dictionary where each project has been assigned 3 or 4 students
+        First entry is projects dictionary where each project has been assigned between its fewest and most students
         Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd) 
     """
-    # If there are less than 6 students or not enough projects, return None
-    if len(students) < 6 or len(projects) != math.ceil(len(students) / 4):
+    # If the projects' capacities can't fit the students, return None
+    minimums, maximums = project_capacities(projects, capacities)
+    if capacity_error(len(students), minimums, maximums) is not None:
         return None
-    # Calculate number of projects that will be assigned 3 students
-    num_projects_of_three = (4 - len(students) % 4) % 4
+    start = time.perf_counter_ns()
+    # A seeded generator of its own leaves the random module's generator as it is
+    rng = random if seed is None else random.Random(seed)
+    # Look up students' preferences for projects without searching their preferences
+    ranks = PreferenceRanks(students)
     # Call helper function to assign student to random project
-    projects, sum_preferences = random_initial_assignment(students, projects) 
-    # Sort projects by the number of students assigned to them in descending order
-    sorted_projects = sorted(projects, key=lambda k: len(projects[k]), reverse=True)
-    # Call helper function to randomly assign students to projects, allowing at most 4 students per projects in range
-    projects, sum_preferences = randomly_assign_students_projects(students, projects, sorted_projects, 0, 
-                                    len(projects) - num_projects_of_three - 1, 4, sum_preferences)
+    projects, sum_preferences = random_initial_assignment(students, projects, ranks, rng)
+    # Track students assigned to each project in a roster so students can be moved in constant time
+    roster = Roster(projects)
+    start = record_phase(timings, "initial_assignment", start)
     # Sort projects by the number of students assigned to them in descending order
-    sorted_projects = sorted(projects, key=lambda k: len(projects[k]), reverse=True)
-    # Create variable to track number of projects with 3 students assigned to them
-    current_num_projects_of_three = 0
-    # Calculate number of projects with 3 students assigned to them
-    for project in projects:
-        if len(projects[project]) == 3:
-            current_num_projects_of_three += 1
-    # If there aren't enough projects with 3 students, call function to randomly assign students until each project has 3 or 4 students
-    if current_num_projects_of_three != num_projects_of_three:
-        projects, sum_preferences = randomly_assign_students_projects(students, projects, sorted_projects, 
-                                        len(projects) - num_projects_of_three, len(projects), 3, sum_preferences)
+    sorted_projects = sort_projects_by_size(roster)
+    # Choose how many students each project ends up with, giving the popular projects their most students
+    targets = solve_targets(sorted_projects, minimums, maximums, len(students))
+    start = record_phase(timings, "solve_capacities", start)
+    # Call helper function to randomly move students out of projects until each project has its target number of students
+    roster, sum_preferences = randomly_assign_students_projects(students, roster, ranks, sorted_projects, targets,
+                                                                sum_preferences, rng)
+    # Write students assigned to each project back to projects
+    projects = roster.to_projects(projects)
+    record_phase(timings, "cascade", start)
     return (projects, sum_preferences)
 
 
-def write_project_assignments(projects: dict, filename: str) -> None:
+def write_project_assignments(projects: dict, filename: str, registry=None) -> None:
     """
     Write projects with students assigned to them to the filename provided
 
     Each project and the students assigned to them are written to the 
-    filename provided on their own line. 
+    filename provided on their own line. The whole file is written at once
+    and moved into place, so readers never see half of it.
+    export_assignments.py writes other formats, including each student's project.
 
     Parameters
     ----------
@@ -332,47 +723,209 @@ def write_project_assignments(projects: dict, filename: str) -> None:
         Dictionary containing projects mapped to the students assigned to them
     filename: str
         Name of the file that will contain the projects and assigned students
+    registry: Registry
+        If provided, the registry.Registry projects and students are given by ID in, so they are
+        written with their labels and names
 
     Returns
     -------
     None
     """
-    # Get list of projects
-    project_list = list(projects)
-    # Open file in write mode
-    with open(filename, 'w') as output:
-        # Write all projects other than the last one to the file on a new line
-        for index in range(len(project_list) - 1):
-            print(project_list[index], ",".join(projects[project_list[index]]), file=output)
-        # Write last project to file without end character to prevent blank last line
-        print(project_list[-1], ",".join(projects[project_list[-1]]), file=output, end='')
+    if registry is not None:
+        projects = registry.export_projects(projects)
+    # Write every project on its own line without a blank last line
+    with export_assignments.atomic_output(filename) as output:
+        export_assignments.write_text(projects, output)
             
 
 if __name__ == "__main__":
-    try:
-        # Read in first command line argument which is path to file
-        path_to_file = sys.argv[1]
-    except:
-        # Print error message if no command line argument supplied
-        print("Please provide file name containing students", file=sys.stderr)
+    # Read in command line arguments; the first is the path to the file
+    parser = argparse.ArgumentParser(description="Assign students to projects based on their preferences")
+    parser.add_argument("path_to_file", help="file name containing students")
+    parser.add_argument("--projects", type=int, nargs="+",
+                        help="project numbers to assign students to (default: every project students listed)")
+    parser.add_argument("--numpy", action="store_true", help="use the preference matrix engine")
+    parser.add_argument("--stats", action="store_true",
+                        help="print how many students the algorithm moved and how deep it searched preferences")
+    parser.add_argument("--optimal", action="store_true",
+                        help="also find the lowest possible sum of preferences with the optimal algorithm")
+    parser.add_argument("--trials", type=int,
+                        help="also randomly assign students this many times in parallel and print the distribution")
+    parser.add_argument("--top-k", type=int, default=5,
+                        help="how many of each student's preferences the optimal algorithm starts with")
+    parser.add_argument("--output", nargs="+", metavar="FILE",
+                        help="files to write the project assignments to, in the format given by each one's extension "
+                        "(txt, csv, jsonl or npz; default: numberOfProjectsproject_assignments.txt)")
+    parser.add_argument("--cache", nargs="?", const=".assignment_cache", metavar="DIR",
+                        help="reuse parsed students and results of earlier runs kept in DIR (default: .assignment_cache)")
+    parser.add_argument("--verify", action="store_true",
+                        help="check whether any students would rather swap projects or move to a project with room")
+    parser.add_argument("--capacities", metavar="FILE",
+                        help="file of lines \"project minimum maximum\" giving projects other sizes than 3 or 4 students")
+    parser.add_argument("--shards", type=int, metavar="N",
+                        help="split projects into N shards whose students are moved in parallel worker processes")
+    parser.add_argument("--workers", type=int, help="number of worker processes for --shards (default: one per CPU)")
+    parser.add_argument("--improve", type=float, metavar="SECONDS",
+                        help="spend up to SECONDS swapping and moving students to lower the sum of preferences")
+    parser.add_argument("--deferred-acceptance", action="store_true",
+                        help="also assign students with student-proposing deferred acceptance (Gale-Shapley)")
+    parser.add_argument("--priority", choices=("rank", "lottery"), default="rank",
+                        help="how projects order students in deferred acceptance: students who rank them higher "
+                        "first, or a lottery (default: rank)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the deferred acceptance lottery")
+    parser.add_argument("--outcomes", action="store_true",
+                        help="measure every algorithm's project assignments the same way: the share of students "
+                        "getting their top choices, the worst preference and the over and under demanded projects")
+    parser.add_argument("--demand", type=int, nargs="?", const=10, metavar="N",
+                        help="print how many students rank the N most demanded projects first (default: 10) "
+                        "and order projects by it before assigning")
+    args = parser.parse_args()
+    if args.capacities and args.optimal:
+        parser.error("--optimal only assigns projects 3 or 4 students, so it can't be used with --capacities")
+    if args.trials is not None and args.trials < 1:
+        parser.error("--trials must be at least 1")
+    if args.shards and (args.numpy or args.stats):
+        parser.error("--shards can't be used with --numpy or --stats")
+    path_to_file = args.path_to_file
+    cache = None
+    registry = None
+    if args.cache:
+        # Imported here so the cache is only loaded when used
+        import result_cache
+        cache = result_cache.ResultCache(args.cache)
+    else:
+        # Give students and projects integer IDs as they are read, so the algorithms work on integers.
+        # Cached students keep their names, since their results are keyed by a hash of their preferences
+        registry = Registry()
     # Call helper function to create dictionary of students mapped to their preferences
-    students = load_students(path_to_file)
-    # Call helper function to initialize projects dictionary
-    projects = initalize_projects(students)
+    students = cache.load_students(path_to_file) if cache is not None else load_students(path_to_file,
+                                                                                          registry=registry)
+    project_list = args.projects if registry is None else registry.project_list(args.projects)
+    try:
+        # Call helper function to initialize projects dictionary
+        projects = initalize_projects(students, project_list)
+    except ValueError as error:
+        print("Can't assign students to projects:", error, file=sys.stderr)
+        sys.exit(1)
+    # Call helper function to read how many students each project can have
+    capacities = load_capacities(args.capacities) if args.capacities else None
+    if registry is not None:
+        capacities = registry.capacities(capacities)
+    if args.outcomes:
+        # Imported here so numpy is only needed when used
+        import outcome_analytics
+    demand = None
+    if args.demand is not None:
+        # Imported here so numpy is only needed when used
+        import demand_index
+        # Count the students ranking each project at each preference before anyone is placed
+        demand = demand_index.build_demand_index(students, projects)
+        demand_index.print_demand_report(demand_index.demand_report(demand, projects, capacities, args.demand,
+                                                                    registry))
     # Call function to assign students to projects based on their preferences
-    projects, sum_preferences = assign_students(students, projects)
+    stats = CascadeStats() if args.stats else None
+    if args.shards:
+        # Imported here so worker processes are only started when used
+        import sharded_assignment
+        result = sharded_assignment.sharded_assign_students(students, projects, args.shards, args.workers,
+                                                            capacities=capacities)
+    elif cache is not None and stats is None:
+        params = {"use_numpy": args.numpy, "capacities": capacities}
+        # Projects ordered by the demand index are a different run, so the ordering is part of the key
+        if demand is not None:
+            params["demand"] = True
+        result = cache.assign(students, "assign_students", args.projects, **params)
+    else:
+        result = assign_students(students, projects, use_numpy=args.numpy, stats=stats, capacities=capacities,
+                                 demand=demand)
+    if result is None:
+        print("Can't assign students to projects:",
+              capacity_error(len(students), *project_capacities(projects, capacities)) + "; please give every "
+              "project with --projects or change their sizes with --capacities", file=sys.stderr)
+        sys.exit(1)
+    projects, sum_preferences = result
+    algorithm_sum_preferences = sum_preferences
+    # Name of the algorithm or step that made the latest project assignments
+    stage = "Proposed Algorithm"
     # Display results
     print("How Many Students:", len(students), "Proposed Algorithm Sum of preferences:", sum_preferences)
-     # Save results of student assignment to a file
-    write_project_assignments(projects, str(len(projects)) + "project_assignments.txt")
+    if stats is not None:
+        print("Proposed Algorithm", stats.summary())
+    if args.outcomes:
+        print("Proposed Algorithm", outcome_analytics.summary_line(outcome_analytics.outcome_report(students, projects)))
+    if args.improve is not None:
+        # Imported here so the local search is only loaded when used
+        import local_search
+        search_stats = {}
+        projects, sum_preferences = local_search.improve_assignment(students, projects, sum_preferences, args.improve,
+                                                                    capacities=capacities, stats=search_stats)
+        print("How Many Students:", len(students), "Improved Sum of preferences:", sum_preferences,
+              "Swaps:", search_stats["swaps"], "Moves:", search_stats["moves"],
+              "Converged:", search_stats["converged"])
+        if args.outcomes:
+            print("Improved", outcome_analytics.summary_line(outcome_analytics.outcome_report(students, projects)))
+        stage = "Improved"
+    if args.verify:
+        # Imported here so numpy is only needed when used
+        import stability
+        print(stage + " ", end="")
+        stability.print_stability_report(stability.find_blocking_pairs(students, projects, capacities,
+                                                                       registry=registry))
+     # Save results of student assignment to a file, translating IDs back to names and labels
+    outputs = args.output or [str(len(projects)) + "project_assignments.txt"]
+    for filename in outputs:
+        export_assignments.export_assignments(students, projects, filename, registry=registry)
+    # Find the lowest possible sum of preferences to compare the proposed algorithm to
+    if args.optimal:
+        # Imported here so scipy is only needed when the optimal algorithm is used
+        import optimal_assignment
+        if cache is not None:
+            result = cache.assign(students, "optimally_assign_students", args.projects, top_k=args.top_k)
+        else:
+            projects = initalize_projects(students, project_list)
+            result = optimal_assignment.optimally_assign_students(students, projects, args.top_k)
+        if result is None:
+            print("Can't find the optimal assignment: it needs a project for every 4 students and every student "
+                  "to rank every project", file=sys.stderr)
+        else:
+            projects, sum_preferences = result
+            print("How Many Students:", len(students), "Optimal Algorithm Sum of preferences:", sum_preferences)
+        if args.outcomes and result is not None:
+            print("Optimal Algorithm", outcome_analytics.summary_line(outcome_analytics.outcome_report(students,
+                                                                                                       projects)))
+    # Find the stable assignment of deferred acceptance to compare the proposed algorithm to
+    if args.deferred_acceptance:
+        # Imported here so deferred acceptance is only loaded when used
+        import deferred_acceptance
+        if cache is not None:
+            result = cache.assign(students, "deferred_acceptance_assign_students", args.projects,
+                                  priority=args.priority, seed=args.seed, capacities=capacities)
+        else:
+            result = deferred_acceptance.deferred_acceptance_assign_students(
+                students, initalize_projects(students, project_list), args.priority, args.seed,
+                capacities=capacities)
+        print("How Many Students:", len(students), "Deferred Acceptance Sum of preferences:", result[1])
+        if args.outcomes:
+            print("Deferred Acceptance", outcome_analytics.summary_line(outcome_analytics.outcome_report(students,
+                                                                                                         result[0])))
     # Reload students and projects to randomly assign students to projects
     # Call helper function to create dictionary of students mapped to their preferences
-    students = load_students(path_to_file)
+    students = cache.load_students(path_to_file) if cache is not None else load_students(path_to_file,
+                                                                                          registry=registry)
     # Call helper function to initialize projects dictionary
-    projects = initalize_projects(students)
+    projects = initalize_projects(students, project_list)
     # Call function to randomly assigned students to projects
-    projects, sum_preferences = randomly_assign_students(students, projects)
+    projects, sum_preferences = randomly_assign_students(students, projects, capacities=capacities)
     # Display results
     print("How Many Students:", len(students), "Random Algorithm Sum of preferences:", sum_preferences)
+    if args.outcomes:
+        print("Random Algorithm", outcome_analytics.summary_line(outcome_analytics.outcome_report(students, projects)))
+    # Compare the proposed algorithm to the distribution of many random assignments
+    if args.trials:
+        # Imported here so numpy is only needed when used
+        import monte_carlo
+        sums = monte_carlo.run_monte_carlo(students, initalize_projects(students, project_list), args.trials,
+                                           capacities=capacities)
+        monte_carlo.print_trials_summary(monte_carlo.summarize_trials(sums, algorithm_sum_preferences))
     # Show path to results file
-    print("Project assignments written to", str(len(projects)) + "project_assignments.txt")
+    print("Project assignments written to", ", ".join(outputs))
@@ -0,0 +1,246 @@
+import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import assign_students
+from capacities import project_capacities, capacity_error
+from registry import Registry
+
+# Extensions of the files containing students that are picked up from a directory
+STUDENTS_EXTENSIONS = (".txt", ".gz", ".xz", ".bin")
+
+
+def find_cohort_files(sources: list) -> list:
+    """
+    Helper function to find the files containing students from directories, globs and manifests
+
+    Parameters
+    ----------
+    sources: list
+        Each source is a directory, whose files containing students are used, a manifest
+        starting with @, which is a file listing one path or glob per line relative to the
+        manifest, or a path or glob of files containing students
+
+    Returns
+    -------
+    list
+        Paths of the files containing students, in the order they were found without repeats
+    """
+    paths = []
+    for source in sources:
+        if source.startswith("@"):
+            # Read the paths listed in the manifest, skipping blank lines and comments
+            manifest = source[1:]
+            with open(manifest) as file:
+                listed = [line.strip() for line in file if line.strip() and not line.startswith("#")]
+            paths.extend(find_cohort_files([os.path.join(os.path.dirname(manifest), path) for path in listed]))
+        elif os.path.isdir(source):
+            # Use every file containing students in the directory
+            paths.extend(sorted(os.path.join(source, name) for name in os.listdir(source)
+                                if name.endswith(STUDENTS_EXTENSIONS)))
+        elif glob.has_magic(source):
+            paths.extend(sorted(glob.glob(source)))
+        else:
+            paths.append(source)
+    # Keep only the first time each file was found
+    return list(dict.fromkeys(paths))
+
+
+def output_filenames(paths: list, output_dir: str) -> list:
+    """
+    Helper function to name the project assignments file of each cohort
+
+    Each file is named after the cohort's file, i.e. data/125students.txt is written to
+    125students_project_assignments.txt. Cohorts with the same file name in different
+    directories get a number added so no cohort's results overwrite another's.
+
+    Parameters
+    ----------
+    paths: list
+        Paths of the files containing students
+    output_dir: str
+        Directory to write the project assignments files to
+
+    Returns
+    -------
+    list
+        Path of the project assignments file of each cohort
+    """
+    filenames = []
+    taken = set()
+    for path in paths:
+        # Strip the directory and every extension, i.e. 125students.txt.gz becomes 125students
+        stem = os.path.basename(path).split(".")[0]
+        filename = stem + "_project_assignments.txt"
+        copy = 1
+        while filename in taken:
+            copy += 1
+            filename = stem + "_" + str(copy) + "_project_assignments.txt"
+        taken.add(filename)
+        filenames.append(os.path.join(output_dir, filename))
+    return filenames
+
+
+def assign_cohort(path_to_file: str, filename: str, use_numpy: bool = False, verify: bool = False,
+                  outcomes: bool = False) -> dict:
+    """
+    Function to assign the students of one cohort to projects and write the project assignments
+
+    Runs in a worker process, so only the summary of the cohort is sent back instead of the projects.
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the file containing the students and their preferences
+    filename: str
+        Name of the file that will contain the project assignments
+    use_numpy: bool
+        Whether to run the algorithm with the preference matrix engine in numpy_engine
+    verify: bool
+        Whether to count the pairs of students who would rather swap projects with stability.find_blocking_pairs,
+        failing the cohort if there are any
+    outcomes: bool
+        Whether to measure the project assignments with outcome_analytics.outcome_report
+
+    Returns
+    -------
+    dict
+        Summary of the cohort: its file, number of students, number of projects, sum of preferences,
+        with outcomes the share of students who got their first preference and one of their first three
+        and the worst preference a student got, wall time in seconds, the file the project assignments
+        were written to and any error
+    """
+    summary = {"cohort": path_to_file, "students": 0, "projects": 0, "sum_preferences": None, "top_1": None,
+               "top_3": None, "worst": None, "seconds": 0.0, "output": filename, "blocking_pairs": None,
+               "error": None}
+    start = time.perf_counter()
+    try:
+        # Call helper function to create dictionary of students mapped to their preferences, keyed by integer IDs
+        registry = Registry()
+        students = assign_students.load_students(path_to_file, registry=registry)
+        # Call helper function to initialize projects dictionary
+        projects = assign_students.initalize_projects(students, registry.project_list(None))
+        summary["students"] = len(students)
+        summary["projects"] = len(projects)
+        # Call function to assign students to projects based on their preferences
+        result = assign_students.assign_students(students, projects, use_numpy=use_numpy)
+        if result is None:
+            raise ValueError(capacity_error(len(students), *project_capacities(projects)))
+        projects, summary["sum_preferences"] = result
+        if outcomes:
+            # Imported here so numpy is only needed when used
+            import outcome_analytics
+            # Measure the project assignments the same way as every other algorithm's
+            report = outcome_analytics.outcome_report(students, projects)
+            for measure in ("sum_preferences", "top_1", "top_3", "worst"):
+                summary[measure] = report[measure]
+        # Save results of student assignment to a file
+        assign_students.write_project_assignments(projects, filename, registry)
+        if verify:
+            # Imported here so numpy is only needed when used
+            import stability
+            summary["blocking_pairs"] = stability.find_blocking_pairs(students, projects)["blocking_pairs"]
+            if summary["blocking_pairs"]:
+                raise ValueError(str(summary["blocking_pairs"]) + " pairs of students would rather swap projects")
+    except Exception as error:
+        # Report the error in the summary so the other cohorts still finish
+        summary["error"] = type(error).__name__ + ": " + str(error)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def run_batch(paths: list, output_dir: str = ".", workers: int = None, use_numpy: bool = False,
+              verify: bool = False, outcomes: bool = False) -> list:
+    """
+    Function to assign the students of many cohorts to projects in parallel
+
+    Parameters
+    ----------
+    paths: list
+        Paths of the files containing students, one per cohort
+    output_dir: str
+        Directory to write each cohort's project assignments file to
+    workers: int
+        Number of worker processes; defaults to the number of CPUs
+    use_numpy: bool
+        Whether to run the algorithm with the preference matrix engine in numpy_engine
+    verify: bool
+        Whether to check each cohort's project assignments for pairs of students who would rather swap projects
+    outcomes: bool
+        Whether to measure each cohort's project assignments with outcome_analytics.outcome_report
+
+    Returns
+    -------
+    list
+        Summary of each cohort as returned by assign_cohort, in the order of paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    filenames = output_filenames(paths, output_dir)
+    # Run one cohort at a time in a single process, which avoids starting a pool
+    if workers == 1 or len(paths) <= 1:
+        return [assign_cohort(path, filename, use_numpy, verify, outcomes) for path, filename in zip(paths, filenames)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(assign_cohort, paths, filenames, [use_numpy] * len(paths), [verify] * len(paths),
+                                 [outcomes] * len(paths)))
+
+
+def print_summary(summaries: list, file=sys.stdout) -> None:
+    """
+    Helper function to print a table of the size, sum of preferences, top choices and wall time of each cohort
+
+    Parameters
+    ----------
+    summaries: list
+        Summary of each cohort as returned by assign_cohort
+    file: file
+        File to print the table to
+
+    Returns
+    -------
+    None
+    """
+    width = max([len("Cohort")] + [len(summary["cohort"]) for summary in summaries])
+    print(f"{'Cohort':<{width}}  {'Students':>8}  {'Projects':>8}  {'Sum of preferences':>18}  {'Top 1':>6}  "
+          f"{'Top 3':>6}  {'Worst':>5}  {'Seconds':>8}", file=file)
+    for summary in summaries:
+        if summary["error"] is None and summary["top_1"] is not None:
+            measures = (f"{summary['sum_preferences']:>18}  {summary['top_1']:>6.1%}  {summary['top_3']:>6.1%}  "
+                        f"{summary['worst']:>5}")
+        elif summary["error"] is None:
+            # Cohorts that weren't measured with outcome_analytics only have their sum of preferences
+            measures = f"{summary['sum_preferences']:>18}  {'-':>6}  {'-':>6}  {'-':>5}"
+        else:
+            measures = f"{'failed':>18}  {'':>6}  {'':>6}  {'':>5}"
+        print(f"{summary['cohort']:<{width}}  {summary['students']:>8}  {summary['projects']:>8}  "
+              f"{measures}  {summary['seconds']:>8.3f}", file=file)
+
+
+if __name__ == "__main__":
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Assign the students of many cohorts to projects in parallel")
+    parser.add_argument("sources", nargs="+",
+                        help="directories, globs or @manifest files listing the files containing students")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPUs)")
+    parser.add_argument("--output-dir", default=".", help="directory to write the project assignments files to")
+    parser.add_argument("--numpy", action="store_true", help="use the preference matrix engine")
+    parser.add_argument("--verify", action="store_true",
+                        help="fail cohorts with pairs of students who would rather swap projects")
+    parser.add_argument("--outcomes", action="store_true",
+                        help="measure top choices and the worst preference of each cohort (requires NumPy)")
+    args = parser.parse_args()
+    # Find the files containing students
+    paths = find_cohort_files(args.sources)
+    if not paths:
+        print("Please provide files containing students", file=sys.stderr)
+        sys.exit(1)
+    # Assign every cohort and display the results
+    summaries = run_batch(paths, args.output_dir, args.workers, args.numpy, args.verify, args.outcomes)
+    print_summary(summaries)
+    # Report the cohorts that failed
+    for summary in summaries:
+        if summary["error"] is not None:
+            print(summary["cohort"] + ":", summary["error"], file=sys.stderr)
+    if any(summary["error"] is not None for summary in summaries):
+        sys.exit(1)
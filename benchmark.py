@@ -0,0 +1,360 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import assign_students
+import data_generator
+import deferred_acceptance
+import outcome_analytics
+
+# Algorithms that can be benchmarked
+ENGINES = {
+    "assign_students": assign_students.assign_students,
+    "randomly_assign_students": assign_students.randomly_assign_students,
+    "deferred_acceptance": deferred_acceptance.deferred_acceptance_assign_students,
+}
+# Phases timed in each run, in the order they run
+PHASES = ("load", "initialize", "initial_assignment", "solve_capacities", "cascade", "write", "total")
+# A phase is flagged as a regression when its median is this much slower than the baseline's
+REGRESSION_THRESHOLD = 0.10
+# Phases faster than this in the baseline are too noisy to flag as regressions
+NOISE_FLOOR_NS = 100_000
+# Measures of outcome_analytics.outcome_report kept for each algorithm and cohort
+OUTCOME_MEASURES = ("sum_preferences", "top_1", "top_3", "worst")
+
+
+def generate_cohort(num_students: int, max_ranks: int, seed: int, filename: str,
+                    distribution: str = "uniform") -> int:
+    """
+    Helper function to write a file of randomly generated students like the sample data files
+
+    Students are generated with data_generator.write_generated_students, so large cohorts are
+    generated quickly. Each student lists up to max_ranks preferences, since listing every
+    project would need more memory than is available for the largest cohorts.
+
+    Parameters
+    ----------
+    num_students: int
+        How many students to generate
+    max_ranks: int
+        Most preferences each student lists
+    seed: int
+        Seed of the random preferences, so the same cohort is generated every time
+    filename: str
+        Name of the file that will contain the students
+    distribution: str
+        How popular the projects are, one of data_generator.DISTRIBUTIONS
+
+    Returns
+    -------
+    int
+        Number of projects, numbered from 1
+    """
+    num_projects = math.ceil(num_students / 4)
+    data_generator.write_generated_students(filename, num_students, num_projects, seed, distribution,
+                                            num_ranks=max_ranks)
+    return num_projects
+
+
+def run_once(engine: str, path_to_file: str, num_projects: int, filename: str, outcomes: bool = False) -> dict:
+    """
+    Helper function to load, assign and write a cohort once, timing each phase
+
+    Parameters
+    ----------
+    engine: str
+        Name of the algorithm in ENGINES
+    path_to_file: str
+        Path to the file containing the students
+    num_projects: int
+        Number of projects, numbered from 1
+    filename: str
+        Name of the file the project assignments are written to
+    outcomes: bool
+        Whether to also measure the project assignments with outcome_analytics.outcome_report after the timed phases
+
+    Returns
+    -------
+    dict
+        Each phase mapped to the nanoseconds spent in it, and with outcomes, each of OUTCOME_MEASURES
+    """
+    timings = {}
+    start = first = time.perf_counter_ns()
+    students = assign_students.load_students(path_to_file)
+    start = assign_students.record_phase(timings, "load", start)
+    # Students may not list every project, so every project is given
+    projects = assign_students.initalize_projects(students, range(1, num_projects + 1))
+    start = assign_students.record_phase(timings, "initialize", start)
+    # The algorithm records its own phases
+    projects, sum_preferences = ENGINES[engine](students, projects, timings=timings)
+    start = time.perf_counter_ns()
+    assign_students.write_project_assignments(projects, filename)
+    end = assign_students.record_phase(timings, "write", start)
+    timings["total"] = end - first
+    # Passes that didn't run took no time
+    run = {phase: timings.get(phase, 0) for phase in PHASES}
+    if outcomes:
+        # Every algorithm's project assignments are measured the same way, instead of with its own sum
+        report = outcome_analytics.outcome_report(students, projects)
+        run.update((measure, report[measure]) for measure in OUTCOME_MEASURES)
+    return run
+
+
+def peak_memory(engine: str, path_to_file: str, num_projects: int, filename: str) -> int:
+    """
+    Helper function to measure the most memory allocated while loading, assigning and writing a cohort
+
+    Tracing allocations slows Python down, so this is a separate run from the timed runs.
+
+    Parameters
+    ----------
+    engine: str
+        Name of the algorithm in ENGINES
+    path_to_file: str
+        Path to the file containing the students
+    num_projects: int
+        Number of projects, numbered from 1
+    filename: str
+        Name of the file the project assignments are written to
+
+    Returns
+    -------
+    int
+        Peak number of bytes allocated
+    """
+    tracemalloc.start()
+    try:
+        run_once(engine, path_to_file, num_projects, filename)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(values: list, fraction: float) -> int:
+    """
+    Helper function to find the value below which fraction of the values fall, using the nearest rank
+
+    Parameters
+    ----------
+    values: list
+        Values to look through
+    fraction: float
+        Fraction of the values, from 0 to 1
+
+    Returns
+    -------
+    int
+        The percentile of the values
+    """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def summarize(runs: list) -> dict:
+    """
+    Helper function to summarize the times of each phase over many runs
+
+    Parameters
+    ----------
+    runs: list
+        Each run's phases mapped to the nanoseconds spent in them
+
+    Returns
+    -------
+    dict
+        Each phase mapped to the median, 95th percentile and minimum nanoseconds spent in it
+    """
+    summary = {}
+    for phase in PHASES:
+        times = [run[phase] for run in runs]
+        summary[phase] = {"median_ns": percentile(times, 0.5), "p95_ns": percentile(times, 0.95),
+                          "min_ns": min(times)}
+    return summary
+
+
+def run_benchmarks(sizes: list, engines: list, repeats: int = 5, warmup: int = 1, max_ranks: int = 256,
+                   seed: int = 0, distribution: str = "uniform") -> dict:
+    """
+    Function to benchmark the algorithms on cohorts generated with each number of students
+
+    Parameters
+    ----------
+    sizes: list
+        Numbers of students to generate cohorts with
+    engines: list
+        Names of the algorithms in ENGINES to benchmark
+    repeats: int
+        Number of timed runs of each algorithm on each cohort
+    warmup: int
+        Number of runs before the timed runs that aren't recorded
+    max_ranks: int
+        Most preferences each generated student lists
+    seed: int
+        Seed of the generated cohorts
+    distribution: str
+        How popular the projects are in the generated cohorts, one of data_generator.DISTRIBUTIONS
+
+    Returns
+    -------
+    dict
+        Details of the machine and settings, and each algorithm mapped to each number of students
+        mapped to the summary of each phase, the measures of its project assignments and the peak
+        memory, or to the error the algorithm raised
+    """
+    results = {"meta": {"python": platform.python_version(), "platform": platform.platform(),
+                        "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeats": repeats, "warmup": warmup,
+                        "max_ranks": max_ranks, "seed": seed, "distribution": distribution},
+               "results": {engine: {} for engine in engines}}
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "project_assignments.txt")
+        for num_students in sizes:
+            # Generate each cohort once and use it for every algorithm
+            path_to_file = os.path.join(directory, str(num_students) + "students.txt")
+            num_projects = generate_cohort(num_students, max_ranks, seed, path_to_file, distribution)
+            for engine in engines:
+                try:
+                    runs = []
+                    for run in range(warmup + repeats):
+                        # Seed the random algorithm so every run does the same work
+                        random.seed(seed)
+                        # Every run assigns the same cohort, so only the last one's project assignments are measured
+                        runs.append(run_once(engine, path_to_file, num_projects, output, run == warmup + repeats - 1))
+                    random.seed(seed)
+                    # Leave out the warmup runs
+                    summary = summarize(runs[warmup:])
+                    summary["outcome"] = {measure: runs[-1][measure] for measure in OUTCOME_MEASURES}
+                    summary["peak_memory_bytes"] = peak_memory(engine, path_to_file, num_projects, output)
+                except ValueError as error:
+                    # No project had an opening for a student who ran out of the preferences they listed
+                    results["results"][engine][str(num_students)] = {"error": type(error).__name__ + ": " + str(error)}
+                    print(engine, num_students, "students failed:", error, file=sys.stderr)
+                    continue
+                results["results"][engine][str(num_students)] = summary
+                print(engine, num_students, "students:", format_ns(summary["total"]["median_ns"]),
+                      "median,", format_ns(summary["total"]["p95_ns"]), "p95", file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """
+    Function to find the phases and peak memory that got worse than in a baseline run
+
+    Parameters
+    ----------
+    results: dict
+        Results of run_benchmarks
+    baseline: dict
+        Results of an earlier run of run_benchmarks
+    threshold: float
+        Fraction a median time or peak memory can grow by before it is flagged
+
+    Returns
+    -------
+    list
+        Descriptions of each regression
+    """
+    regressions = []
+    for engine, sizes in results["results"].items():
+        for num_students, summary in sizes.items():
+            base = baseline["results"].get(engine, {}).get(num_students)
+            # Only compare runs that finished in both
+            if base is None or "error" in base or "error" in summary:
+                continue
+            for phase in PHASES:
+                # Baselines saved before a phase was added or renamed don't have it
+                if phase not in base:
+                    continue
+                old, new = base[phase]["median_ns"], summary[phase]["median_ns"]
+                if old >= NOISE_FLOOR_NS and new > old * (1 + threshold):
+                    regressions.append(engine + " " + num_students + " students " + phase + ": "
+                                       + format_ns(old) + " -> " + format_ns(new)
+                                       + " (+" + str(round(100 * (new / old - 1))) + "%)")
+            old, new = base["peak_memory_bytes"], summary["peak_memory_bytes"]
+            if new > old * (1 + threshold):
+                regressions.append(engine + " " + num_students + " students peak memory: "
+                                   + str(old) + " -> " + str(new) + " bytes (+"
+                                   + str(round(100 * (new / old - 1))) + "%)")
+    return regressions
+
+
+def format_ns(nanoseconds: int) -> str:
+    """
+    Helper function to format nanoseconds as milliseconds
+    """
+    return format(nanoseconds / 1e6, ".3f") + "ms"
+
+
+def print_results(results: dict, file=sys.stdout) -> None:
+    """
+    Helper function to print a table of the median and 95th percentile of each phase
+
+    Parameters
+    ----------
+    results: dict
+        Results of run_benchmarks
+    file: file
+        File to print the table to
+
+    Returns
+    -------
+    None
+    """
+    for engine, sizes in results["results"].items():
+        print(engine, file=file)
+        print(f"{'Students':>9}  {'Phase':<18}  {'Median':>12}  {'P95':>12}", file=file)
+        for num_students, summary in sizes.items():
+            if "error" in summary:
+                print(f"{num_students:>9}  failed: {summary['error']}", file=file)
+                continue
+            for phase in PHASES:
+                print(f"{num_students:>9}  {phase:<18}  {format_ns(summary[phase]['median_ns']):>12}  "
+                      f"{format_ns(summary[phase]['p95_ns']):>12}", file=file)
+            print(f"{num_students:>9}  {'peak memory':<18}  {summary['peak_memory_bytes'] / 2 ** 20:>10.1f}MB",
+                  file=file)
+            # Results saved before the project assignments were measured don't have them
+            if "outcome" in summary:
+                outcome = summary["outcome"]
+                print(f"{num_students:>9}  {'sum of preferences':<18}  {outcome['sum_preferences']:>12}  "
+                      f"top choice {outcome['top_1']:.1%}, top 3 {outcome['top_3']:.1%}, "
+                      f"worst preference {outcome['worst']}", file=file)
+
+
+if __name__ == "__main__":
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Benchmark each phase of the algorithms on generated cohorts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="numbers of students to generate cohorts with")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES),
+                        help="algorithms to benchmark")
+    parser.add_argument("--repeats", type=int, default=5, help="number of timed runs")
+    parser.add_argument("--warmup", type=int, default=1, help="number of runs before the timed runs")
+    parser.add_argument("--max-ranks", type=int, default=256, help="most preferences each student lists")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated cohorts")
+    parser.add_argument("--distribution", choices=data_generator.DISTRIBUTIONS, default="uniform",
+                        help="how popular the projects are in the generated cohorts")
+    parser.add_argument("--output", default="benchmark.json", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="results of an earlier run to flag regressions against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="fraction a median can grow by before it is flagged as a regression")
+    args = parser.parse_args()
+    results = run_benchmarks(args.sizes, args.engines, args.repeats, args.warmup, args.max_ranks, args.seed,
+                             args.distribution)
+    print_results(results)
+    # Save results so later runs can be compared against them
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print("Results written to", args.output)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print("Regression:", regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.compare)
@@ -0,0 +1,398 @@
+import os
+import sys
+import struct
+import itertools
+from collections.abc import Mapping, Sequence
+import numpy as np
+
+# Every binary students file starts with these bytes
+MAGIC = b"SGPA"
+# Version of the binary students file format
+VERSION = 2
+# Header layout: magic, version, number of students, number of preferences per student,
+# number of projects, a reserved field keeping the offsets 8 byte aligned, then the offsets
+# of the project number table, the preference block and the name table from the start of the file
+HEADER = struct.Struct("<4sIIIIIQQQ")
+
+
+class PreferenceRow(Sequence):
+    """
+    One student's preferences read from the preference block of a binary students file
+
+    Behaves like the list of project numbers load_students creates for a student,
+    but looks each label up in the memory-mapped preference block when it is read.
+    """
+
+    def __init__(self, row: np.ndarray, project_labels: list, project_index: dict):
+        self.row = row
+        self.project_labels = project_labels
+        self.project_index = project_index
+
+    def __len__(self) -> int:
+        return len(self.row)
+
+    def __iter__(self):
+        return iter([self.project_labels[project] for project in self.row.tolist()])
+
+    def __getitem__(self, index):
+        # Slices are returned as lists of labels like slicing a list would
+        if isinstance(index, slice):
+            return [self.project_labels[project] for project in self.row[index].tolist()]
+        return self.project_labels[self.row[index]]
+
+    def index(self, project_label, start: int = 0, stop: int = None) -> int:
+        # Find the position of the project with a vectorized comparison instead of a scan
+        project = self.project_index.get(project_label, -1)
+        positions = np.flatnonzero(self.row[start:stop] == project)
+        if len(positions) == 0:
+            raise ValueError(str(project_label) + " is not in the student's preferences")
+        return int(positions[0]) + start
+
+
+class BinaryStudents(Mapping):
+    """
+    Students mapped to their preferences, backed by a binary students file
+
+    Behaves like the dictionary load_students creates, so it can be passed to every function
+    that takes students. The preferences stay in the memory-mapped file and are only read
+    when they are used. The integer preference matrix is available as the preferences attribute.
+    """
+
+    def __init__(self, names: list, project_labels: list, preferences: np.ndarray):
+        self.names = names
+        self.project_labels = project_labels
+        self.preferences = preferences
+        # Map each student's name to their row in the preference block
+        self.rows = {name: row for row, name in enumerate(names)}
+        # Map each project label to its index in the preference block
+        self.project_index = {project: index for index, project in enumerate(project_labels)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name) -> bool:
+        return name in self.rows
+
+    def __getitem__(self, name) -> PreferenceRow:
+        return PreferenceRow(self.preferences[self.rows[name]], self.project_labels, self.project_index)
+
+
+def is_binary_students(path_to_file: str) -> bool:
+    """
+    Helper function to check whether a file is a binary students file
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the file
+
+    Returns
+    -------
+    bool
+        Whether the file starts with the binary students file magic bytes
+    """
+    try:
+        with open(path_to_file, 'rb') as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_string_table(output, strings: list) -> None:
+    """
+    Helper function to write a table of strings as offsets followed by their UTF-8 bytes
+
+    Parameters
+    ----------
+    output: file
+        Binary file to write the table to
+    strings: list
+        Strings to write
+
+    Returns
+    -------
+    None
+    """
+    # Encode every string and record where each one starts and ends
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    # Write offsets followed by the strings, padded so the next section is 8 byte aligned
+    offsets.tofile(output)
+    blob = b"".join(encoded)
+    output.write(blob + b"\0" * (-len(blob) % 8))
+
+
+def read_string_table(buffer: memoryview, offset: int, count: int) -> list:
+    """
+    Helper function to read a table of strings written by write_string_table
+
+    Parameters
+    ----------
+    buffer: memoryview
+        Contents of the file
+    offset: int
+        Where the table starts in the file
+    count: int
+        Number of strings in the table
+
+    Returns
+    -------
+    list
+        Strings in the table
+    """
+    # Read where each string starts and ends
+    offsets = np.frombuffer(buffer, dtype='<u8', count=count + 1, offset=offset).tolist()
+    start = offset + 8 * (count + 1)
+    blob = bytes(buffer[start:start + offsets[-1]])
+    # Decode each string from its slice of the table
+    return [blob[offsets[index]:offsets[index + 1]].decode('utf-8') for index in range(count)]
+
+
+def write_binary_blocks(filename: str, project_labels: list, num_ranks: int, blocks) -> None:
+    """
+    Helper function to write students and their preferences to a binary students file a block of students at a time
+
+    The file has a header, a block of fixed width integers holding each student's preferences as
+    project indexes, a table of student names and a table of project numbers. The names and project
+    numbers are written last so students can be written as they are generated or read without
+    holding their preferences, and projects can be numbered as they are first listed.
+
+    Parameters
+    ----------
+    filename: str
+        Name of the file that will contain the students
+    project_labels: list
+        Project numbers, where index j is project j in the preference block; projects may still be
+        added to it while blocks are written
+    num_ranks: int
+        Number of preferences each student lists
+    blocks: iterable
+        Pairs of a list of students' names and an array with a row of project indexes for each of them
+
+    Returns
+    -------
+    None
+    """
+    names = []
+    with open(filename, 'wb') as output:
+        # Leave room for the header, which is written once the section offsets are known
+        output.write(b"\0" * HEADER.size)
+        preferences_offset = output.tell()
+        # Write each block of students' preferences as rows of project indexes
+        for block_names, block in blocks:
+            names.extend(block_names)
+            np.asarray(block, dtype='<i4').reshape(len(block_names), num_ranks).tofile(output)
+        # Pad the preference block so the name table is 8 byte aligned
+        output.write(b"\0" * (-output.tell() % 8))
+        names_offset = output.tell()
+        write_string_table(output, names)
+        # Write the project numbers once every project has been listed
+        labels_offset = output.tell()
+        np.asarray(project_labels, dtype='<i4').tofile(output)
+        # Go back and write the header
+        output.seek(0)
+        output.write(HEADER.pack(MAGIC, VERSION, len(names), num_ranks, len(project_labels), 0,
+                                 labels_offset, preferences_offset, names_offset))
+
+
+def write_binary_rows(filename: str, project_labels: list, rows) -> None:
+    """
+    Helper function to write students and their preferences to a binary students file one student at a time
+
+    Parameters
+    ----------
+    filename: str
+        Name of the file that will contain the students
+    project_labels: list
+        Project numbers, where index j is project j in the preference block
+    rows: iterable
+        Pairs of a student's name and their preferences as project numbers
+
+    Returns
+    -------
+    None
+    """
+    # Map each project label to its index
+    project_index = {project: index for index, project in enumerate(project_labels)}
+    num_ranks = len(project_labels)
+    # Write each student as a block of one row
+    blocks = (([name], np.fromiter((project_index[project] for project in preferences), dtype='<i4',
+                                   count=num_ranks)) for name, preferences in rows)
+    write_binary_blocks(filename, project_labels, num_ranks, blocks)
+
+
+def write_binary_students(students: dict, filename: str) -> None:
+    """
+    Write students and their preferences to a binary students file
+
+    Projects are numbered in the order of the first student's preferences, the same
+    order initalize_projects uses.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    filename: str
+        Name of the file that will contain the students
+
+    Returns
+    -------
+    None
+    """
+    # Number projects in the order of the first student's preferences
+    project_labels = list(students[next(iter(students))])
+    write_binary_rows(filename, project_labels, students.items())
+
+
+def load_binary_students(path_to_file: str) -> BinaryStudents:
+    """
+    Helper function to load in students from a binary students file without copying their preferences
+
+    The preference block is memory-mapped, so only the header and the names are read in.
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the binary students file
+
+    Returns
+    -------
+    BinaryStudents
+        Students mapped to their preferences
+    """
+    with open(path_to_file, 'rb') as file:
+        header = file.read(HEADER.size)
+        magic, version, num_students, num_ranks, num_projects, _, labels_offset, preferences_offset, names_offset = \
+            HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(path_to_file + " is not a version " + str(VERSION) + " binary students file")
+        # Read the project numbers in
+        file.seek(labels_offset)
+        project_labels = np.fromfile(file, dtype='<i4', count=num_projects).tolist()
+        # Read the name table in
+        file.seek(names_offset)
+        names = read_string_table(memoryview(file.read()), 0, num_students)
+    # Memory-map the preference block so it is read from disk only when used
+    preferences = np.memmap(path_to_file, dtype='<i4', mode='r', offset=preferences_offset,
+                            shape=(num_students, num_ranks))
+    return BinaryStudents(names, project_labels, preferences)
+
+
+def parse_student_lines(path_to_file: str, file):
+    """
+    Helper function to parse each line of a text file of students, skipping malformed lines like load_students
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the text file, used to report malformed lines
+    file: file
+        Text file containing the students and their preferences
+
+    Returns
+    -------
+    generator
+        Tuples of the line number, name and preferences of each student
+    """
+    # Imported here since assign_students loads binary students files with this module
+    import assign_students
+    for line_number, line in enumerate(file, start=1):
+        # Skip blank lines
+        if not line.strip():
+            continue
+        try:
+            name, preferences = assign_students.parse_student(line)
+        except ValueError as error:
+            # Report the line that couldn't be parsed and move on to the next one
+            print(path_to_file + ":" + str(line_number) + ": skipping malformed line:", error, file=sys.stderr)
+            continue
+        yield (line_number, name, preferences)
+
+
+def convert_text_to_binary(path_to_file: str, filename: str) -> None:
+    """
+    Convert a text file of students like the sample data files to a binary students file
+
+    Students are converted one line at a time, so the text file is never held in memory, and files
+    ending in .gz or .xz are decompressed while they are read. Every student's preferences are stored
+    in a row of the same width, so every student must list the same number of different projects,
+    which may be fewer than the number of projects; malformed lines are skipped like in load_students.
+    Projects are numbered in the order they are first listed, the same order initalize_projects uses.
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the text file containing the students and their preferences
+    filename: str
+        Name of the binary students file to create
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError
+        If there are no students, a student lists a project twice, or students list different numbers
+        of projects; the binary students file isn't left behind
+    """
+    # Imported here since assign_students loads binary students files with this module
+    import assign_students
+    with assign_students.open_students_file(path_to_file) as file:
+        rows = parse_student_lines(path_to_file, file)
+        first = next(rows, None)
+        if first is None:
+            raise ValueError(path_to_file + " has no students")
+        num_ranks = len(first[2])
+        # Number projects as they are first listed, so they can be written as they are read
+        project_labels = []
+        project_index = {}
+
+        def blocks():
+            # Rows have one width, so students listing a project twice or another number of projects can't be stored
+            for line_number, name, preferences in itertools.chain([first], rows):
+                if len(set(preferences)) != len(preferences):
+                    raise ValueError(path_to_file + ":" + str(line_number) + ": student " + repr(name)
+                                     + " lists a project more than once")
+                if len(preferences) != num_ranks:
+                    raise ValueError(path_to_file + ":" + str(line_number) + ": student " + repr(name) + " lists "
+                                     + str(len(preferences)) + " projects instead of " + str(num_ranks) + "; every "
+                                     "student in a binary students file lists the same number of projects")
+                for project in preferences:
+                    if project not in project_index:
+                        project_index[project] = len(project_labels)
+                        project_labels.append(project)
+                # Write each student as a block of one row
+                yield ([name], np.fromiter(map(project_index.__getitem__, preferences), dtype='<i4', count=num_ranks))
+
+        try:
+            write_binary_blocks(filename, project_labels, num_ranks, blocks())
+        except ValueError:
+            # Don't leave a half written file behind
+            os.remove(filename)
+            raise
+
+
+if __name__ == "__main__":
+    # Convert each text file given on the command line to a binary students file next to it
+    # For example, data/125students.txt is converted to data/125students.bin
+    if len(sys.argv) < 2:
+        print("Please provide the text files containing students to convert", file=sys.stderr)
+    failed = False
+    for path_to_file in sys.argv[1:]:
+        # Compressed files are named after the file they hold, i.e. 125students.txt.gz is converted to 125students.bin
+        filename = path_to_file.removesuffix(".gz").removesuffix(".xz").rsplit('.', 1)[0] + ".bin"
+        try:
+            convert_text_to_binary(path_to_file, filename)
+        except (ValueError, OSError) as error:
+            # Report the file that couldn't be converted and move on to the next one
+            print("Can't convert " + path_to_file + ":", error, file=sys.stderr)
+            failed = True
+            continue
+        print("Converted", path_to_file, "to", filename)
+    if failed:
+        sys.exit(1)
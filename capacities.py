@@ -0,0 +1,145 @@
+import sys
+
+# Fewest and most students assigned to a project unless other capacities are given
+DEFAULT_CAPACITY = (3, 4)
+
+
+def project_capacities(projects: dict, capacities=None) -> tuple:
+    """
+    Helper function to look up the fewest and most students of every project
+
+    Parameters
+    ----------
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    capacities: tuple or dict
+        Fewest and most students of every project as a (minimum, maximum) tuple, or projects mapped to
+        their own (minimum, maximum); projects left out get DEFAULT_CAPACITY. A maximum of 0 closes a project
+
+    Returns
+    -------
+    tuple
+        First entry is projects mapped to the fewest students they can be assigned
+        Second entry is projects mapped to the most students they can be assigned
+
+    Raises
+    ------
+    ValueError
+        If a minimum is negative or more than its maximum
+    """
+    if capacities is None or isinstance(capacities, tuple):
+        capacity = capacities or DEFAULT_CAPACITY
+        minimums = dict.fromkeys(projects, capacity[0])
+        maximums = dict.fromkeys(projects, capacity[1])
+    else:
+        minimums = {}
+        maximums = {}
+        for project in projects:
+            minimums[project], maximums[project] = capacities.get(project, DEFAULT_CAPACITY)
+    for project in projects:
+        if not 0 <= minimums[project] <= maximums[project]:
+            raise ValueError("project " + str(project) + " can't have between " + str(minimums[project]) + " and "
+                             + str(maximums[project]) + " students")
+    return (minimums, maximums)
+
+
+def capacity_error(num_students: int, minimums: dict, maximums: dict) -> str:
+    """
+    Helper function to explain why students can't be assigned to projects with these capacities
+
+    Parameters
+    ----------
+    num_students: int
+        Number of students
+    minimums: dict
+        Projects mapped to the fewest students they can be assigned
+    maximums: dict
+        Projects mapped to the most students they can be assigned
+
+    Returns
+    -------
+    str
+        Why the students can't be assigned, or None if they can
+    """
+    fewest = sum(minimums.values())
+    most = sum(maximums.values())
+    if num_students < fewest:
+        return (str(num_students) + " students can't give " + str(len(minimums)) + " projects the "
+                + str(fewest) + " students they need")
+    if num_students > most:
+        return (str(num_students) + " students don't fit in " + str(len(maximums)) + " projects with room for "
+                + str(most) + " students")
+    return None
+
+
+def solve_targets(sorted_projects: list, minimums, maximums, num_students: int) -> dict:
+    """
+    Function to choose how many students each project ends up with, given how popular it is
+
+    Every project starts with room for its most students. Since there are no more students than that,
+    places are taken away from the projects fewest students chose first, down to their fewest students,
+    until the targets add up to the number of students. Moving students out of projects above their
+    target until none are then leaves every project at its target in one pass over the projects, and
+    the projects that end up smaller are the ones students would have had to be moved into.
+
+    Parameters
+    ----------
+    sorted_projects: list
+        Projects descendingly sorted by the number of students assigned to them
+    minimums: dict
+        Projects mapped to the fewest students they can be assigned; a list when projects are indexes
+    maximums: dict
+        Projects mapped to the most students they can be assigned; a list when projects are indexes
+    num_students: int
+        Number of students, which must be between the sum of minimums and the sum of maximums
+
+    Returns
+    -------
+    dict
+        Projects mapped to the number of students they should be assigned
+    """
+    targets = {project: maximums[project] for project in sorted_projects}
+    # Places that have to be left empty
+    excess = sum(targets.values()) - num_students
+    # Take places away from the least popular projects first
+    for project in reversed(sorted_projects):
+        if excess <= 0:
+            break
+        cut = min(targets[project] - minimums[project], excess)
+        targets[project] -= cut
+        excess -= cut
+    return targets
+
+
+def load_capacities(path_to_file: str) -> dict:
+    """
+    Helper function to read projects' capacities from a file
+
+    Each line holds a project number followed by the fewest and the most students of the
+    project, i.e. "7 2 2" for a lab of 2, "12 5 6" for a capstone of 5 or 6, or "3 0 0"
+    for a closed project. Blank lines and lines starting with # are skipped.
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the file containing the capacities
+
+    Returns
+    -------
+    dict
+        Projects mapped to their (minimum, maximum) number of students
+    """
+    capacities = {}
+    with open(path_to_file) as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            try:
+                project, minimum, maximum = (int(value) for value in line.split())
+            except ValueError:
+                # Report the line that couldn't be parsed and move on to the next one
+                print(path_to_file + ":" + str(line_number) + ": skipping malformed line:", line.strip(),
+                      file=sys.stderr)
+                continue
+            capacities[project] = (minimum, maximum)
+    return capacities
@@ -0,0 +1,41 @@
+class CascadeStats:
+    """
+    Counters and timings collected while assign_students moves students out of projects with too many students
+
+    Pass one to assign_students as stats to fill it in. Without it, the cascade skips the counters
+    with a check per project, per preference tried and per full preference found, and isn't timed.
+    """
+
+    def __init__(self):
+        # Number of students moved to their next preference
+        self.students_moved = 0
+        # Number of times a student's preference was checked and didn't have an opening
+        self.failed_probes = 0
+        # Number of students who listed no more projects and were moved to the least loaded project
+        self.fallbacks = 0
+        # Deepest preference checked, where 1 is students' second preference
+        self.max_preference = 0
+        # Number of preferences its students tried while each project had too many students
+        self.loop_iterations = {}
+        # Nanoseconds spent in each phase of the algorithm
+        self.timings = {}
+
+    def as_dict(self) -> dict:
+        """
+        Dictionary of the counters and timings, i.e. to save as JSON
+        """
+        return {"students_moved": self.students_moved, "failed_probes": self.failed_probes,
+                "fallbacks": self.fallbacks, "max_preference": self.max_preference,
+                "loop_iterations": {str(project): iterations for project, iterations in self.loop_iterations.items()},
+                "timings": dict(self.timings)}
+
+    def summary(self) -> str:
+        """
+        One line summary of the counters and timings
+        """
+        busiest = max(self.loop_iterations.items(), key=lambda item: item[1], default=(None, 0))
+        return ("students moved: " + str(self.students_moved) + ", failed probes: " + str(self.failed_probes)
+                + ", fallbacks: " + str(self.fallbacks) + ", deepest preference: " + str(self.max_preference + 1)
+                + ", most preferences tried in one project: " + str(busiest[1]) + " (project " + str(busiest[0]) + ")"
+                + "".join(", " + phase + ": " + format(time / 1e6, ".3f") + "ms"
+                          for phase, time in self.timings.items()))
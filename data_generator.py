@@ -1,7 +1,11 @@
-from faker import Faker
 import random
 import math
-import sys
+import argparse
+
+# Distributions of how popular projects are that generate_preferences supports
+DISTRIBUTIONS = ("uniform", "zipf", "clustered")
+# Most entries of the random matrix generated at once, so large cohorts are generated in chunks
+CHUNK_ENTRIES = 1 << 22
 
 def generate_students(num_students: int, num_projects: int) -> dict:
     """
@@ -23,6 +27,8 @@ def generate_students(num_students: int, num_projects: int) -> dict:
     dict
         Students mapped to their preferences
     """
+    # Imported here so Faker is only needed to generate students with names
+    from faker import Faker
     # Create dictionary to store students mapped to their preferences
     students = {}
     # Create faker object to generate random names
@@ -69,27 +75,250 @@ def write_students(students: dict, filename: str) -> None:
         print(student_list[-1], students[student_list[-1]], file=output, end='')
 
 
+def popularity_weights(num_projects: int, distribution: str, skew: float, rng) -> list:
+    """
+    Helper function to weight how popular each project is
+
+    Parameters
+    ----------
+    num_projects: int
+        How many projects there are
+    distribution: str
+        "uniform" for equally popular projects, "zipf" for projects whose popularity falls off as
+        1 / rank ** skew, or "clustered" for projects split into groups that students favour
+    skew: float
+        Exponent of the Zipf distribution, or how many times more popular a student's favoured
+        group of projects is than the rest
+    rng: numpy.random.Generator
+        Random number generator
+
+    Returns
+    -------
+    numpy.ndarray
+        Weight of each project, or with "clustered", the group of each project
+    """
+    import numpy as np
+    if distribution == "zipf":
+        # Shuffle which project is the most popular, second most popular, ...
+        popularity = rng.permutation(num_projects)
+        return (1.0 / (popularity + 1.0) ** skew).astype(np.float32)
+    if distribution == "clustered":
+        # Split projects into groups of about 8 in a random order
+        num_clusters = max(1, num_projects // 8)
+        return rng.permutation(num_projects) % num_clusters
+    return np.ones(num_projects)
+
+
+def generate_preferences(num_students: int, num_projects: int, seed: int = None, distribution: str = "uniform",
+                         skew: float = None, num_ranks: int = None):
+    """
+    Generate the preferences of num_students students in chunks, without names
+
+    Each chunk's preferences are drawn at once: every student gets a random key for every project,
+    scaled by how popular the project is, and the projects are sorted by their keys. With equal
+    weights this is a random permutation of the projects; otherwise popular projects tend to come
+    first, like sampling without replacement in proportion to the weights.
+
+    Parameters
+    ----------
+    num_students: int
+        How many students to generate
+    num_projects: int
+        How many projects there are
+    seed: int
+        Seed of the random preferences, so the same students are generated every time
+    distribution: str
+        How popular the projects are, one of DISTRIBUTIONS
+    skew: float
+        Exponent of the Zipf distribution, or how many times more a student favours their group
+        of projects with "clustered"; defaults to 1 with "zipf" and 10 with "clustered"
+    num_ranks: int
+        If provided, each student only lists their first num_ranks preferences
+
+    Returns
+    -------
+    generator
+        Arrays of project indexes from 0, one row of preferences per student
+    """
+    import numpy as np
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError("distribution must be one of " + ", ".join(DISTRIBUTIONS))
+    if skew is None:
+        skew = 10.0 if distribution == "clustered" else 1.0
+    rng = np.random.default_rng(seed)
+    num_ranks = num_projects if num_ranks is None else min(num_ranks, num_projects)
+    weights = popularity_weights(num_projects, distribution, skew, rng)
+    # Generate as many students at a time as keep the random matrix to CHUNK_ENTRIES entries
+    chunk_size = max(1, CHUNK_ENTRIES // num_projects)
+    for start in range(0, num_students, chunk_size):
+        size = min(chunk_size, num_students - start)
+        if distribution == "uniform":
+            # Sorting uniform keys gives a random permutation
+            keys = rng.random(size=(size, num_projects), dtype=np.float32)
+        else:
+            # Exponential keys divided by the weights give weighted sampling without replacement
+            keys = rng.standard_exponential(size=(size, num_projects), dtype=np.float32)
+        if distribution == "clustered":
+            # Each student favours one group of projects
+            favoured = rng.integers(weights.max() + 1, size=(size, 1))
+            keys /= np.where(weights == favoured, np.float32(skew), np.float32(1.0))
+        elif distribution == "zipf":
+            keys /= weights
+        if num_ranks < num_projects:
+            # Find the smallest keys first so only num_ranks keys per student are sorted
+            smallest = np.argpartition(keys, num_ranks - 1, axis=1)[:, :num_ranks]
+            order = np.argsort(np.take_along_axis(keys, smallest, axis=1), axis=1)
+            yield np.take_along_axis(smallest, order, axis=1)
+        else:
+            yield np.argsort(keys, axis=1)
+
+
+def running_starts(chunks):
+    """
+    Helper function to pair each chunk of students with the number of students before it
+
+    Parameters
+    ----------
+    chunks: iterable
+        Chunks of students, i.e. the arrays of preferences generated by generate_preferences
+
+    Returns
+    -------
+    generator
+        Tuples of the number of students before each chunk and the chunk
+    """
+    start = 0
+    for chunk in chunks:
+        yield (start, chunk)
+        start += len(chunk)
+
+
+def generate_registered_students(num_students: int, num_projects: int, seed: int = None,
+                                 distribution: str = "uniform", skew: float = None, num_ranks: int = None) -> tuple:
+    """
+    Generate students with generate_preferences already given integer IDs, without writing them to a file
+
+    The students are the ones write_generated_students writes with the same arguments, and the
+    registry gives them the IDs load_students would give them reading the binary file, so they
+    can be assigned straight away and written with their names and project numbers.
+
+    Parameters
+    ----------
+    num_students: int
+        How many students to generate
+    num_projects: int
+        How many projects there are, numbered from 1
+    seed: int
+        Seed of the random preferences, so the same students are generated every time
+    distribution: str
+        How popular the projects are, one of DISTRIBUTIONS
+    skew: float
+        Exponent of the Zipf distribution, or how many times more a student favours their group
+        of projects with "clustered"; defaults to 1 with "zipf" and 10 with "clustered"
+    num_ranks: int
+        If provided, each student only lists their first num_ranks preferences
+
+    Returns
+    -------
+    tuple
+        First entry is the students' IDs mapped to the IDs of their preferences
+        Second entry is the registry.Registry of the students' names and project numbers
+    """
+    # Imported here so the registry is only loaded when used
+    from registry import Registry
+    registry = Registry([f"Student {student}" for student in range(num_students)], range(1, num_projects + 1))
+    registry.file_projects = list(range(num_projects))
+    students = {}
+    for start, chunk in running_starts(generate_preferences(num_students, num_projects, seed, distribution, skew,
+                                                            num_ranks)):
+        # Project indexes from generate_preferences are already the projects' IDs
+        students.update(enumerate(chunk.tolist(), start))
+    return (students, registry)
+
+
+def write_generated_students(filename: str, num_students: int, num_projects: int, seed: int = None,
+                             distribution: str = "uniform", skew: float = None, num_ranks: int = None,
+                             binary: bool = False) -> None:
+    """
+    Generate students with generate_preferences and write them to a file a chunk at a time
+
+    Students are named 'Student 0', 'Student 1', ... instead of with Faker, so the names are
+    unique without checking and large cohorts are generated quickly.
+
+    Parameters
+    ----------
+    filename: str
+        Name of the file that will contain the students
+    num_students: int
+        How many students to generate
+    num_projects: int
+        How many projects there are, numbered from 1
+    seed: int
+        Seed of the random preferences, so the same students are generated every time
+    distribution: str
+        How popular the projects are, one of DISTRIBUTIONS
+    skew: float
+        Exponent of the Zipf distribution, or how many times more a student favours their group
+        of projects with "clustered"; defaults to 1 with "zipf" and 10 with "clustered"
+    num_ranks: int
+        If provided, each student only lists their first num_ranks preferences
+    binary: bool
+        Whether to write a binary students file instead of a text file like the sample data files
+
+    Returns
+    -------
+    None
+    """
+    chunks = generate_preferences(num_students, num_projects, seed, distribution, skew, num_ranks)
+    if binary:
+        # Imported here so numpy is only needed when used
+        import binary_students
+        blocks = (([f"Student {student}" for student in range(start, start + len(chunk))], chunk)
+                  for start, chunk in running_starts(chunks))
+        binary_students.write_binary_blocks(filename, list(range(1, num_projects + 1)),
+                                            min(num_ranks or num_projects, num_projects), blocks)
+        return
+    with open(filename, 'w') as output:
+        for start, chunk in running_starts(chunks):
+            # Number projects from 1 and write the chunk's lines at once
+            rows = (chunk + 1).tolist()
+            output.write("".join(f"'Student {start + index}' " + " ".join(map(str, row)) + "\n"
+                                 for index, row in enumerate(rows)))
+
+
 if __name__ == "__main__":
-    try:
-        # Allow the user to enter in command line arguments to specify datasets to generate
-        # For example, user could enter 80 120 and a file containing 80 and another
-        # file containing 120 students would be produced
-        class_sizes = sys.argv[1:]
-        # Convert each command line argument specificed to int
-        class_sizes = [int(size) for size in class_sizes]
-        # If no command line arguments provided, generate the dataset used in our report
-        if len(class_sizes) == 0:
-            class_sizes = [31, 62, 125, 250, 500, 1000]
-    except:
-        # Assign class sizes to the dataset sizes considered in our report if 
-        # error or invalid command-line arguments are provided
-        class_sizes = [31, 62, 125, 250, 500, 1000]
+    # Allow the user to enter in command line arguments to specify datasets to generate
+    # For example, user could enter 80 120 and a file containing 80 and another
+    # file containing 120 students would be produced
+    parser = argparse.ArgumentParser(description="Generate datasets of students and their preferences")
+    parser.add_argument("class_sizes", type=int, nargs="*", default=[31, 62, 125, 250, 500, 1000],
+                        help="number of students in each dataset (default: the datasets used in our report)")
+    parser.add_argument("--seed", type=int,
+                        help="generate students named by number from this seed instead of with Faker")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform",
+                        help="how popular the projects are (with --seed)")
+    parser.add_argument("--skew", type=float,
+                        help="Zipf exponent (default 1), or how many times more students favour their group "
+                             "of projects (default 10) (with --seed)")
+    parser.add_argument("--ranks", type=int, help="number of preferences each student lists (with --seed)")
+    parser.add_argument("--binary", action="store_true", help="write binary students files (with --seed)")
+    args = parser.parse_args()
+    # Options of the seeded generator can't be used with Faker
+    if args.seed is None and (args.distribution != "uniform" or args.skew is not None or args.ranks is not None
+                              or args.binary):
+        parser.error("--distribution, --skew, --ranks and --binary require --seed")
     # Create file(s) containing specified number of students
-    for num_students in class_sizes:
+    for num_students in args.class_sizes:
         # The maximum number of students that can be assigned to a project
         max_students_per_project = 4
         # Calculate number of projects
         num_projects = math.ceil(num_students / max_students_per_project)
+        if args.seed is not None:
+            # Call helper function to generate students and write them to file in chunks
+            extension = ".bin" if args.binary else ".txt"
+            write_generated_students(str(num_students) + "students" + extension, num_students, num_projects,
+                                     args.seed, args.distribution, args.skew, args.ranks, args.binary)
+            continue
         # Call helper function to generate students
         students = generate_students(num_students, num_projects)
         # Call helper function to write students to file
@@ -0,0 +1,196 @@
+import time
+import heapq
+import random
+from roster import Roster
+from capacities import project_capacities, capacity_error, solve_targets
+from assign_students import record_phase, least_loaded_project
+
+# Ways projects can rank the students who propose to them; a dict of students mapped to numbers can also be given
+PRIORITIES = ("rank", "lottery")
+
+
+def priority_positions(students: dict, priority, seed: int = None) -> dict:
+    """
+    Helper function to give every student a distinct position used to break ties between students
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    priority: str or dict
+        One of PRIORITIES, or students mapped to a number where lower numbers go first, i.e. seniority
+    seed: int
+        Seed of the lottery that orders students, and students with the same priority; the random
+        module's generator draws it if not provided, so random.seed also seeds it
+
+    Returns
+    -------
+    dict
+        Students mapped to their position from 0, where lower positions go first
+    """
+    if not isinstance(priority, dict) and priority not in PRIORITIES:
+        raise ValueError("priority must be a dict or one of " + ", ".join(PRIORITIES))
+    # Draw one lottery number per student
+    lottery = list(students)
+    (random if seed is None else random.Random(seed)).shuffle(lottery)
+    if isinstance(priority, dict):
+        # Students with the same priority, or none, keep the order of the lottery
+        lottery.sort(key=lambda student: priority.get(student, float("inf")))
+    return {student: position for position, student in enumerate(lottery)}
+
+
+def deferred_acceptance(students: dict, targets: dict, positions: dict, by_rank: bool, stats: dict = None) -> tuple:
+    """
+    Helper function to match students to projects by student-proposing deferred acceptance
+
+    Each free student proposes to their next preference. A project with room holds the student on
+    its waitlist, and a full project holds the student only if they come before the last student on
+    its waitlist, who is turned away and proposes to their own next preference. Each waitlist is a
+    heap with its last student on top and never holds more than the project's target, so each
+    proposal takes time proportional to the logarithm of the target, and every student proposes to
+    each of their preferences at most once.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    targets: dict
+        Projects mapped to the number of students they can hold; projects students listed that
+        aren't in targets are skipped
+    positions: dict
+        Students mapped to their position from priority_positions
+    by_rank: bool
+        Whether projects put students who rank them higher first, using positions only to break ties
+    stats: dict
+        If provided, the number of proposals, rejections and students turned away after being held
+        (displaced) are stored in it
+
+    Returns
+    -------
+    tuple
+        First entry is projects mapped to their waitlist heaps of (negated priority key, preference
+        where 0 is the first preference, student)
+        Second entry is the list of students turned away by every project they listed
+    """
+    num_students = len(students)
+    # Heap of each project's students, the student that comes last on top so it can be turned away
+    waitlists = {project: [] for project, target in targets.items() if target > 0}
+    # Next preference each student proposes to, where 0 is their first preference
+    next_choice = dict.fromkeys(students, 0)
+    unmatched = []
+    proposals = rejections = displaced = 0
+    # Students without a project, taken from the end
+    free = list(students)
+    free.reverse()
+    while free:
+        student = free.pop()
+        preferences = students[student]
+        position = positions[student]
+        choice = next_choice[student]
+        num_ranks = len(preferences)
+        while choice < num_ranks:
+            project = preferences[choice]
+            rank = choice
+            choice += 1
+            waitlist = waitlists.get(project)
+            # Projects that aren't being assigned or have no room at all are skipped
+            if waitlist is None:
+                continue
+            proposals += 1
+            # Lower keys come first; keys of different students never tie
+            key = rank * num_students + position if by_rank else position
+            if len(waitlist) < targets[project]:
+                heapq.heappush(waitlist, (-key, rank, student))
+                break
+            if key < -waitlist[0][0]:
+                # Hold the student and turn away the student that came last
+                turned_away = heapq.heapreplace(waitlist, (-key, rank, student))[2]
+                free.append(turned_away)
+                displaced += 1
+                break
+            rejections += 1
+        else:
+            # Every project the student listed turned them away
+            unmatched.append(student)
+        next_choice[student] = choice
+    if stats is not None:
+        stats.update({"proposals": proposals, "rejections": rejections, "displaced": displaced})
+    return (waitlists, unmatched)
+
+
+def deferred_acceptance_assign_students(students: dict, projects: dict, priority="rank", seed: int = None,
+                                        timings: dict = None, capacities=None, stats: dict = None) -> tuple:
+    """
+    Function to assign students to projects with student-proposing deferred acceptance (Gale-Shapley)
+
+    Each project's number of students is chosen first like in assign_students.assign_students, with
+    capacities.solve_targets from the number of students choosing it first, so the targets add up to
+    the number of students and each is between the project's fewest and most students. Students then
+    propose to projects holding up to their target with deferred_acceptance. The result is stable: no
+    student prefers a project that holds a student it puts after them, or that has room. Students
+    who listed only projects that turned them away are then moved to the least loaded project with
+    an opening, like in assign_students.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    priority: str or dict
+        How projects order the students proposing to them: "rank" puts students who rank the project
+        higher first, "lottery" draws one order of students for every project, and a dict of students
+        mapped to numbers, i.e. seniority, puts lower numbers first. Ties are broken by the lottery
+    seed: int
+        Seed of the lottery
+    timings: dict
+        If provided, the nanoseconds spent choosing each project's number of students and matching
+        students are added to it under solve_capacities and cascade
+    capacities: tuple or dict
+        Fewest and most students of every project as in capacities.project_capacities;
+        every project has 3 or 4 students if not provided
+    stats: dict
+        If provided, the number of proposals, rejections, displaced students and students moved to
+        the least loaded project (fallbacks) are stored in it
+
+    Returns
+    -------
+    tuple
+        First entry is projects dictionary where each project has been assigned between its fewest and most students
+        Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    """
+    # If the projects' capacities can't fit the students, return None
+    minimums, maximums = project_capacities(projects, capacities)
+    if capacity_error(len(students), minimums, maximums) is not None:
+        return None
+    start = time.perf_counter_ns()
+    # Count the students choosing each project first, which is each project's popularity
+    first_choices = dict.fromkeys(projects, 0)
+    for preferences in students.values():
+        # Students whose first choice isn't being assigned are skipped like in deferred_acceptance
+        if preferences[0] in first_choices:
+            first_choices[preferences[0]] += 1
+    # A stable sort keeps projects with the same number of first choices in the order of projects
+    sorted_projects = sorted(projects, key=first_choices.__getitem__, reverse=True)
+    targets = solve_targets(sorted_projects, minimums, maximums, len(students))
+    positions = priority_positions(students, priority, seed)
+    start = record_phase(timings, "solve_capacities", start)
+    waitlists, unmatched = deferred_acceptance(students, targets, positions, priority == "rank", stats)
+    # Write each project's students from first to last, and add up their preferences
+    sum_preferences = 0
+    for project, waitlist in waitlists.items():
+        waitlist.sort(reverse=True)
+        projects[project].extend(student for key, rank, student in waitlist)
+        sum_preferences += sum(rank for key, rank, student in waitlist) + len(waitlist)
+    if unmatched:
+        # The targets add up to the number of students, so projects left below their target have room for them
+        roster = Roster(projects)
+        for student in unmatched:
+            project, preference = least_loaded_project(students[student], roster, targets)
+            roster.add(project, student)
+            sum_preferences += preference + 1
+        projects = roster.to_projects(projects)
+    if stats is not None:
+        stats["fallbacks"] = len(unmatched)
+    record_phase(timings, "cascade", start)
+    return (projects, sum_preferences)
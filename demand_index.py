@@ -0,0 +1,219 @@
+import sys
+import csv
+import argparse
+import itertools
+import numpy as np
+import assign_students
+from capacities import project_capacities, solve_targets, load_capacities
+from registry import Registry
+
+# Number of each student's first preferences counted in a demand index
+DEFAULT_DEPTH = 5
+# Number of most demanded projects listed in a report
+DEFAULT_TOP = 10
+
+
+def build_demand_index(students: dict, projects: dict, depth: int = DEFAULT_DEPTH) -> np.ndarray:
+    """
+    Function to count how many students rank each project as their 1st, 2nd, ... preference
+
+    Every preference up to depth is counted in one pass: each preference is given the index
+    of its project times depth plus its position, and the indexes are counted with bincount.
+    Preferences of projects that aren't being assigned are left out.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    depth: int
+        Number of each student's first preferences to count
+
+    Returns
+    -------
+    np.ndarray
+        Demand index; entry [j, d] is the number of students whose preference d + 1 is the
+        j-th project of projects, so column 0 holds the first choices
+    """
+    project_labels = list(projects)
+    num_projects = len(project_labels)
+    project_index = {project: index for index, project in enumerate(project_labels)}
+    if hasattr(students, "preferences"):
+        # Students loaded from a binary students file are renumbered in their preference matrix at once
+        renumber = np.array([project_index.get(project, -1) for project in students.project_labels], dtype=np.int64)
+        listed = renumber[students.preferences[:, :depth]]
+        ranks = np.broadcast_to(np.arange(listed.shape[1]), listed.shape).ravel()
+        listed = listed.ravel()
+    else:
+        lengths = np.fromiter((min(len(preferences), depth) for preferences in students.values()), dtype=np.int64,
+                              count=len(students))
+        chained = itertools.chain.from_iterable(preferences[:depth] for preferences in students.values())
+        # Projects given by ID from a registry are already their own index
+        if project_labels != list(range(num_projects)):
+            chained = (project_index.get(project, -1) for project in chained)
+        listed = np.fromiter(chained, dtype=np.int64, count=int(lengths.sum()))
+        # Position of each preference in its student's preferences
+        starts = np.cumsum(lengths) - lengths
+        ranks = np.arange(len(listed)) - np.repeat(starts, lengths)
+    kept = (listed >= 0) & (listed < num_projects)
+    counts = np.bincount(listed[kept] * depth + ranks[kept], minlength=num_projects * depth)
+    return counts.reshape(num_projects, depth)
+
+
+def predict_overflow(demand: np.ndarray, projects: dict, minimums, maximums, num_students: int) -> tuple:
+    """
+    Function to order projects and choose their targets from a demand index before any student is placed
+
+    Every student starts in their first preference, so the first choices in the demand index are
+    each project's number of students after the initial assignment. Projects are ordered by them
+    like assign_students.sort_projects_by_size orders the roster, and the projects above their
+    target are the ones the cascade moves students out of, in this order.
+
+    Parameters
+    ----------
+    demand: np.ndarray
+        Demand index from build_demand_index of the same projects
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    minimums: dict
+        Projects mapped to the fewest students they can be assigned
+    maximums: dict
+        Projects mapped to the most students they can be assigned
+    num_students: int
+        Number of students
+
+    Returns
+    -------
+    tuple
+        First entry is the list of projects descendingly sorted by their number of first choices
+        Second entry is projects mapped to the number of students they should be assigned, from capacities.solve_targets
+    """
+    project_labels = list(projects)
+    # A stable sort keeps projects with the same number of first choices in the order of projects
+    order = np.argsort(-demand[:, 0], kind="stable")
+    sorted_projects = [project_labels[index] for index in order.tolist()]
+    targets = solve_targets(sorted_projects, minimums, maximums, num_students)
+    return (sorted_projects, targets)
+
+
+def demand_report(demand: np.ndarray, projects: dict, capacities=None, top: int = DEFAULT_TOP,
+                  registry=None) -> dict:
+    """
+    Function to summarize which projects students want most and which will have too many students
+
+    Parameters
+    ----------
+    demand: np.ndarray
+        Demand index from build_demand_index
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    capacities: tuple or dict
+        Fewest and most students of every project as in capacities.project_capacities;
+        every project has 3 or 4 students if not provided
+    top: int
+        Number of most demanded projects to list
+    registry: Registry
+        If provided, the registry.Registry projects are given by ID in, so they are listed by label
+
+    Returns
+    -------
+    dict
+        Number of students, projects and preferences counted (depth), the number of projects
+        predicted to have too many students (overflowing), the students that have to be moved out
+        of them, the projects no student ranked within depth (unlisted), the share of first choices
+        of the top projects, and a list of the top projects as (project, first choices, students
+        ranking it within depth, target)
+    """
+    num_students = int(demand[:, 0].sum())
+    minimums, maximums = project_capacities(projects, capacities)
+    sorted_projects, targets = predict_overflow(demand, projects, minimums, maximums, num_students)
+    project_index = {project: index for index, project in enumerate(projects)}
+    first_choices = demand[:, 0].tolist()
+    totals = demand.sum(axis=1).tolist()
+    excess = [first_choices[project_index[project]] - targets[project] for project in sorted_projects]
+    label = (lambda project: project) if registry is None else registry.project_labels.__getitem__
+    hottest = [(label(project), first_choices[project_index[project]], totals[project_index[project]],
+                targets[project]) for project in sorted_projects[:top]]
+    return {"students": num_students, "projects": len(projects), "depth": demand.shape[1],
+            "overflowing": sum(1 for count in excess if count > 0),
+            "students_to_move": sum(count for count in excess if count > 0),
+            "unlisted": int((demand.sum(axis=1) == 0).sum()),
+            "top_share": sum(project[1] for project in hottest) / num_students if num_students else 0.0,
+            "hottest": hottest}
+
+
+def print_demand_report(report: dict, file=sys.stdout) -> None:
+    """
+    Helper function to print the summary made by demand_report
+
+    Parameters
+    ----------
+    report: dict
+        Report returned by demand_report
+    file: file
+        File to print the report to
+
+    Returns
+    -------
+    None
+    """
+    print("Projects with too many first choices:", report["overflowing"], "of", report["projects"],
+          "Students to move:", report["students_to_move"], "of", report["students"],
+          "Projects nobody ranked in their first " + str(report["depth"]) + ":", report["unlisted"], file=file)
+    print("  Top " + str(len(report["hottest"])) + " projects hold " + format(report["top_share"], ".1%")
+          + " of first choices", file=file)
+    for project, first_choices, total, target in report["hottest"]:
+        print("  Project", project, "first choices:", first_choices, "in first " + str(report["depth"]) + ":", total,
+              "target:", target, file=file)
+
+
+def write_demand_index(demand: np.ndarray, projects: dict, filename: str, registry=None) -> None:
+    """
+    Write a demand index as a CSV file with a row per project and a column per preference
+
+    Parameters
+    ----------
+    demand: np.ndarray
+        Demand index from build_demand_index
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    filename: str
+        Name of the CSV file to write
+    registry: Registry
+        If provided, the registry.Registry projects are given by ID in, so they are written by label
+
+    Returns
+    -------
+    None
+    """
+    labels = list(projects) if registry is None else [registry.project_labels[project] for project in projects]
+    with open(filename, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["project"] + ["preference_" + str(rank + 1) for rank in range(demand.shape[1])] + ["total"])
+        for project, row in zip(labels, demand.tolist()):
+            writer.writerow([project] + row + [sum(row)])
+
+
+if __name__ == "__main__":
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Count how many students rank each project at each preference")
+    parser.add_argument("path_to_file", help="file name containing students")
+    parser.add_argument("--projects", type=int, nargs="+",
+                        help="project numbers to assign students to (default: every project students listed)")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="how many of each student's preferences to count")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="how many of the most demanded projects to list")
+    parser.add_argument("--capacities", metavar="FILE",
+                        help="file of lines \"project minimum maximum\" giving projects other sizes than 3 or 4 students")
+    parser.add_argument("--output", metavar="FILE", help="CSV file to write the whole demand index to")
+    args = parser.parse_args()
+    # Call helper functions to read the students and initialize projects
+    registry = Registry()
+    students = assign_students.load_students(args.path_to_file, registry=registry)
+    projects = assign_students.initalize_projects(students, registry.project_list(args.projects))
+    capacities = registry.capacities(load_capacities(args.capacities)) if args.capacities else None
+    demand = build_demand_index(students, projects, args.depth)
+    print_demand_report(demand_report(demand, projects, capacities, args.top, registry))
+    if args.output:
+        write_demand_index(demand, projects, args.output, registry)
+        print("Demand index written to", args.output)
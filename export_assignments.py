@@ -0,0 +1,273 @@
+import os
+import csv
+import json
+import tempfile
+import contextlib
+
+# Formats project assignments can be exported in, chosen by the file's extension
+FORMATS = ("txt", "csv", "jsonl", "npz")
+# Size of the buffer files are written through
+BUFFER_SIZE = 2 ** 20
+
+
+@contextlib.contextmanager
+def atomic_output(filename: str, mode: str = 'w'):
+    """
+    Helper function to open a temporary file that replaces filename once it is fully written
+
+    Readers of filename see either the old file or the new one, never half of it, and
+    filename is left untouched if writing fails.
+
+    Parameters
+    ----------
+    filename: str
+        Name of the file to write
+    mode: str
+        Mode to open the temporary file in, 'w' or 'wb'
+
+    Returns
+    -------
+    file
+        Temporary file to write to, moved to filename when the with block ends
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(filename), suffix=".tmp")
+    try:
+        # Give the file the permissions open would have, since temporary files are only readable by their owner
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temporary, 0o666 & ~umask)
+        with os.fdopen(descriptor, mode, buffering=BUFFER_SIZE, **({} if 'b' in mode else {"newline": ""})) as file:
+            yield file
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def export_format(filename: str) -> str:
+    """
+    Helper function to choose the format of a file from its extension
+
+    Parameters
+    ----------
+    filename: str
+        Name of the file
+
+    Returns
+    -------
+    str
+        One of FORMATS; files without a known extension use the txt format
+    """
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    return extension if extension in FORMATS else "txt"
+
+
+def assignment_table(students: dict, projects: dict) -> tuple:
+    """
+    Function to find each student's project and the preference they got in a single pass over the students
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+
+    Returns
+    -------
+    tuple
+        First entry is the project index of each student, in the order of students
+        Second entry is the preference each student got, where 1 is their first preference
+        and a project they didn't list counts as the preference after their last one
+    """
+    # Map each student to the index of their project
+    project_of = {student: index for index, members in enumerate(projects.values()) for student in members}
+    try:
+        student_project = list(map(project_of.__getitem__, students))
+    except KeyError as error:
+        raise ValueError(str(error) + " isn't assigned to a project") from None
+    project_list = list(projects)
+    student_rank = []
+    for preferences, index in zip(students.values(), student_project):
+        # Assigned projects are near the front of students' preferences, so searching from the front is quick
+        try:
+            student_rank.append(preferences.index(project_list[index]) + 1)
+        except ValueError:
+            student_rank.append(len(preferences) + 1)
+    return (student_project, student_rank)
+
+
+def write_text(projects: dict, file) -> None:
+    """
+    Helper function to write each project followed by its students separated by commas, one project per line
+
+    This is the format of write_project_assignments, without a newline after the last project.
+
+    Parameters
+    ----------
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+    file: file
+        File to write to
+
+    Returns
+    -------
+    None
+    """
+    file.write("\n".join(str(project) + " " + ",".join(members) for project, members in projects.items()))
+
+
+def write_csv(students: dict, projects: dict, table: tuple, file) -> None:
+    """
+    Helper function to write one row per student, in the order of students, with their project and preference
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+    table: tuple
+        Project assignments indexed by assignment_table
+    file: file
+        File to write to
+
+    Returns
+    -------
+    None
+    """
+    student_project, student_rank = table
+    project_list = list(projects)
+    writer = csv.writer(file, lineterminator="\n")
+    writer.writerow(("student", "project", "preference"))
+    writer.writerows(zip(students, [project_list[index] for index in student_project], student_rank))
+
+
+def write_jsonl(students: dict, projects: dict, table: tuple, file) -> None:
+    """
+    Helper function to write one JSON object per project with its students and their preferences,
+    followed by one JSON object per student with their project and preference
+
+    Each project's students are listed in the order of students.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+    table: tuple
+        Project assignments indexed by assignment_table
+    file: file
+        File to write to
+
+    Returns
+    -------
+    None
+    """
+    student_project, student_rank = table
+    encode = json.JSONEncoder(default=str).encode
+    # Encode each student's name and each project once, and put the lines together from the encoded parts
+    labels = [encode(project) for project in projects]
+    student_lines = []
+    # Collect each project's students and their preferences while writing the students' lines
+    project_names = [[] for project in labels]
+    project_ranks = [[] for project in labels]
+    encode_name = json.encoder.encode_basestring_ascii
+    for student, project, rank in zip(students, student_project, student_rank):
+        name = encode_name(str(student))
+        student_lines.append('{"student": ' + name + ', "project": ' + labels[project]
+                             + ', "preference": ' + str(rank) + '}')
+        project_names[project].append(name)
+        project_ranks[project].append(str(rank))
+    lines = ['{"project": ' + label + ', "students": [' + ", ".join(names) + '], "preferences": ['
+             + ", ".join(ranks) + ']}' for label, names, ranks in zip(labels, project_names, project_ranks)]
+    lines.extend(student_lines)
+    lines.append("")
+    file.write("\n".join(lines))
+
+
+def write_npz(students: dict, projects: dict, table: tuple, file) -> None:
+    """
+    Helper function to write the project assignments as NumPy arrays
+
+    The file holds student_project (project index of each student), student_rank (preference each
+    student got), project_offsets and project_students (the student indexes of project i are
+    project_students[project_offsets[i]:project_offsets[i + 1]], in the order of students), and the
+    students and projects the indexes refer to.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+    table: tuple
+        Project assignments indexed by assignment_table
+    file: file
+        Binary file to write to
+
+    Returns
+    -------
+    None
+    """
+    # Imported here so numpy is only needed when used
+    import numpy as np
+    student_project = np.array(table[0], dtype=np.int32)
+    # Group the students by project, keeping the order of students within each project
+    offsets = np.zeros(len(projects) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(student_project, minlength=len(projects)), out=offsets[1:])
+    np.savez(file, student_project=student_project, student_rank=np.array(table[1], dtype=np.int32),
+             project_offsets=offsets,
+             project_students=np.argsort(student_project, kind="stable").astype(np.int32),
+             students=np.array([str(student) for student in students]), projects=np.array(list(projects)))
+
+
+def export_assignments(students: dict, projects: dict, filename: str, format: str = None, registry=None) -> None:
+    """
+    Function to write project assignments to a file in one of FORMATS
+
+    The file is built in memory and written through a large buffer, then moved into place.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+    filename: str
+        Name of the file that will contain the project assignments
+    format: str
+        One of FORMATS; chosen from the extension of filename if not provided
+    registry: Registry
+        If provided, the registry.Registry students and projects are given by ID in, so they are
+        written with their names and labels
+
+    Returns
+    -------
+    None
+    """
+    format = format or export_format(filename)
+    if format not in FORMATS:
+        raise ValueError("unknown format " + repr(format) + "; use one of " + ", ".join(FORMATS))
+    if format == "txt":
+        # The text format only has the projects' students, so students aren't needed
+        with atomic_output(filename) as file:
+            write_text(projects if registry is None else registry.export_projects(projects), file)
+        return
+    table = assignment_table(students, projects)
+    if registry is not None:
+        # Preferences are found by ID, then only the names and labels are written
+        students = registry.student_names(students)
+        projects = registry.export_projects(projects)
+    if format == "npz":
+        with atomic_output(filename, 'wb') as file:
+            write_npz(students, projects, table, file)
+    elif format == "csv":
+        with atomic_output(filename) as file:
+            write_csv(students, projects, table, file)
+    else:
+        with atomic_output(filename) as file:
+            write_jsonl(students, projects, table, file)
+
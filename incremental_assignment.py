@@ -0,0 +1,274 @@
+from roster import Roster, PreferenceRanks
+
+# Number of each student's first preferences indexed by project, to find who to move into a project left short
+CANDIDATE_DEPTH = 8
+
+
+class IncrementalAssignment:
+    """
+    Project assignments that are repaired after students join, drop or change their preferences
+
+    Built once from the projects and sum of preferences returned by assign_students. Each change
+    only moves the students it affects, and every project is kept at 3 or 4 students:
+    students that join take their most prefered project with fewer than 4 students, or the least
+    loaded project if every project they listed has 4 students, students that
+    change their preferences move to a more prefered project with fewer than 4 students if their
+    project can spare them, and a project left with fewer than 3 students by students dropping
+    takes the student from a project of 4 who prefers it the most.
+
+    Each project keeps the students who rank it within their first CANDIDATE_DEPTH preferences,
+    and projects of 4 are kept grouped by the roster, so repairing a project only looks at the
+    students that could move into it, however many students there are.
+    """
+
+    def __init__(self, students: dict, projects: dict, sum_preferences: int = None):
+        self.students = students
+        self.roster = Roster(projects)
+        self.ranks = PreferenceRanks(students)
+        # Map each student to the project they are assigned to
+        self.project_of = {student: project for project in self.roster for student in self.roster.students(project)}
+        if sum_preferences is None:
+            # Sum each student's preference for their project
+            sum_preferences = sum(self.ranks.rank(student, project) + 1 for student, project in self.project_of.items())
+        self.sum_preferences = sum_preferences
+        # Map each project to the students ranking it within their first CANDIDATE_DEPTH preferences and their rank
+        self.candidates = {project: {} for project in self.roster}
+        for student in self.project_of:
+            self.index_student(student)
+        # Projects whose students changed since the last call to apply
+        self.changed_projects = set()
+
+    def index_student(self, student) -> None:
+        """
+        Add student to the candidates of the projects in their first CANDIDATE_DEPTH preferences
+        """
+        for rank, project in enumerate(self.students[student][:CANDIDATE_DEPTH]):
+            candidates = self.candidates.get(project)
+            # Projects that aren't being assigned have no candidates, and only a student's first rank is kept
+            if candidates is not None and student not in candidates:
+                candidates[student] = rank
+
+    def unindex_student(self, student) -> None:
+        """
+        Remove student from the candidates of the projects in their first CANDIDATE_DEPTH preferences
+        """
+        for project in self.students[student][:CANDIDATE_DEPTH]:
+            candidates = self.candidates.get(project)
+            if candidates is not None:
+                candidates.pop(student, None)
+
+    def open_project(self, student, limit: int = None):
+        """
+        Most prefered project of student with fewer than 4 students, checking their first limit preferences
+
+        Returns None if there is no such project.
+        """
+        preferences = self.students[student]
+        for rank, project in enumerate(preferences[:limit] if limit is not None else preferences):
+            # Skip projects that aren't being assigned
+            if project in self.roster and self.roster.size(project) < 4:
+                self.ranks.record(student, project, rank)
+                return project
+        return None
+
+    def move(self, student, project) -> None:
+        """
+        Move student to project, updating sum_preferences by their change in preference
+        """
+        current = self.project_of[student]
+        self.sum_preferences += self.ranks.rank(student, project) - self.ranks.rank(student, current)
+        self.roster.move(student, current, project)
+        self.project_of[student] = project
+        self.changed_projects.update((current, project))
+
+    def add_student(self, student, preferences: list) -> None:
+        """
+        Add a student who joined late to their most prefered project with fewer than 4 students
+        """
+        if student in self.project_of:
+            raise ValueError(str(student) + " is already assigned to a project")
+        self.students[student] = preferences
+        self.index_student(student)
+        # Use the least loaded project if every project the student listed has 4 students
+        project = self.open_project(student)
+        if project is None:
+            project = self.roster.least_loaded(4)
+        # Every project has 4 students, so another student can't be added
+        if project is None:
+            raise ValueError("every project already has 4 students, so " + str(student) + " can't be added")
+        self.roster.add(project, student)
+        self.project_of[student] = project
+        self.changed_projects.add(project)
+        self.sum_preferences += self.ranks.rank(student, project) + 1
+
+    def remove_student(self, student) -> None:
+        """
+        Remove a student who dropped from their project
+
+        The project may be left with fewer than 3 students until repair is called.
+        """
+        project = self.project_of.pop(student)
+        self.sum_preferences -= self.ranks.rank(student, project) + 1
+        self.roster.remove(project, student)
+        self.changed_projects.add(project)
+        self.ranks.forget(student)
+        self.unindex_student(student)
+        del self.students[student]
+
+    def change_preferences(self, student, preferences: list) -> None:
+        """
+        Replace a student's preferences, moving them to a more prefered project if theirs can spare them
+        """
+        project = self.project_of[student]
+        # Replace the student's preference for their project in the sum of preferences
+        self.sum_preferences -= self.ranks.rank(student, project)
+        self.ranks.forget(student)
+        self.unindex_student(student)
+        self.students[student] = preferences
+        self.index_student(student)
+        rank = self.ranks.rank(student, project)
+        self.sum_preferences += rank
+        # Move the student if their project has 4 students and they prefer a project with fewer than 4
+        if self.roster.size(project) == 4:
+            better_project = self.open_project(student, rank)
+            if better_project is not None:
+                self.move(student, better_project)
+
+    def donor(self, project):
+        """
+        Student in a project of 4 who ranks project the highest, or None if no project has 4 students
+
+        Students who rank project within their first CANDIDATE_DEPTH preferences are checked from the
+        highest rank. If none of them is in a project of 4, the student of the first project of 4 who
+        ranks project the highest is taken, where a project they didn't list is ranked after all of
+        their preferences.
+        """
+        candidates = self.candidates.get(project, {})
+        # Students in projects of 4 can move without leaving their project short
+        for student in sorted(candidates, key=candidates.__getitem__):
+            if self.roster.size(self.project_of[student]) == 4:
+                self.ranks.record(student, project, candidates[student])
+                return student
+        donor_project = next(iter(self.roster.group(4)), None)
+        if donor_project is None:
+            return None
+        return min(self.roster.students(donor_project), key=lambda student: self.ranks.rank(student, project))
+
+    def fill_project(self, project) -> None:
+        """
+        Move students into project until it has 3 students, taking each from a project of 4
+        """
+        while self.roster.size(project) < 3:
+            student = self.donor(project)
+            if student is None:
+                raise ValueError("there are too few students left to give every project 3 students")
+            self.move(student, project)
+
+    def repair(self, projects: list) -> None:
+        """
+        Fill any of the projects given that were left with fewer than 3 students
+        """
+        for project in projects:
+            if self.roster.size(project) < 3:
+                self.fill_project(project)
+
+    def apply(self, added: dict = None, removed: list = None, changed: dict = None) -> tuple:
+        """
+        Apply students joining, dropping and changing their preferences, and repair the affected projects
+
+        Parameters
+        ----------
+        added: dict
+            Dictionary of students that joined mapped to their preferences
+        removed: list
+            Students that dropped
+        changed: dict
+            Dictionary of students mapped to their new preferences
+
+        Returns
+        -------
+        tuple
+            First entry is dictionary of the projects whose students changed mapped to their students
+            Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+        """
+        added = added or {}
+        removed = removed or []
+        changed = changed or {}
+        # Check the whole change before any student is moved, so a change that can't be made changes nothing
+        self.check_changes(added, removed, changed)
+        self.changed_projects = set()
+        # Remove students that dropped first so their places can be taken
+        affected = [self.project_of[student] for student in removed]
+        for student in removed:
+            self.remove_student(student)
+        for student, preferences in changed.items():
+            self.change_preferences(student, preferences)
+        for student, preferences in added.items():
+            self.add_student(student, preferences)
+        # Fill projects students dropped from that were left with fewer than 3 students
+        self.repair(affected)
+        return ({project: self.roster.students(project) for project in self.changed_projects}, self.sum_preferences)
+
+    def check_changes(self, added: dict, removed: list, changed: dict) -> None:
+        """
+        Raise ValueError if the students joining, dropping and changing their preferences can't all be applied
+        """
+        if len(set(removed)) != len(removed):
+            raise ValueError("a student can only drop once")
+        dropped = set(removed)
+        for student in removed:
+            if student not in self.project_of:
+                raise ValueError(str(student) + " is not assigned to a project")
+        for student in changed:
+            if student not in self.project_of:
+                raise ValueError(str(student) + " is not assigned to a project")
+            if student in dropped:
+                raise ValueError(str(student) + " can't both drop and change their preferences")
+        for student in added:
+            if student in self.project_of:
+                raise ValueError(str(student) + " is already assigned to a project")
+        for student, preferences in list(changed.items()) + list(added.items()):
+            if not preferences:
+                raise ValueError("preferences are needed to add or change " + str(student))
+        # Check there are between 3 and 4 students per project once the changes are made
+        num_students = len(self.project_of) + len(added) - len(removed)
+        if not 3 * len(self.roster) <= num_students <= 4 * len(self.roster):
+            raise ValueError(str(num_students) + " students can't be assigned to " + str(len(self.roster))
+                             + " projects of 3 or 4 students; call assign_students again")
+
+    def to_projects(self) -> dict:
+        """
+        Projects dictionary mapping each project to the students assigned to it
+        """
+        return self.roster.to_projects({})
+
+
+def reassign_students(students: dict, projects: dict, sum_preferences: int = None, added: dict = None,
+                      removed: list = None, changed: dict = None) -> tuple:
+    """
+    Function to repair project assignments after students join, drop or change their preferences
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences, updated with the changes
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project, as returned by assign_students
+    sum_preferences: int
+        Sum of preferences returned with projects, or None to sum each student's preference for their project
+    added: dict
+        Dictionary of students that joined mapped to their preferences
+    removed: list
+        Students that dropped
+    changed: dict
+        Dictionary of students mapped to their new preferences
+
+    Returns
+    -------
+    tuple
+        First entry is projects dictionary where each project has been assigned 3 or 4 students
+        Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    """
+    assignment = IncrementalAssignment(students, projects, sum_preferences)
+    assignment.apply(added, removed, changed)
+    return (assignment.to_projects(), assignment.sum_preferences)
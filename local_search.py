@@ -0,0 +1,224 @@
+import time
+from operator import itemgetter
+from roster import Roster
+from capacities import project_capacities
+
+# Number of students whose swaps and moves are found before the best of them are made
+BATCH_SIZE = 256
+
+
+def preference_rank(preferences: list, project) -> int:
+    """
+    Helper function to find the position of a project in a student's preferences
+
+    Parameters
+    ----------
+    preferences: list
+        The student's preferences
+    project: int
+        The project
+
+    Returns
+    -------
+    int
+        Position of the project where 0 is the first preference, or the number of
+        preferences if the student didn't list it
+    """
+    try:
+        return preferences.index(project)
+    except ValueError:
+        return len(preferences)
+
+
+def preference_positions(students: dict, student, depth: int) -> dict:
+    """
+    Helper function to map a student's first depth preferences to their positions
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    student: str
+        The student
+    depth: int
+        Number of the student's first preferences to map
+
+    Returns
+    -------
+    dict
+        Projects mapped to their position in the student's preferences, where 0 is the first preference
+    """
+    return {project: rank for rank, project in enumerate(students[student][:depth])}
+
+
+def find_improvements(students: dict, student, roster: Roster, positions: dict, depth: int, project_of: dict,
+                      rank_of: dict, minimums: dict, maximums: dict) -> list:
+    """
+    Helper function to find the swaps and moves of a student that lower the sum of preferences
+
+    Only the projects a student ranks above their own are looked at. A student can move to one if it is
+    below its most students and their project is above its fewest, or swap with any of its students who
+    loses fewer places in their preferences than the student gains. Each other student's position of
+    the student's project is looked up in the positions of their first preferences, which are mapped
+    the first time they are needed.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    student: str
+        Student to find swaps and moves for
+    roster: Roster
+        Students assigned to each project
+    positions: dict
+        Students mapped to the positions of their first preferences from preference_positions, filled in as needed
+    depth: int
+        Number of preferences past a student's own project mapped in positions
+    project_of: dict
+        Students mapped to their project
+    rank_of: dict
+        Students mapped to their preference for their project, where 0 is their first preference
+    minimums: dict
+        Projects mapped to the fewest students they can be assigned
+    maximums: dict
+        Projects mapped to the most students they can be assigned
+
+    Returns
+    -------
+    list
+        Change in the sum of preferences, then the student, their project and their preference for
+        the other project, then the other student (None for a move), the other project and the other
+        student's preference for the student's project, of every swap and move found
+    """
+    improvements = []
+    project = project_of[student]
+    rank = rank_of[student]
+    can_leave = roster.size(project) > minimums[project]
+    for other_rank, other_project in enumerate(students[student][:rank]):
+        # Projects students listed that aren't being assigned are skipped
+        if other_project not in maximums:
+            continue
+        gain = rank - other_rank
+        if can_leave and roster.size(other_project) < maximums[other_project]:
+            improvements.append((-gain, student, project, other_rank, None, other_project, None))
+            continue
+        for other in roster.members[other_project]:
+            mapped = positions.get(other)
+            if mapped is None:
+                mapped = positions[other] = preference_positions(students, other, rank_of[other] + 1 + depth)
+            new_rank = mapped.get(project)
+            if new_rank is None:
+                # Projects past the mapped preferences lose the other student at least as much as the student gains
+                if len(mapped) - rank_of[other] >= gain:
+                    continue
+                # The other student's project got worse since they were mapped, so search all of their preferences
+                new_rank = preference_rank(students[other], project)
+            # The other student's change in preference if they take the student's project
+            loss = new_rank - rank_of[other]
+            if loss < gain:
+                improvements.append((loss - gain, student, project, other_rank, other, other_project, new_rank))
+    return improvements
+
+
+def improve_assignment(students: dict, projects: dict, sum_preferences: int = None, time_limit: float = None,
+                       max_iterations: int = None, capacities=None, stats: dict = None) -> tuple:
+    """
+    Function to lower the sum of preferences of project assignments by swapping and moving students
+
+    Students are looked at in batches, from the furthest from their first preference to the closest.
+    Every swap and move that lowers the sum of preferences is found for the batch, looking up other
+    students' positions of projects in a map of their first preferences. They are then made from the
+    largest improvement down, skipping those whose students were already moved in the batch. Each one
+    changes the sum by the difference in the students' preferences, so the sum is never added up again. Passes over the
+    students are repeated until none improves or the time or iterations run out. Since only
+    improvements are made, the assignment when they run out is the best one found. Swaps keep the
+    number of students of each project, and moves keep every project between its fewest and most
+    students, so every project still has 3 or 4 students.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to them, as returned by assign_students
+    sum_preferences: int
+        Sum of preferences of projects; added up from projects if not provided
+    time_limit: float
+        If provided, the most seconds to spend, checked before looking at each student
+    max_iterations: int
+        If provided, the most students to look for swaps and moves for, counting a student once per pass
+    capacities: tuple or dict
+        Fewest and most students of every project as in capacities.project_capacities;
+        every project has 3 or 4 students if not provided
+    stats: dict
+        If provided, the number of swaps, moves, iterations and passes made and whether the search
+        stopped because nothing improved, under converged, are stored in it
+
+    Returns
+    -------
+    tuple
+        First entry is projects dictionary with the improved project assignments
+        Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    """
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    minimums, maximums = project_capacities(projects, capacities)
+    roster = Roster(projects)
+    project_of = {student: project for project in roster for student in roster.members[project]}
+    rank_of = {student: preference_rank(students[student], project) for student, project in project_of.items()}
+    if sum_preferences is None:
+        sum_preferences = sum(rank_of.values()) + len(rank_of)
+    # A student gains at most the preference of the furthest student from their first preference,
+    # so mapping that many preferences past each student's project answers almost every lookup
+    depth = max(rank_of.values(), default=0)
+    positions = {}
+    counts = {"swaps": 0, "moves": 0, "iterations": 0, "passes": 0, "converged": False}
+    out_of_budget = False
+    while not out_of_budget:
+        counts["passes"] += 1
+        improved = False
+        # Students already in their first preference can't gain anything
+        order = sorted((student for student, rank in rank_of.items() if rank > 0), key=rank_of.get, reverse=True)
+        for start in range(0, len(order), BATCH_SIZE):
+            improvements = []
+            for student in order[start:start + BATCH_SIZE]:
+                # Stop looking once the time or iterations run out, still making the improvements found
+                if ((deadline is not None and time.perf_counter() >= deadline)
+                        or (max_iterations is not None and counts["iterations"] >= max_iterations)):
+                    out_of_budget = True
+                    break
+                counts["iterations"] += 1
+                improvements.extend(find_improvements(students, student, roster, positions, depth, project_of,
+                                                      rank_of, minimums, maximums))
+            # Make the largest improvements first
+            improvements.sort(key=itemgetter(0))
+            for change, student, project, new_rank, other, other_project, other_new_rank in improvements:
+                # Skip swaps and moves whose students were already moved by a larger improvement
+                if project_of[student] != project:
+                    continue
+                if other is None:
+                    # A move is only made while the projects can still give and take a student
+                    if roster.size(project) <= minimums[project]:
+                        continue
+                    if roster.size(other_project) >= maximums[other_project]:
+                        continue
+                    counts["moves"] += 1
+                else:
+                    if project_of[other] != other_project:
+                        continue
+                    roster.move(other, other_project, project)
+                    project_of[other] = project
+                    rank_of[other] = other_new_rank
+                    counts["swaps"] += 1
+                roster.move(student, project, other_project)
+                project_of[student] = other_project
+                rank_of[student] = new_rank
+                sum_preferences += change
+                improved = True
+            if out_of_budget:
+                break
+        if not improved and not out_of_budget:
+            counts["converged"] = True
+            break
+    if stats is not None:
+        stats.update(counts)
+    return (roster.to_projects(projects), sum_preferences)
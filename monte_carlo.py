@@ -0,0 +1,268 @@
+import os
+import sys
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import assign_students
+from capacities import project_capacities, capacity_error, load_capacities
+
+# Percentiles of the random sums of preferences that are reported
+PERCENTILES = (5, 25, 50, 75, 95)
+# Number of chunks of trials each worker process is given, so workers that finish early take more
+CHUNKS_PER_WORKER = 4
+
+# Students mapped to their preferences as project indexes, set in each worker process by attach_preferences
+STUDENTS = None
+# Number of projects, set in each worker process by attach_preferences
+NUM_PROJECTS = 0
+# Project indexes mapped to their (minimum, maximum) number of students, set in each worker process by attach_preferences
+CAPACITIES = None
+
+
+def share_preferences(students: dict, projects: dict) -> tuple:
+    """
+    Helper function to copy students' preferences as project indexes into shared memory
+
+    The preferences are stored one student after another, with the offset where each student's
+    preferences start before them, so students may list different numbers of projects.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+
+    Returns
+    -------
+    tuple
+        First entry is the shared memory block, which the caller must close and unlink
+        Second entry is the number of students
+        Third entry is the total number of preferences of all students
+    """
+    # Map each project label to its index
+    project_index = {project: index for index, project in enumerate(projects)}
+    rows = [[project_index[project] for project in preferences] for preferences in students.values()]
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    num_values = int(offsets[-1])
+    # Place the offsets followed by the preferences in one block
+    block = shared_memory.SharedMemory(create=True, size=max(offsets.nbytes + 4 * num_values, 1))
+    np.ndarray(offsets.shape, dtype=np.int64, buffer=block.buf)[:] = offsets
+    values = np.ndarray((num_values,), dtype=np.int32, buffer=block.buf, offset=offsets.nbytes)
+    values[:] = [project for row in rows for project in row]
+    return (block, len(rows), num_values)
+
+
+def attach_preferences(name: str, num_students: int, num_values: int, num_projects: int,
+                       capacities: dict = None) -> None:
+    """
+    Helper function to read the preferences in shared memory into the worker process running the trials
+
+    Parameters
+    ----------
+    name: str
+        Name of the shared memory block created by share_preferences
+    num_students: int
+        Number of students
+    num_values: int
+        Total number of preferences of all students
+    num_projects: int
+        Number of projects
+    capacities: dict
+        Project indexes mapped to their (minimum, maximum) number of students;
+        every project has 3 or 4 students if not provided
+
+    Returns
+    -------
+    None
+    """
+    global STUDENTS, NUM_PROJECTS, CAPACITIES
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        offsets = np.ndarray((num_students + 1,), dtype=np.int64, buffer=block.buf).tolist()
+        values = np.ndarray((num_values,), dtype=np.int32, buffer=block.buf, offset=8 * (num_students + 1)).tolist()
+    finally:
+        block.close()
+    # Students are numbered, and their preferences are project indexes
+    STUDENTS = {student: values[offsets[student]:offsets[student + 1]] for student in range(num_students)}
+    NUM_PROJECTS = num_projects
+    CAPACITIES = capacities
+
+
+def run_trials(seeds: list) -> list:
+    """
+    Function to randomly assign the students in the worker process to projects once per seed
+
+    Parameters
+    ----------
+    seeds: list
+        Seed of the random number generator for each trial
+
+    Returns
+    -------
+    list
+        Sum of preferences of each trial
+    """
+    sums = []
+    for seed in seeds:
+        random.seed(seed)
+        projects = {project: [] for project in range(NUM_PROJECTS)}
+        sums.append(assign_students.randomly_assign_students(STUDENTS, projects, capacities=CAPACITIES)[1])
+    return sums
+
+
+def run_monte_carlo(students: dict, projects: dict, trials: int = 1000, workers: int = None,
+                    seed: int = 0, capacities=None) -> np.ndarray:
+    """
+    Function to randomly assign students to projects many times in parallel
+
+    The preferences are copied into shared memory once, and each worker process reads them from
+    there once, so the students are neither re-read from disk nor sent with every trial. Each trial
+    has its own seed derived from seed, so the results don't depend on the number of workers.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    trials: int
+        Number of random assignments
+    workers: int
+        Number of worker processes; defaults to the number of CPUs
+    seed: int
+        Seed the seed of each trial is derived from
+    capacities: tuple or dict
+        Fewest and most students of every project as in capacities.project_capacities, so the
+        random assignments solve the same problem as the proposed algorithm; every project has
+        3 or 4 students if not provided
+
+    Returns
+    -------
+    np.ndarray
+        Sum of preferences of each trial
+
+    Raises
+    ------
+    ValueError
+        If trials is less than 1, or the projects' capacities can't fit the students
+    """
+    if trials < 1:
+        raise ValueError("at least one trial is needed, not " + str(trials))
+    # Check the projects can fit the students before any trial is run
+    minimums, maximums = project_capacities(projects, capacities)
+    error = capacity_error(len(students), minimums, maximums)
+    if error is not None:
+        raise ValueError(error)
+    # Workers number projects by their index, so their capacities are sent by index too
+    capacities = {index: (minimums[project], maximums[project]) for index, project in enumerate(projects)}
+    seeds = np.random.SeedSequence(seed).generate_state(trials).tolist()
+    workers = workers or os.cpu_count() or 1
+    block, num_students, num_values = share_preferences(students, projects)
+    try:
+        # Run every trial in this process, which avoids starting a pool
+        if workers == 1:
+            attach_preferences(block.name, num_students, num_values, len(projects), capacities)
+            return np.array(run_trials(seeds))
+        # Split the trials into chunks so each worker is sent a few lists of seeds
+        num_chunks = min(trials, workers * CHUNKS_PER_WORKER)
+        chunks = [seeds[chunk::num_chunks] for chunk in range(num_chunks)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_preferences,
+                                 initargs=(block.name, num_students, num_values, len(projects),
+                                           capacities)) as executor:
+            results = list(executor.map(run_trials, chunks))
+        # Put the sums back in the order of the trials
+        sums = np.empty(trials, dtype=np.int64)
+        for chunk, result in enumerate(results):
+            sums[chunk::num_chunks] = result
+        return sums
+    finally:
+        block.close()
+        block.unlink()
+
+
+def summarize_trials(sums: np.ndarray, algorithm_sum_preferences: int = None) -> dict:
+    """
+    Helper function to describe the distribution of the random sums of preferences
+
+    Parameters
+    ----------
+    sums: np.ndarray
+        Sum of preferences of each trial
+    algorithm_sum_preferences: int
+        If provided, the sum of preferences of the proposed algorithm to place in the distribution
+
+    Returns
+    -------
+    dict
+        Number of trials, mean, standard deviation, minimum, maximum and percentiles of the sums.
+        With algorithm_sum_preferences, also the percentage of trials that were at least as good and
+        how many standard deviations below the mean it is
+    """
+    sums = np.asarray(sums)
+    summary = {"trials": len(sums), "mean": float(sums.mean()), "std": float(sums.std()),
+               "min": int(sums.min()), "max": int(sums.max())}
+    for percentile, value in zip(PERCENTILES, np.percentile(sums, PERCENTILES)):
+        summary["p" + str(percentile)] = float(value)
+    if algorithm_sum_preferences is not None:
+        summary["algorithm"] = algorithm_sum_preferences
+        # Lower sums are better, so count the trials that did as well as the proposed algorithm
+        summary["percent_at_least_as_good"] = float(100 * np.mean(sums <= algorithm_sum_preferences))
+        summary["z_score"] = float((algorithm_sum_preferences - sums.mean()) / sums.std()) if sums.std() > 0 else 0.0
+    return summary
+
+
+def print_trials_summary(summary: dict, file=sys.stdout) -> None:
+    """
+    Helper function to print the summary returned by summarize_trials
+
+    Parameters
+    ----------
+    summary: dict
+        Summary returned by summarize_trials
+    file: file
+        File to print the summary to
+
+    Returns
+    -------
+    None
+    """
+    print("Random Algorithm over", summary["trials"], "trials: mean", format(summary["mean"], ".1f"),
+          "std", format(summary["std"], ".1f"), "min", summary["min"], "max", summary["max"], file=file)
+    print("Percentiles:", ", ".join("p" + str(percentile) + " " + format(summary["p" + str(percentile)], ".1f")
+                                    for percentile in PERCENTILES), file=file)
+    if "algorithm" in summary:
+        print("Proposed Algorithm:", summary["algorithm"], "is", format(-summary["z_score"], ".1f"),
+              "standard deviations below the random mean;", format(summary["percent_at_least_as_good"], ".2f")
+              + "% of random trials did as well", file=file)
+
+
+if __name__ == "__main__":
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Compare the proposed algorithm to many random assignments")
+    parser.add_argument("path_to_file", help="file name containing students")
+    parser.add_argument("--trials", type=int, default=1000, help="number of random assignments")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPUs)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random assignments")
+    parser.add_argument("--capacities", metavar="FILE",
+                        help="file of lines \"project minimum maximum\" giving projects other sizes than 3 or 4 students")
+    args = parser.parse_args()
+    if args.trials < 1:
+        parser.error("--trials must be at least 1")
+    # Call helper function to create dictionary of students mapped to their preferences
+    students = assign_students.load_students(args.path_to_file)
+    capacities = load_capacities(args.capacities) if args.capacities else None
+    # Run the proposed algorithm once to place it in the distribution
+    projects = assign_students.initalize_projects(students)
+    result = assign_students.assign_students(students, projects, capacities=capacities)
+    if result is None:
+        print("Can't assign students to projects:",
+              capacity_error(len(students), *project_capacities(projects, capacities)), file=sys.stderr)
+        sys.exit(1)
+    # Randomly assign students to projects many times, with the same capacities
+    sums = run_monte_carlo(students, assign_students.initalize_projects(students), args.trials, args.workers,
+                           args.seed, capacities)
+    print_trials_summary(summarize_trials(sums, result[1]))
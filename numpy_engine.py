@@ -0,0 +1,333 @@
+import numpy as np
+from preference_matrix import build_preference_matrix
+from capacities import DEFAULT_CAPACITY, project_capacities, capacity_error, solve_targets
+
+# Projects with at least this many students search for the next preference with an opening using
+# vectorized lookups. Smaller projects are cheaper to scan one student at a time
+VECTORIZE_SIZE = 32
+
+
+def initial_assignment_matrix(preferences: np.ndarray, num_projects: int) -> tuple:
+    """
+    Helper function to assign every student to their first preference at once
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    num_projects: int
+        How many projects there are
+
+    Returns
+    -------
+    tuple
+        First entry is the array mapping each student to the project they are assigned to
+        Second entry is the array holding the number of students assigned to each project
+        Third entry is the list of students assigned to each project in the order they were assigned
+    """
+    # Every student starts in their first preference
+    assignment = preferences[:, 0].astype(np.intp)
+    # Count the students assigned to each project
+    counts = np.bincount(assignment, minlength=num_projects)
+    # Group students by project while keeping them in the order they were read in
+    order = np.argsort(assignment, kind='stable')
+    rosters = [members.tolist() for members in np.split(order, np.cumsum(counts)[:-1])]
+    return (assignment, counts, rosters)
+
+
+def gather_preferences(preferences: np.ndarray, members: list, depth: int) -> dict:
+    """
+    Helper function to look up the first depth preferences of a group of students at once
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    members: list
+        Students to look up
+    depth: int
+        How many preferences to look up for each student
+
+    Returns
+    -------
+    dict
+        Students mapped to the list of their first depth preferences
+    """
+    # Gather the rows of all students in one indexing operation
+    rows = preferences[np.asarray(members, dtype=np.intp), :depth].tolist()
+    return dict(zip(members, rows))
+
+
+def first_open_preferences(preferences: np.ndarray, rosters: list, sorted_projects: list, counts: np.ndarray,
+                            targets: np.ndarray, depth: int) -> list:
+    """
+    Helper function to find where each project's scan for openings can start, for all projects at once
+
+    Projects only fill up while students move out of projects with too many students, so a
+    preference where no student in a project has an opening before any student moves will not
+    have one later either. The scan of each project can therefore start at the first preference
+    where any of its students has an opening.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    rosters: list
+        List holding the students assigned to each project in the order they were assigned
+    sorted_projects: list
+        Projects to find the first preference with an opening for
+    counts: np.ndarray
+        Array holding the number of students assigned to each project
+    targets: np.ndarray
+        Array holding the number of students each project should be assigned
+    depth: int
+        How many preferences to look through
+
+    Returns
+    -------
+    list
+        First preference with an opening for each project in sorted_projects, or depth if there is none before it
+    """
+    # Put the students of all projects in one array, remembering where each project's students start
+    lengths = [len(rosters[project]) for project in sorted_projects]
+    members = np.asarray([student for project in sorted_projects for student in rosters[project]], dtype=np.intp)
+    starts = np.cumsum([0] + lengths[:-1])
+    # Find which projects from every student's second preference on have an opening
+    next_preferences = preferences[members, 1:depth]
+    has_opening = counts[next_preferences] < targets[next_preferences]
+    # Find each student's first preference with an opening
+    first_opening = np.where(has_opening.any(axis=1), has_opening.argmax(axis=1) + 1, depth)
+    # The scan of a project starts at the earliest first opening of its students
+    return np.minimum.reduceat(first_opening, starts).tolist()
+
+
+def next_open_preference(preferences: np.ndarray, members: np.ndarray, counts: np.ndarray, targets: np.ndarray,
+                         project: int, num_preference: int) -> tuple:
+    """
+    Helper function to find the next preference at which a student in a project can move
+
+    Looks up blocks of preferences of every student in the project at once and returns the
+    first preference at or after num_preference where at least one student's project has an
+    opening. Scanning the project at an earlier preference would not move anyone.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    members: np.ndarray
+        Students assigned to the project in the order they were assigned
+    counts: np.ndarray
+        Array holding the number of students assigned to each project
+    targets: np.ndarray
+        Array holding the number of students each project should be assigned
+    project: int
+        Index of the project the students are assigned to
+    num_preference: int
+        First preference to check
+
+    Returns
+    -------
+    tuple
+        First entry is the preference at which a student can move
+        Second entry is the array of every student's project at that preference
+        Third entry is the list of positions of students whose project at that preference has an opening
+    """
+    num_ranks = preferences.shape[1]
+    # Number of preferences to look up at once, doubled each time no opening is found
+    width = 4
+    while num_preference < num_ranks:
+        # Look up the next block of preferences of every student in the project
+        block = preferences[members, num_preference:num_preference + width]
+        # Find which of those projects have an opening
+        has_opening = counts[block] < targets[block]
+        # Find the first preference where any student's project has an opening
+        open_preferences = np.flatnonzero(has_opening.any(axis=0))
+        if len(open_preferences) > 0:
+            column = open_preferences[0]
+            next_preferences = block[:, column]
+            candidates = np.flatnonzero(has_opening[:, column])
+            return (num_preference + int(column), next_preferences.tolist(), candidates.tolist())
+        num_preference += block.shape[1]
+        width *= 2
+    # Students ran out of preferences without finding a project with an opening
+    raise IndexError("students in project " + str(project) + " have no preference with an opening")
+
+
+def assign_students_projects_matrix(preferences: np.ndarray, assignment: np.ndarray, counts: np.ndarray,
+                                    rosters: list, sorted_projects: list, targets: np.ndarray,
+                                    sum_preferences: int) -> int:
+    """
+    Helper function to move students out of projects with too many students on the preference matrix
+
+    Behaves like assign_students.assign_students_projects, but students and projects are integers
+    and the students whose next preference has an opening are found with vectorized lookups, so
+    only those students are visited one at a time and preferences where nobody can move are skipped.
+    The assignment, counts and rosters arguments are updated in place.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    assignment: np.ndarray
+        Array mapping each student to the project they are assigned to
+    counts: np.ndarray
+        Array holding the number of students assigned to each project
+    rosters: list
+        List holding the students assigned to each project in the order they were assigned
+    sorted_projects: list
+        Projects to check if they have too many students assigned to them, in the order to check them
+    targets: np.ndarray
+        Array holding the number of students each project should be assigned
+    sum_preferences: int
+        Sum of students preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+
+    Returns
+    -------
+    int
+        sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    """
+    num_ranks = preferences.shape[1]
+    # Keep a list of the counts as well, since single elements of lists are faster to read and write
+    sizes = counts.tolist()
+    limits = targets.tolist()
+    # Only projects with more students than allowed need students moved out of them
+    overfull = [project for project in sorted_projects if sizes[project] > limits[project]]
+    if not overfull:
+        return sum_preferences
+    # Gather the first few preferences of every student in the small projects at once
+    rows = gather_preferences(preferences, [student for project in overfull
+                                            if len(rosters[project]) < VECTORIZE_SIZE
+                                            for student in rosters[project]], min(8, num_ranks))
+    # Skip the preferences where nobody in a project has an opening
+    first_preferences = first_open_preferences(preferences, rosters, overfull, counts, targets, min(32, num_ranks))
+    # For each project in the range provided that has too many students
+    for project, first_preference in zip(overfull, first_preferences):
+        # Students second preference, or the first preference where a student has an opening
+        num_preference = first_preference
+        # While the current project has more students assigned to it than it should
+        while sizes[project] > limits[project]:
+            members = rosters[project]
+            if len(members) >= VECTORIZE_SIZE:
+                # Skip ahead to the next preference where a student can move and find those students
+                num_preference, next_preferences, candidates = next_open_preference(
+                    preferences, np.asarray(members, dtype=np.intp), counts, targets, project, num_preference)
+            else:
+                try:
+                    # Get the students next preference
+                    next_preferences = [rows[student][num_preference] for student in members]
+                except (KeyError, IndexError):
+                    # Gather more preferences once the students' gathered preferences run out
+                    rows.update(gather_preferences(preferences, members, min(2 * num_preference + 2, num_ranks)))
+                    next_preferences = [rows[student][num_preference] for student in members]
+                # Only students whose next preference has an opening can move
+                candidates = [position for position, next_preference in enumerate(next_preferences)
+                              if sizes[next_preference] < limits[next_preference]]
+            # Nobody can move at this preference, so check the next one
+            if not candidates:
+                num_preference += 1
+                continue
+            # Track which students in the project's list have moved
+            moved = [False] * len(members)
+            # Iterate through the students that can move in the order they were assigned
+            for candidate in candidates:
+                next_preference = next_preferences[candidate]
+                # If the students next preference still has an opening
+                if sizes[next_preference] < limits[next_preference]:
+                    # Add current preference to sum preferences, reflecting student is getting a lower preference
+                    sum_preferences += num_preference
+                    # Move student to their most prefered project that is available
+                    sizes[next_preference] += 1
+                    sizes[project] -= 1
+                    counts[next_preference] += 1
+                    counts[project] -= 1
+                    student = members[candidate]
+                    assignment[student] = next_preference
+                    rosters[next_preference].append(student)
+                    moved[candidate] = True
+                    # Stop once the project has few enough students
+                    if sizes[project] <= limits[project]:
+                        break
+            # Keep the students that did not move in the order they were assigned
+            rosters[project] = [student for student, has_moved in zip(members, moved) if not has_moved]
+            num_preference += 1
+    return sum_preferences
+
+
+def assign_students_matrix(preferences: np.ndarray, num_projects: int, minimums: list = None,
+                           maximums: list = None) -> tuple:
+    """
+    Function to assign students to projects based on their preferences using a preference matrix
+
+    Gives the same result as assign_students.assign_students, but works on integer
+    indexes of students and projects instead of dictionaries of names.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    num_projects: int
+        How many projects there are
+    minimums: list
+        Fewest students of each project; 3 for every project if not provided
+    maximums: list
+        Most students of each project; 4 for every project if not provided
+
+    Returns
+    -------
+    tuple
+        First entry is the array mapping each student to the project they are assigned to
+        Second entry is the list holding the students assigned to each project in the order they were assigned
+        Third entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    """
+    num_students = preferences.shape[0]
+    minimums = minimums if minimums is not None else [DEFAULT_CAPACITY[0]] * num_projects
+    maximums = maximums if maximums is not None else [DEFAULT_CAPACITY[1]] * num_projects
+    # Call helper function to assign students to their first preference
+    assignment, counts, rosters = initial_assignment_matrix(preferences, num_projects)
+    # Initially, each student gets first preference, so sum of preferences is the number of students
+    sum_preferences = num_students
+    # Sort projects by the number of students assigned to them in descending order
+    sorted_projects = np.argsort(-counts, kind='stable').tolist()
+    # Choose how many students each project ends up with, giving the popular projects their most students
+    targets = solve_targets(sorted_projects, minimums, maximums, num_students)
+    targets = np.array([targets[project] for project in range(num_projects)], dtype=counts.dtype)
+    # Call helper function to move students out of projects until each project has its target number of students
+    sum_preferences = assign_students_projects_matrix(preferences, assignment, counts, rosters, sorted_projects,
+                                                      targets, sum_preferences)
+    return (assignment, rosters, sum_preferences)
+
+
+def assign_students(students: dict, projects: dict, capacities=None) -> tuple:
+    """
+    Function to assign students to projects based on their preferences using the preference matrix engine
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    capacities: tuple or dict
+        Fewest and most students of every project as in capacities.project_capacities;
+        every project has 3 or 4 students if not provided
+
+    Returns
+    -------
+    tuple
+        First entry is projects dictionary where each project has been assigned between its fewest and most students
+        Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    """
+    # If the projects' capacities can't fit the students, return None
+    minimums, maximums = project_capacities(projects, capacities)
+    if capacity_error(len(students), minimums, maximums) is not None:
+        return None
+    # Convert students and their preferences to integer matrices
+    names, project_labels, preferences = build_preference_matrix(students, projects)
+    # Call matrix engine to assign students to projects
+    assignment, rosters, sum_preferences = assign_students_matrix(
+        preferences, len(project_labels), [minimums[project] for project in project_labels],
+        [maximums[project] for project in project_labels])
+    # Add students to their projects in the order they were assigned
+    for project, roster in enumerate(rosters):
+        projects[project_labels[project]].extend(names[student] for student in roster)
+    return (projects, sum_preferences)
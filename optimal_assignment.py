@@ -0,0 +1,332 @@
+import math
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+from preference_matrix import build_preference_matrix
+
+# Number of students whose preference rows are looked at together when scanning the whole preference matrix
+CHUNK_SIZE = 2048
+
+
+def top_students(preferences: np.ndarray, num_projects: int, top_q: int) -> tuple:
+    """
+    Helper function to find the top_q students that prefer each project the most
+
+    Students who list a project near the end of their preferences are not connected to it by their own
+    top preferences, so a project few students like would otherwise have no students to be assigned.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    num_projects: int
+        How many projects there are
+    top_q: int
+        How many students to find for each project
+
+    Returns
+    -------
+    tuple
+        First entry is the array of students
+        Second entry is the array of the position of the project in each student's preferences
+    """
+    num_students, num_ranks = preferences.shape
+    top_q = min(top_q, num_students)
+    # Look through more of every student's preferences until each project is listed top_q times
+    depth = 1
+    while depth < num_ranks and np.bincount(preferences[:, :depth].ravel(), minlength=num_projects).min() < top_q:
+        depth = min(2 * depth, num_ranks)
+    # List the students' preferences up to depth from first preferences to last, then group them by project
+    projects = np.ascontiguousarray(preferences[:, :depth].T).ravel()
+    order = np.argsort(projects, kind='stable')
+    # Each project's entries are in order of rank, so keep the first top_q of each project
+    starts = np.searchsorted(projects[order], np.arange(num_projects))
+    position = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    order = order[position < top_q]
+    return (order % num_students, order // num_students)
+
+
+def round_robin_students(preferences: np.ndarray, num_projects: int) -> tuple:
+    """
+    Helper function to connect each student to one project so that every student can be seated
+
+    Student i is connected to project i modulo the number of projects, which gives every
+    project 3 or 4 students, so the sparse graph always has an assignment.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    num_projects: int
+        How many projects there are
+
+    Returns
+    -------
+    tuple
+        First entry is the array of students
+        Second entry is the array of the position of the project in each student's preferences
+    """
+    num_students = preferences.shape[0]
+    students = np.arange(num_students)
+    projects = students % num_projects
+    ranks = np.empty(num_students, dtype=np.intp)
+    # Find the position of each student's project in their preferences
+    for start in range(0, num_students, CHUNK_SIZE):
+        rows = preferences[start:start + CHUNK_SIZE]
+        ranks[start:start + CHUNK_SIZE] = np.argmax(rows == projects[start:start + CHUNK_SIZE, None], axis=1)
+    return (students, ranks)
+
+
+def build_edges(preferences: np.ndarray, num_projects: int, top_k: int, top_q: int) -> np.ndarray:
+    """
+    Helper function to choose which students and projects are connected in the sparse graph
+
+    Every student is connected to their top_k preferences, every project is connected to the
+    top_q students that prefer it the most, and every student is connected to one more project
+    so that the graph always has an assignment. Each edge is stored as a single integer,
+    student * number of preferences + position of the project in the student's preferences.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    num_projects: int
+        How many projects there are
+    top_k: int
+        How many of each student's preferences to connect them to
+    top_q: int
+        How many students to connect each project to
+
+    Returns
+    -------
+    np.ndarray
+        Sorted array of edges
+    """
+    num_students, num_ranks = preferences.shape
+    # Each student's top_k preferences
+    students = np.repeat(np.arange(num_students), top_k)
+    ranks = np.tile(np.arange(top_k), num_students)
+    # Each project's top_q students
+    project_students, project_ranks = top_students(preferences, num_projects, top_q)
+    # One project for each student that seats every student
+    round_robin, round_robin_ranks = round_robin_students(preferences, num_projects)
+    # Combine the sets of edges, removing edges in more than one and sorting them by student
+    return np.unique(np.concatenate([students * num_ranks + ranks, project_students * num_ranks + project_ranks,
+                                     round_robin * num_ranks + round_robin_ranks]))
+
+
+def seat_costs(ranks: np.ndarray, seats: np.ndarray, penalty: int) -> np.ndarray:
+    """
+    Helper function to find the cost of assigning students to project seats
+
+    Each project has 4 seats. The first 3 seats of every project must be filled so each project
+    gets 3 or 4 students, so the 4th seat costs penalty more, which is more than any sum of
+    preferences could make up for. Otherwise the cost is the student's preference for the project
+    (1 for first preference).
+
+    Parameters
+    ----------
+    ranks: np.ndarray
+        Position of the project in the student's preferences, where 0 is their first preference
+    seats: np.ndarray
+        Seat of the project, from 0 to 3
+    penalty: int
+        Extra cost of the 4th seat
+
+    Returns
+    -------
+    np.ndarray
+        Costs of assigning each student to each seat
+    """
+    return ranks.astype(np.int64) + 1 + np.where(seats == 3, penalty, 0)
+
+
+def find_improving_edges(preferences: np.ndarray, num_projects: int, students: np.ndarray, columns: np.ndarray,
+                         costs: np.ndarray, seat: np.ndarray, assigned_costs: np.ndarray, top_k: int,
+                         penalty: int):
+    """
+    Helper function to find the edges left out of the sparse graph that could lower the sum of preferences
+
+    Finds prices for the seats from the cheapest way to free each seat up by moving students along
+    the sparse graph. The assignment is optimal on the sparse graph, so these prices exist. If no
+    student would rather pay for a seat they aren't connected to than keep their own, no edge left
+    out of the graph can lower the sum of preferences, so the assignment is optimal on the complete graph.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    num_projects: int
+        How many projects there are
+    students: np.ndarray
+        Student of each edge of the sparse graph, sorted
+    columns: np.ndarray
+        Seat of each edge, where seat s of project j is 4 * j + s
+    costs: np.ndarray
+        Cost of each edge
+    seat: np.ndarray
+        Array mapping each student to the seat they are assigned to
+    assigned_costs: np.ndarray
+        Array holding the cost of each student's seat
+    top_k: int
+        How many of each student's preferences every student is connected to
+    penalty: int
+        Extra cost of the 4th seat
+
+    Returns
+    -------
+    np.ndarray or None
+        Sorted array of edges students would rather have, stored like the edges of build_edges;
+        empty if the assignment is optimal, or None if the seats could not all be priced
+    """
+    num_ranks = preferences.shape[1]
+    num_seats = 4 * num_projects
+    # Cost of freeing up each seat; empty seats are free, filled seats are not known to be freeable yet
+    free_cost = np.full(num_seats, np.inf)
+    is_filled = np.zeros(num_seats, dtype=bool)
+    is_filled[seat] = True
+    if is_filled.all():
+        # When every seat is filled, only the differences between prices matter
+        free_cost[:] = 0
+    else:
+        free_cost[~is_filled] = 0
+    # Change in cost of moving each student along each edge out of their seat
+    move_costs = costs - assigned_costs[students]
+    starts = np.flatnonzero(np.r_[True, students[1:] != students[:-1]])
+    # Relax the cost of freeing up each filled seat until nothing changes; the assignment
+    # is optimal on the sparse graph, so there is no cycle of moves that lowers the cost
+    while True:
+        new_free_cost = np.minimum(free_cost[seat], np.minimum.reduceat(move_costs + free_cost[columns], starts))
+        if np.array_equal(new_free_cost, free_cost[seat]):
+            break
+        free_cost[seat] = new_free_cost
+    # Seats that can't be freed up have no price
+    if np.isinf(free_cost[seat]).any():
+        return None
+    # Each student pays their seat's cost plus the cost of freeing it up; each seat's price is minus its freeing cost
+    student_prices = assigned_costs + free_cost[seat]
+    seat_prices = -free_cost.reshape(num_projects, 4)
+    # Highest price of a seat of each project after the 4th seat's penalty
+    project_prices = np.maximum(seat_prices[:, :3].max(axis=1), seat_prices[:, 3] - penalty)
+    # A student can only want a project at a position below their price less the highest project price,
+    # so only those students and positions past their top_k preferences need to be checked
+    limits = np.minimum(np.ceil(student_prices + project_prices.max()) - 1, num_ranks).astype(np.intp)
+    checked = np.flatnonzero(limits > top_k)
+    improving_edges = [np.empty(0, dtype=np.intp)]
+    for start in range(0, len(checked), CHUNK_SIZE):
+        rows = checked[start:start + CHUNK_SIZE]
+        depth = limits[rows].max()
+        # Find the projects past their top_k preferences students would rather move to
+        reduced_costs = (np.arange(top_k + 1, depth + 1) - project_prices[preferences[rows, top_k:depth]]
+                         - student_prices[rows, None])
+        row_positions, rank_positions = np.nonzero(reduced_costs < 0)
+        # Only keep each student's first top_k of those projects, since the prices change once they are added
+        first_positions = np.searchsorted(row_positions, row_positions)
+        keep = np.arange(len(row_positions)) - first_positions < top_k
+        improving_edges.append(rows[row_positions[keep]] * num_ranks + rank_positions[keep] + top_k)
+    return np.concatenate(improving_edges)
+
+
+def optimal_assignment_matrix(preferences: np.ndarray, num_projects: int, top_k: int = 5, top_q: int = 8) -> tuple:
+    """
+    Function to assign students to projects with the lowest possible sum of preferences on a preference matrix
+
+    Solves the assignment as a minimum cost matching of students to project seats, which is the
+    min-cost flow from students to projects with 3 or 4 students per project. To keep the graph
+    sparse, every student is only connected to their top_k preferences and every project to the
+    top_q students that prefer it the most. Edges left out that could still lower the sum of
+    preferences are added and the matching is solved again until there are none, so the
+    assignment is optimal on the complete graph.
+
+    Parameters
+    ----------
+    preferences: np.ndarray
+        Preference matrix; row i holds student i's projects from most to least prefered
+    num_projects: int
+        How many projects there are
+    top_k: int
+        How many of each student's preferences to connect them to at first
+    top_q: int
+        How many students to connect each project to at first
+
+    Returns
+    -------
+    tuple
+        First entry is the array mapping each student to the project they are assigned to
+        Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    """
+    num_students, num_ranks = preferences.shape
+    top_k = min(top_k, num_ranks)
+    # Make the 4th seat cost more than the largest possible sum of preferences
+    penalty = num_students * num_ranks + 1
+    edges = build_edges(preferences, num_projects, top_k, top_q)
+    while True:
+        # Connect each student to the 4 seats of each project they have an edge to
+        students = np.repeat(edges // num_ranks, 4)
+        ranks = np.repeat(edges % num_ranks, 4)
+        seats = np.tile(np.arange(4), len(edges))
+        columns = 4 * np.asarray(preferences[students, ranks], dtype=np.intp) + seats
+        costs = seat_costs(ranks, seats, penalty)
+        graph = csr_matrix((costs.astype(np.float64), (students, columns)), shape=(num_students, 4 * num_projects))
+        # Match every student to a seat at the lowest cost
+        matched_students, matched_seats = min_weight_full_bipartite_matching(graph)
+        seat = np.empty(num_students, dtype=np.intp)
+        seat[matched_students] = matched_seats
+        # Find the cost of the edge each student is assigned along
+        is_assigned = columns == seat[students]
+        assigned_costs = np.empty(num_students, dtype=np.int64)
+        assigned_costs[students[is_assigned]] = costs[is_assigned]
+        improving_edges = find_improving_edges(preferences, num_projects, students, columns, costs, seat,
+                                               assigned_costs, top_k, penalty)
+        if improving_edges is None:
+            # Without prices, widen the graph to more of each student's preferences and more students for each project
+            top_k = min(2 * top_k, num_ranks)
+            top_q *= 2
+            improving_edges = build_edges(preferences, num_projects, top_k, top_q)
+        elif len(improving_edges) == 0:
+            break
+        # Add the edges that could lower the sum of preferences and solve again
+        edges = np.union1d(edges, improving_edges)
+    assignment = seat // 4
+    # Check every project got at least 3 students
+    if np.bincount(assignment, minlength=num_projects).min() < 3:
+        raise ValueError("students can't be assigned to projects of 3 or 4 students")
+    # Each student's cost is their preference for their project, plus the penalty for 4th seats
+    sum_preferences = int(assigned_costs.sum()) - penalty * int(np.count_nonzero(seat % 4 == 3))
+    return (assignment, sum_preferences)
+
+
+def optimally_assign_students(students: dict, projects: dict, top_k: int = 5) -> tuple:
+    """
+    Function to assign students to projects with the lowest possible sum of preferences
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    top_k: int
+        How many of each student's preferences to connect them to at first; more are added if needed
+
+    Returns
+    -------
+    tuple
+        First entry is projects dictionary where each project has been assigned 3 or 4 students
+        Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+        None if there aren't enough students or projects, or students don't rank every project
+    """
+    # If there are less than 6 students or not enough projects, return None
+    if len(students) < 6 or len(projects) != math.ceil(len(students) / 4):
+        return None
+    # The preference matrix needs every student to rank every project, so return None otherwise
+    if not all(len(preferences) == len(projects) for preferences in students.values()):
+        return None
+    # Convert students and their preferences to a preference matrix
+    names, project_labels, preferences = build_preference_matrix(students, projects)
+    # Call solver to assign students to projects
+    assignment, sum_preferences = optimal_assignment_matrix(preferences, len(project_labels), top_k)
+    # Add students to their projects
+    for student, project in enumerate(assignment.tolist()):
+        projects[project_labels[project]].append(names[student])
+    return (projects, sum_preferences)
@@ -0,0 +1,195 @@
+import sys
+import argparse
+import numpy as np
+import assign_students
+from export_assignments import assignment_table
+
+# Number of the most over and under demanded projects listed in a report
+DEFAULT_EXAMPLES = 5
+# Number of students whose preference rows are compared to their projects at once
+CHUNK_SIZE = 4096
+
+
+def attained_ranks(students: dict, projects: dict) -> tuple:
+    """
+    Function to find each student's project and the preference they got
+
+    Students loaded from a binary students file are compared to their projects in chunks of rows of
+    their preference matrix at once. Other students are looked up like export_assignments.assignment_table,
+    searching each student's preferences from the front, since assigned projects are near it. A whole
+    inverse rank matrix isn't built, since it holds an entry for every student and project.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+
+    Returns
+    -------
+    tuple
+        First entry is the array of the project index of each student, in the order of students
+        Second entry is the array of the preference each student got, where 1 is their first preference
+        and a project they didn't list counts as the preference after their last one
+    """
+    if not hasattr(students, "preferences"):
+        student_project, student_rank = assignment_table(students, projects)
+        return (np.asarray(student_project, dtype=np.intp), np.asarray(student_rank, dtype=np.intp))
+    # Map each student to the index of their project
+    project_of = {student: index for index, members in enumerate(projects.values()) for student in members}
+    try:
+        student_project = np.fromiter(map(project_of.__getitem__, students), dtype=np.intp, count=len(students))
+    except KeyError as error:
+        raise ValueError(str(error) + " isn't assigned to a project") from None
+    project_index = {project: index for index, project in enumerate(projects)}
+    renumber = np.array([project_index.get(project, -1) for project in students.project_labels], dtype=np.intp)
+    num_ranks = students.preferences.shape[1]
+    student_rank = np.empty(len(student_project), dtype=np.intp)
+    for start in range(0, len(student_project), CHUNK_SIZE):
+        rows = renumber[students.preferences[start:start + CHUNK_SIZE]]
+        matches = rows == student_project[start:start + CHUNK_SIZE, None]
+        # Students whose project isn't in their preferences get the preference after their last one
+        student_rank[start:start + len(rows)] = np.where(matches.any(axis=1), matches.argmax(axis=1) + 1,
+                                                         num_ranks + 1)
+    return (student_project, student_rank)
+
+
+def first_choices(students: dict, projects: dict) -> np.ndarray:
+    """
+    Helper function to find the project index of each student's first preference
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+
+    Returns
+    -------
+    np.ndarray
+        Project index of each student's first preference, or -1 if it isn't being assigned
+    """
+    project_index = {project: index for index, project in enumerate(projects)}
+    if hasattr(students, "preferences"):
+        renumber = np.array([project_index.get(project, -1) for project in students.project_labels], dtype=np.intp)
+        return renumber[students.preferences[:, 0]]
+    return np.fromiter((project_index.get(preferences[0], -1) for preferences in students.values()), dtype=np.intp,
+                       count=len(students))
+
+
+def outcome_report(students: dict, projects: dict, examples: int = DEFAULT_EXAMPLES, registry=None) -> dict:
+    """
+    Function to measure how well any project assignments give students their preferences
+
+    Every measure is computed from the preference each student got with counts over whole arrays,
+    so every algorithm's project assignments are measured the same way, whichever way the algorithm
+    added up its sum of preferences. A project is over demanded when more students chose it first
+    than it was assigned, so some of them were turned away, and under demanded when it was assigned
+    more students than chose it first, so it was filled with students who wanted other projects.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+    examples: int
+        Most over and under demanded projects to list
+    registry: Registry
+        If provided, the registry.Registry projects are given by ID in, so they are listed by label
+
+    Returns
+    -------
+    dict
+        Number of students, sum_preferences, mean_preference, the number of students who got each
+        preference from the first on (histogram), the share of students who got their first preference
+        (top_1) and one of their first three (top_3), the worst preference a student got (worst) and how
+        many students got it (worst_students), the number of over_demanded and under_demanded projects,
+        the first choices turned away, and lists of the most over and under demanded projects as
+        (project, students who chose it first, students assigned)
+    """
+    student_project, student_rank = attained_ranks(students, projects)
+    num_students = len(student_rank)
+    num_projects = len(projects)
+    # Number of students who got each preference, where index 0 is their first preference
+    histogram = np.bincount(student_rank, minlength=2)[1:]
+    worst = int(student_rank.max()) if num_students else 0
+    # Students who chose each project first, and students assigned to each project
+    chosen = first_choices(students, projects)
+    demand = np.bincount(chosen[chosen >= 0], minlength=num_projects)
+    sizes = np.bincount(student_project, minlength=num_projects)
+    surplus = demand - sizes
+    over = np.flatnonzero(surplus > 0)
+    under = np.flatnonzero(surplus < 0)
+    # List the projects furthest from their demand first
+    labels = list(projects) if registry is None else [registry.project_labels[project] for project in projects]
+    most_over = over[np.argsort(-surplus[over], kind="stable")][:examples].tolist()
+    most_under = under[np.argsort(surplus[under], kind="stable")][:examples].tolist()
+    divisor = max(num_students, 1)
+    return {"students": num_students, "sum_preferences": int(student_rank.sum()),
+            "mean_preference": float(student_rank.sum()) / divisor, "histogram": histogram.tolist(),
+            "top_1": float(histogram[0]) / divisor, "top_3": float(histogram[:3].sum()) / divisor,
+            "worst": worst, "worst_students": int(histogram[worst - 1]) if worst else 0,
+            "over_demanded": len(over), "under_demanded": len(under),
+            "turned_away": int(surplus[over].sum()),
+            "most_over_demanded": [(labels[index], int(demand[index]), int(sizes[index])) for index in most_over],
+            "most_under_demanded": [(labels[index], int(demand[index]), int(sizes[index])) for index in most_under]}
+
+
+def summary_line(report: dict) -> str:
+    """
+    One line summary of the measures of outcome_report
+    """
+    return ("Top choice: " + format(report["top_1"], ".1%") + ", top 3: " + format(report["top_3"], ".1%")
+            + ", mean preference: " + format(report["mean_preference"], ".2f") + ", worst preference: "
+            + str(report["worst"]) + " (" + str(report["worst_students"]) + " students), over demanded projects: "
+            + str(report["over_demanded"]) + " (" + str(report["turned_away"]) + " first choices turned away)"
+            + ", under demanded projects: " + str(report["under_demanded"]))
+
+
+def print_outcome_report(report: dict, file=sys.stdout) -> None:
+    """
+    Helper function to print the measures and most over and under demanded projects of outcome_report
+
+    Parameters
+    ----------
+    report: dict
+        Report returned by outcome_report
+    file: file
+        File to print the report to
+
+    Returns
+    -------
+    None
+    """
+    print("Sum of preferences:", report["sum_preferences"], summary_line(report), file=file)
+    print("  Students who got each preference:", " ".join(str(rank + 1) + ":" + str(count)
+                                                          for rank, count in enumerate(report["histogram"]) if count),
+          file=file)
+    for project, demand, size in report["most_over_demanded"]:
+        print("  Over demanded project", project, "was chosen first by", demand, "students and assigned", size, file=file)
+    for project, demand, size in report["most_under_demanded"]:
+        print("  Under demanded project", project, "was chosen first by", demand, "students and assigned", size, file=file)
+
+
+if __name__ == "__main__":
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Measure how well project assignments give students their preferences")
+    parser.add_argument("path_to_file", help="file name containing students")
+    parser.add_argument("assignments", help="project assignments file written by assign_students.py")
+    parser.add_argument("--examples", type=int, default=DEFAULT_EXAMPLES,
+                        help="most over and under demanded projects to list")
+    args = parser.parse_args()
+    # Imported here so the reader of project assignments files is only loaded when used
+    from stability import load_project_assignments
+    # Call helper functions to read the students and their project assignments
+    students = assign_students.load_students(args.path_to_file)
+    projects = load_project_assignments(args.assignments)
+    try:
+        report = outcome_report(students, projects, args.examples)
+    except ValueError as error:
+        print("Can't measure project assignments:", error, file=sys.stderr)
+        sys.exit(1)
+    print_outcome_report(report)
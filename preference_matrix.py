@@ -0,0 +1,46 @@
+import numpy as np
+
+
+def build_preference_matrix(students: dict, projects: dict) -> tuple:
+    """
+    Convert students mapped to their preferences into a dense integer preference matrix
+
+    Students are numbered in the order they appear in the students dictionary and
+    projects are numbered in the order they appear in the projects dictionary, so
+    the integer results can be translated back to names and project labels.
+    Students loaded from a binary students file already hold a preference matrix
+    numbered this way, which is returned without copying it.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+
+    Returns
+    -------
+    tuple
+        First entry is the list of student names, where index i is student i
+        Second entry is the list of project labels, where index j is project j
+        Third entry is the preference matrix; row i holds student i's projects from most to least prefered
+    """
+    # Get list of student names and project labels so indexes can be mapped back to them
+    names = list(students)
+    project_labels = list(projects)
+    # Map each project label to its index
+    project_index = {project: index for index, project in enumerate(project_labels)}
+    # Students loaded from a binary students file already hold a preference matrix
+    if hasattr(students, "preferences"):
+        # Use the memory-mapped matrix if its projects are in the same order
+        if students.project_labels == project_labels:
+            return (names, project_labels, students.preferences)
+        # Otherwise renumber the projects in one vectorized lookup
+        renumber = np.array([project_index[project] for project in students.project_labels], dtype=np.int32)
+        return (names, project_labels, renumber[students.preferences])
+    # Create preference matrix where each row holds a student's projects as indexes
+    preferences = np.empty((len(names), len(project_labels)), dtype=np.int32)
+    for student_index, name in enumerate(names):
+        preferences[student_index] = [project_index[project] for project in students[name]]
+    return (names, project_labels, preferences)
+
@@ -0,0 +1,114 @@
+class Registry:
+    """
+    Dense integer IDs of students' names and project labels
+
+    Names and labels are given IDs 0, 1, 2, ... in the order they are first seen, once when
+    students are loaded, so the algorithms hash and compare small integers instead of strings.
+    Students keyed by their ID with preferences listing project IDs can be passed to every
+    function that takes students, and names and labels are looked up again only when the
+    project assignments are written.
+    """
+
+    def __init__(self, names: list = (), project_labels: list = ()):
+        # Name and label of each ID
+        self.names = list(names)
+        self.project_labels = list(project_labels)
+        # ID of each name and label
+        self.name_ids = {name: index for index, name in enumerate(self.names)}
+        self.project_ids = {label: index for index, label in enumerate(self.project_labels)}
+        # ID of each project number as it is written in a file, so reading it skips converting it to an integer
+        self.field_ids = {}
+        # IDs of every project of a binary students file, which also holds projects nobody listed
+        self.file_projects = None
+
+    def student_id(self, name) -> int:
+        """
+        ID of the student with name, giving them the next ID if they don't have one
+        """
+        student = self.name_ids.get(name)
+        if student is None:
+            student = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return student
+
+    def project_id(self, label) -> int:
+        """
+        ID of the project with label, giving it the next ID if it doesn't have one
+        """
+        project = self.project_ids.get(label)
+        if project is None:
+            project = self.project_ids[label] = len(self.project_labels)
+            self.project_labels.append(label)
+        return project
+
+    def intern_preferences(self, preferences: list) -> list:
+        """
+        Project IDs of a student's preferences given as project labels
+        """
+        project_ids = self.project_ids
+        # Every label but the first of each project is already known, so look them up directly
+        try:
+            return [project_ids[label] for label in preferences]
+        except KeyError:
+            return [self.project_id(label) for label in preferences]
+
+    def intern_fields(self, fields: list) -> list:
+        """
+        Project IDs of a student's preferences given as the text of project numbers read from a file
+
+        Raises ValueError if a field isn't a number, without giving any of the projects IDs.
+        """
+        field_ids = self.field_ids
+        try:
+            return [field_ids[field] for field in fields]
+        except KeyError:
+            # Convert every field first, so a malformed line doesn't add projects
+            preferences = self.intern_preferences([int(field) for field in fields])
+            field_ids.update(zip(fields, preferences))
+            return preferences
+
+    def intern_students(self, students: dict) -> dict:
+        """
+        Students keyed by their ID and mapped to the IDs of their preferences
+
+        Students loaded from a binary students file into an empty registry take their rows and
+        the project indexes of the preference block as IDs, so nothing is looked up.
+        """
+        if hasattr(students, "preferences") and not self.names and not self.project_labels:
+            self.__init__(students.names, students.project_labels)
+            self.file_projects = list(range(len(self.project_labels)))
+            return dict(enumerate(students.preferences.tolist()))
+        return {self.student_id(name): self.intern_preferences(preferences) for name, preferences in students.items()}
+
+    def project_list(self, project_labels: list) -> list:
+        """
+        IDs of the projects with project_labels, or of the projects of the binary students file
+        loaded if project_labels is None, which is None for other files
+        """
+        if project_labels is None:
+            return self.file_projects
+        return [self.project_id(label) for label in project_labels]
+
+    def capacities(self, capacities):
+        """
+        Capacities of projects keyed by project label as in capacities.project_capacities, keyed by project ID
+
+        Projects nobody listed are left out, since they aren't assigned students.
+        """
+        if capacities is None or isinstance(capacities, tuple):
+            return capacities
+        return {self.project_ids[label]: capacity for label, capacity in capacities.items()
+                if label in self.project_ids}
+
+    def student_names(self, students) -> list:
+        """
+        Names of students given by ID, in the same order
+        """
+        return list(map(self.names.__getitem__, students))
+
+    def export_projects(self, projects: dict) -> dict:
+        """
+        Projects keyed by ID mapped to the IDs of their students, keyed by label and mapped to names instead
+        """
+        names = self.names.__getitem__
+        return {self.project_labels[project]: list(map(names, members)) for project, members in projects.items()}
@@ -0,0 +1,327 @@
+import os
+import sys
+import json
+import pickle
+import random
+import hashlib
+import argparse
+import tempfile
+import assign_students
+
+# Directory the cache is kept in unless another is given
+DEFAULT_DIRECTORY = ".assignment_cache"
+# Most bytes the cache may hold before the least recently used entries are evicted
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+# Extension of the files holding cache entries
+ENTRY_EXTENSION = ".pkl"
+
+
+def preferences_digest(students: dict) -> str:
+    """
+    Helper function to hash students and their preferences independently of how they were stored
+
+    The same students with the same preferences in the same order hash the same whether they
+    were read from a text file, a compressed file or sent as lists or tuples.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 hash of the students and their preferences
+    """
+    digest = hashlib.sha256()
+    if hasattr(students, "preferences"):
+        # Students loaded from a binary students file hash their matrix of project indexes directly
+        digest.update(pickle.dumps((list(students.names), list(students.project_labels)), protocol=4))
+        digest.update(students.preferences.tobytes())
+    else:
+        digest.update(pickle.dumps([(name, list(preferences)) for name, preferences in students.items()],
+                                   protocol=4))
+    return digest.hexdigest()
+
+
+def file_digest(path_to_file: str) -> str:
+    """
+    Helper function to hash the bytes of a file
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the file
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 hash of the file
+    """
+    digest = hashlib.sha256()
+    with open(path_to_file, 'rb') as file:
+        for block in iter(lambda: file.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_engine(students: dict, engine: str, project_list: list, params: dict) -> tuple:
+    """
+    Helper function to run an algorithm on fresh projects
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    engine: str
+        Name of the algorithm: assign_students, randomly_assign_students, optimally_assign_students
+        or deferred_acceptance_assign_students
+    project_list: list
+        If provided, the projects students are assigned to, as in assign_students.initalize_projects
+    params: dict
+        Arguments of the algorithm. randomly_assign_students takes a seed instead, and assign_students
+        takes demand=True to order projects by a demand index built from students
+
+    Returns
+    -------
+    tuple
+        Projects mapped to their students and the sum of preferences, or None if students couldn't be assigned
+    """
+    projects = assign_students.initalize_projects(students, project_list)
+    if engine == "assign_students":
+        if params.get("demand"):
+            # Imported here so numpy is only needed when used
+            import demand_index
+            # Order projects by the demand index of these students, as assign_students.py --demand does
+            params = dict(params, demand=demand_index.build_demand_index(students, projects))
+        return assign_students.assign_students(students, projects, **params)
+    if engine == "randomly_assign_students":
+        random.seed(params["seed"])
+        return assign_students.randomly_assign_students(students, projects)
+    if engine == "optimally_assign_students":
+        # Imported here so scipy is only needed when the optimal algorithm is used
+        import optimal_assignment
+        return optimal_assignment.optimally_assign_students(students, projects, **params)
+    if engine == "deferred_acceptance_assign_students":
+        # Imported here so deferred acceptance is only loaded when used
+        import deferred_acceptance
+        return deferred_acceptance.deferred_acceptance_assign_students(students, projects, **params)
+    raise ValueError("unknown engine " + repr(engine))
+
+
+class ResultCache:
+    """
+    On-disk cache of parsed students and of the project assignments algorithms found for them
+
+    Parsed students are keyed by a hash of their file's bytes, and results by a hash of the
+    students' preferences, the algorithm and its arguments, so a changed file is simply a new entry.
+    Entries are pickled files in one directory. Reading an entry marks it as recently used, and the
+    least recently used entries are removed whenever the cache grows past max_bytes. Entries are
+    never invalidated by time, only by invalidate or clear.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Students last read by load_students and the hash of their preferences
+        self.loaded = (None, None)
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """
+        Path of the file holding the entry with key
+        """
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
+
+    def get(self, key: str):
+        """
+        Value stored under key, or None if there is none
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError) as error:
+            # A damaged entry is dropped and computed again
+            print(path + ": dropping unreadable cache entry:", error, file=sys.stderr)
+            self.remove(key)
+            return None
+        # Mark the entry as recently used
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value) -> None:
+        """
+        Store value under key, then evict least recently used entries if the cache is too big
+        """
+        # Write to a temporary file first so readers never see half an entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+
+    def remove(self, key: str) -> None:
+        """
+        Remove the entry with key if there is one
+        """
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> list:
+        """
+        Key, size in bytes and last use of every entry, least recently used first
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_EXTENSION):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.name[:-len(ENTRY_EXTENSION)], stat.st_size, stat.st_mtime_ns))
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def evict(self) -> int:
+        """
+        Remove least recently used entries until the cache holds at most max_bytes, returning how many were removed
+        """
+        entries = self.entries()
+        total = sum(size for key, size, used in entries)
+        removed = 0
+        for key, size, used in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+            removed += 1
+        return removed
+
+    def invalidate(self, digest: str) -> int:
+        """
+        Remove the parsed students and every result of the students whose preferences hash to digest
+
+        Returns how many entries were removed.
+        """
+        removed = 0
+        for key, size, used in self.entries():
+            if key.startswith(digest):
+                self.remove(key)
+                removed += 1
+            elif key.startswith("students-"):
+                # Parsed students are keyed by their file, so check which preferences they hold
+                value = self.get(key)
+                if value is not None and value["digest"] == digest:
+                    self.remove(key)
+                    removed += 1
+        return removed
+
+    def invalidate_file(self, path_to_file: str) -> int:
+        """
+        Remove the parsed students of a file and every result of its students, returning how many entries were removed
+        """
+        return self.invalidate(preferences_digest(assign_students.load_students(path_to_file)))
+
+    def clear(self) -> int:
+        """
+        Remove every entry, returning how many were removed
+        """
+        entries = self.entries()
+        for key, size, used in entries:
+            self.remove(key)
+        return len(entries)
+
+    def load_students(self, path_to_file: str) -> dict:
+        """
+        Students and their preferences in a file, parsed once and read back from the cache afterwards
+
+        Binary students files and standard input are loaded without the cache, since binary files
+        are memory-mapped instead of parsed and standard input can only be read once.
+        """
+        if path_to_file == "-" or path_to_file.endswith(".bin"):
+            return assign_students.load_students(path_to_file)
+        key = "students-" + file_digest(path_to_file)
+        value = self.get(key)
+        if value is None:
+            students = assign_students.load_students(path_to_file)
+            # Keep the hash of the preferences so results of the students are found without hashing them again
+            value = {"students": students, "digest": preferences_digest(students)}
+            self.put(key, value)
+        self.loaded = (value["students"], value["digest"])
+        return value["students"]
+
+    def digest(self, students: dict) -> str:
+        """
+        Hash of students' preferences, reusing the hash stored with the students last read by load_students
+
+        Students read by load_students must not be changed afterwards, or their old hash is used.
+        """
+        if students is self.loaded[0]:
+            return self.loaded[1]
+        return preferences_digest(students)
+
+    def assign(self, students: dict, engine: str = "assign_students", project_list: list = None, **params) -> tuple:
+        """
+        Projects mapped to their students and the sum of preferences an algorithm finds, computed once per input
+
+        Parameters
+        ----------
+        students: dict
+            Dictionary of students mapped to their preferences
+        engine: str
+            Name of the algorithm: assign_students, randomly_assign_students, optimally_assign_students
+            or deferred_acceptance_assign_students
+        project_list: list
+            If provided, the projects students are assigned to
+        params: dict
+            Arguments of the algorithm, i.e. use_numpy or top_k. randomly_assign_students needs a seed,
+            since unseeded random assignments aren't worth keeping
+
+        Returns
+        -------
+        tuple
+            Projects mapped to their students and the sum of preferences, or None if students couldn't be assigned
+        """
+        if engine == "randomly_assign_students" and params.get("seed") is None:
+            raise ValueError("random assignments are only cached with a seed")
+        # Results of the same students start with the same hash so they can be invalidated together
+        settings = json.dumps([engine, None if project_list is None else list(project_list), params],
+                              sort_keys=True, default=str)
+        key = self.digest(students) + "-" + hashlib.sha256(settings.encode()).hexdigest()[:32]
+        value = self.get(key)
+        if value is None:
+            result = run_engine(students, engine, project_list, params)
+            # Students that couldn't be assigned aren't cached so they are reported every time
+            if result is None:
+                return None
+            value = {"projects": result[0], "sum_preferences": result[1]}
+            self.put(key, value)
+        return (value["projects"], value["sum_preferences"])
+
+
+if __name__ == "__main__":
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the cache of parsed students and results")
+    parser.add_argument("--cache-dir", default=DEFAULT_DIRECTORY, help="directory the cache is kept in")
+    parser.add_argument("--invalidate", nargs="+", default=[], metavar="PATH",
+                        help="remove the parsed students and results of these files containing students")
+    parser.add_argument("--clear", action="store_true", help="remove every entry")
+    args = parser.parse_args()
+    cache = ResultCache(args.cache_dir)
+    if args.clear:
+        print("Removed", cache.clear(), "entries")
+    for path_to_file in args.invalidate:
+        print(path_to_file + ": removed", cache.invalidate_file(path_to_file), "entries")
+    # Display what is left in the cache
+    entries = cache.entries()
+    print(len(entries), "entries,", format(sum(size for key, size, used in entries) / 2 ** 20, ".1f") + "MB",
+          "of", format(cache.max_bytes / 2 ** 20, ".1f") + "MB")
@@ -0,0 +1,163 @@
+class Roster:
+    """
+    Students assigned to each project, with constant time add, remove and size
+
+    Each project's students are kept in a dictionary used as an insertion ordered set,
+    so students stay in the order they were assigned like the lists in projects. Once the
+    least loaded project is first asked for, projects are also grouped by their number of
+    students, so it is found without scanning every project.
+    """
+
+    def __init__(self, projects: dict):
+        # Store each project's students as keys of a dictionary
+        self.members = {project: dict.fromkeys(students) for project, students in projects.items()}
+        # Projects grouped by their number of students, built the first time it is needed
+        self.by_size = None
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, project) -> bool:
+        return project in self.members
+
+    def size(self, project) -> int:
+        """
+        Number of students assigned to project
+        """
+        return len(self.members[project])
+
+    def students(self, project) -> list:
+        """
+        List of the students assigned to project in the order they were assigned,
+        which can be iterated over while students are moved
+        """
+        return list(self.members[project])
+
+    def resize(self, project, size: int, new_size: int) -> None:
+        """
+        Move project from the group of projects with size students to the group with new_size students
+        """
+        del self.by_size[size][project]
+        group = self.by_size.get(new_size)
+        if group is None:
+            self.by_size[new_size] = {project: None}
+        else:
+            group[project] = None
+
+    def group(self, size: int) -> dict:
+        """
+        Projects with size students, as the keys of a dictionary in the order they joined the group
+        """
+        if self.by_size is None:
+            # Group projects by their number of students, each group kept in the order projects joined it
+            self.by_size = {}
+            for project, students in self.members.items():
+                self.by_size.setdefault(len(students), {})[project] = None
+        return self.by_size.get(size, {})
+
+    def least_loaded(self, limits):
+        """
+        Project with the fewest students that has an opening, or None if there is none
+
+        limits is the number of students allowed per project, or projects mapped to their own number allowed.
+        """
+        # Group projects by their number of students if they aren't yet
+        self.group(0)
+        if isinstance(limits, int):
+            for size in range(limits):
+                group = self.by_size.get(size)
+                if group:
+                    return next(iter(group))
+            return None
+        for size in sorted(self.by_size):
+            # Skip the projects in the group that are already full
+            project = next((project for project in self.by_size[size] if size < limits[project]), None)
+            if project is not None:
+                return project
+        return None
+
+    def add(self, project, student) -> None:
+        """
+        Assign student to project
+        """
+        members = self.members[project]
+        members[student] = None
+        if self.by_size is not None:
+            self.resize(project, len(members) - 1, len(members))
+
+    def remove(self, project, student) -> None:
+        """
+        Remove student from project
+        """
+        members = self.members[project]
+        del members[student]
+        if self.by_size is not None:
+            self.resize(project, len(members) + 1, len(members))
+
+    def move(self, student, from_project, to_project) -> None:
+        """
+        Move student from one project to another
+        """
+        source = self.members[from_project]
+        target = self.members[to_project]
+        del source[student]
+        target[student] = None
+        if self.by_size is not None:
+            self.resize(from_project, len(source) + 1, len(source))
+            self.resize(to_project, len(target) - 1, len(target))
+
+    def to_projects(self, projects: dict) -> dict:
+        """
+        Write the students assigned to each project back to the lists in projects
+        """
+        for project, students in self.members.items():
+            projects[project] = list(students)
+        return projects
+
+
+class PreferenceRanks:
+    """
+    Lookup of the position of a project in a student's preferences
+
+    rank(student, project) is 0 for the student's first preference. Positions recorded
+    when students are assigned are looked up in constant time, and any other position is
+    found once from the student's preferences and then kept for later lookups. Projects a
+    student didn't list are ranked right after all of their preferences.
+    """
+
+    def __init__(self, students: dict):
+        self.students = students
+        self.ranks = {}
+
+    def record(self, student, project, rank: int) -> None:
+        """
+        Record that project is at position rank in student's preferences
+        """
+        ranks = self.ranks.get(student)
+        if ranks is None:
+            self.ranks[student] = {project: rank}
+        else:
+            ranks[project] = rank
+
+    def forget(self, student) -> None:
+        """
+        Forget the positions recorded for student, for when their preferences change
+        """
+        self.ranks.pop(student, None)
+
+    def rank(self, student, project) -> int:
+        """
+        Position of project in student's preferences, where 0 is their first preference
+        """
+        ranks = self.ranks.get(student)
+        if ranks is None or project not in ranks:
+            # Map each of the student's preferences to its position
+            ranks = {preference: rank for rank, preference in enumerate(self.students[student])}
+            self.ranks[student] = ranks
+            # Rank a project the student didn't list after all of their preferences
+            if project not in ranks:
+                ranks[project] = len(self.students[student])
+        return ranks[project]
@@ -0,0 +1,334 @@
+import os
+import time
+import heapq
+import operator
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.sparse import csr_matrix
+import assign_students
+from roster import Roster
+from capacities import project_capacities, capacity_error, solve_targets
+
+# Number of each student's first preferences used to find the projects students choose together
+AFFINITY_DEPTH = 3
+# Most rounds of relabelling projects by their neighbours when finding groups of projects
+LABEL_ROUNDS = 5
+# Fewest students listing two projects together for them to be grouped, so pairs listed together by chance aren't
+MIN_AFFINITY = 2
+
+
+def top_preferences(students: dict, sorted_projects: list, depth: int) -> np.ndarray:
+    """
+    Helper function to gather the first preferences of every student as project indexes
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    sorted_projects: list
+        List of projects, whose positions are the project indexes
+    depth: int
+        Number of each student's first preferences to gather
+
+    Returns
+    -------
+    np.ndarray
+        Matrix with a row per student of the indexes of their first depth preferences, where -1 stands
+        for projects that aren't being assigned and the places after the last preference of shorter lists
+    """
+    project_index = {project: index for index, project in enumerate(sorted_projects)}
+    if hasattr(students, "preferences"):
+        # Students loaded from a binary students file are renumbered in their preference matrix at once
+        renumber = np.array([project_index.get(project, -1) for project in students.project_labels], dtype=np.int64)
+        return renumber[students.preferences[:, :depth]]
+    num_students = len(students)
+    lengths = np.minimum(np.fromiter(map(len, students.values()), dtype=np.int64, count=num_students), depth)
+    # Slice and look up every student's preferences with built in functions instead of a loop
+    heads = itertools.chain.from_iterable(map(operator.itemgetter(slice(depth)), students.values()))
+    listed = np.fromiter(map(project_index.get, heads, itertools.repeat(-1)), dtype=np.int64,
+                         count=int(lengths.sum()))
+    # Place each preference in its student's row at its position
+    starts = np.cumsum(lengths) - lengths
+    top = np.full((num_students, depth), -1, dtype=np.int64)
+    top[np.repeat(np.arange(num_students), lengths), np.arange(len(listed)) - np.repeat(starts, lengths)] = listed
+    return top
+
+
+def partition_projects(students: dict, sorted_projects: list, num_shards: int) -> dict:
+    """
+    Helper function to split projects into shards so students' next preferences are mostly in their own shard
+
+    Projects listed together near the top of the preferences of at least MIN_AFFINITY students, i.e.
+    the projects of one department, are grouped by label propagation over a sparse graph of projects
+    weighted by how many students list both: every project starts with its own label and repeatedly
+    takes the label most of its neighbouring students share. Every round is a few operations on
+    whole arrays, with half of the projects relabelled at a time so neighbours don't swap labels back
+    and forth. Projects are then lined up group by group, from the group with the most students to
+    the fewest, and the line is cut into shards with even numbers of students, so a group is only
+    split where a shard fills up.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    sorted_projects: list
+        List of projects descendingly sorted by the number of students assigned to them
+    num_shards: int
+        Number of shards
+
+    Returns
+    -------
+    dict
+        Projects mapped to the index of their shard
+    """
+    # Every project is in the one shard, so there is nothing to group
+    if num_shards == 1:
+        return dict.fromkeys(sorted_projects, 0)
+    num_projects = len(sorted_projects)
+    top = top_preferences(students, sorted_projects, AFFINITY_DEPTH)
+    # Every student starts in their first preference
+    sizes = np.bincount(top[:, 0][top[:, 0] >= 0], minlength=num_projects)
+    # Link each student's first preference to each of their next preferences near the top
+    first = np.repeat(top[:, 0], top.shape[1] - 1)
+    other = top[:, 1:].ravel()
+    kept = (first >= 0) & (other >= 0) & (first != other)
+    links = csr_matrix((np.ones(int(kept.sum())), (first[kept], other[kept])), shape=(num_projects, num_projects))
+    # Weigh each pair of projects by how often they are listed together, in either order, dropping chance pairs
+    affinity = (links + links.T).tocsr()
+    affinity.data[affinity.data < MIN_AFFINITY] = 0
+    affinity.eliminate_zeros()
+    rows = np.arange(num_projects)
+    neighbour_of = np.repeat(rows, np.diff(affinity.indptr))
+    label = rows.copy()
+    for round_number in range(2 * LABEL_ROUNDS):
+        # Weight of each label among each project's neighbours, one entry per project and label
+        scores = csr_matrix((affinity.data, (neighbour_of, label[affinity.indices])),
+                            shape=(num_projects, num_projects))
+        scores.sum_duplicates()
+        counts = np.diff(scores.indptr)
+        owner = np.repeat(rows, counts)
+        starts = scores.indptr[:-1][counts > 0]
+        # Strongest label of each project, the lowest label among ties, and the weight of its own label
+        strongest = np.zeros(num_projects)
+        best = rows.copy()
+        if len(starts):
+            strongest[counts > 0] = np.maximum.reduceat(scores.data, starts)
+            ties = np.where(scores.data == strongest[owner], scores.indices, num_projects)
+            best[counts > 0] = np.minimum.reduceat(ties, starts)
+        own = np.bincount(owner, weights=np.where(scores.indices == label[owner], scores.data, 0),
+                          minlength=num_projects)
+        # Stop once no project is more strongly tied to another label than its own
+        improvable = strongest > own
+        if not improvable.any():
+            break
+        # Relabel every other project, alternating each round
+        label = np.where(improvable & (rows % 2 == round_number % 2), best, label)
+    # Line projects up by their group's number of students, then their group, then their number of students
+    loads = np.bincount(label, weights=sizes, minlength=num_projects)
+    order = np.lexsort((rows, label, -loads[label]))
+    # Cut the line where each shard's even share of the students is reached
+    before = np.cumsum(sizes[order]) - sizes[order]
+    shard = np.minimum(before * num_shards // max(int(sizes.sum()), 1), num_shards - 1)
+    return dict(zip([sorted_projects[index] for index in order.tolist()], shard.tolist()))
+
+
+def shard_preferences(preferences, shard_of: dict, shard: int) -> list:
+    """
+    Helper function to cut a student's preferences after the first one from their second on in another shard
+
+    resolve_shard leaves a student for the reconciliation at their first preference in another
+    shard, so it never looks further, and only the preferences before it are sent to the worker.
+
+    Parameters
+    ----------
+    preferences: list
+        Student's preferences
+    shard_of: dict
+        Projects mapped to the index of their shard
+    shard: int
+        Index of the student's shard
+
+    Returns
+    -------
+    list
+        Student's preferences up to and including their first one from their second on in another shard
+    """
+    for rank in range(1, len(preferences)):
+        # Projects that aren't being assigned aren't in any shard
+        if shard_of.get(preferences[rank]) != shard:
+            return preferences[:rank + 1]
+    return preferences
+
+
+def resolve_shard(shard: tuple) -> list:
+    """
+    Function to move students out of the projects of one shard that have too many students, within the shard
+
+    Runs in a worker process. Students try their next preferences like in
+    assign_students.assign_students_projects, but only projects in the shard can be moved
+    into. A student whose next preference that may have an opening is in another shard, or
+    who has no preferences left, is left in their project for the reconciliation, but counted
+    as leaving so the project's other students aren't pushed deeper into their preferences
+    than they would be if the whole cohort were assigned at once.
+
+    Parameters
+    ----------
+    shard: tuple
+        First entry is the shard's projects with too many students, from the most students to the fewest
+        Second entry is the preferences of each of those projects' students, in the order they were assigned,
+        cut by shard_preferences when sent to worker processes
+        Third entry is every project in the shard mapped to the number of students it can still take,
+        which is negative for projects with too many students
+
+    Returns
+    -------
+    list
+        For each project with too many students, the moves of its students as (position of the
+        student in the project, project moved to, preference for it where 0 is the first preference)
+    """
+    overfull, rosters, openings = shard
+    results = []
+    for project, rows in zip(overfull, rosters):
+        moves = []
+        # Queue of the positions of students trying each preference, every student trying their second preference first
+        queues = {1: list(range(len(rows)))}
+        # Preferences with a queue, smallest first
+        depths = [1]
+        # Deepest preference full preferences are skipped up to
+        horizon = 1
+        while openings[project] < 0 and depths:
+            num_preference = heapq.heappop(depths)
+            # Students try a preference in the order they were assigned to the project
+            positions = queues.pop(num_preference)
+            positions.sort()
+            horizon = max(horizon, 2 * num_preference)
+            for position in positions:
+                preferences = rows[position]
+                num_ranks = len(preferences)
+                if num_preference < num_ranks:
+                    next_preference = preferences[num_preference]
+                    opening = openings.get(next_preference)
+                    if opening is None or opening > 0:
+                        if opening is not None:
+                            # Move student to their most prefered project in the shard that is available
+                            moves.append((position, next_preference, num_preference))
+                            openings[next_preference] -= 1
+                        # Students whose preference is in another shard are left for the reconciliation
+                        openings[project] += 1
+                        if openings[project] == 0:
+                            break
+                        continue
+                    # Skip the student's preferences in the shard that are full, stopping at other shards' projects
+                    skip_to = num_preference + 1
+                    last = min(num_ranks, horizon + 1)
+                    while skip_to < last and openings.get(preferences[skip_to], 1) <= 0:
+                        skip_to += 1
+                    queue = queues.get(skip_to)
+                    if queue is None:
+                        queues[skip_to] = [position]
+                        heapq.heappush(depths, skip_to)
+                    else:
+                        queue.append(position)
+                else:
+                    # Students with no preferences left are moved to the least loaded project in the reconciliation
+                    openings[project] += 1
+                    if openings[project] == 0:
+                        break
+        results.append(moves)
+    return results
+
+
+def sharded_assign_students(students: dict, projects: dict, num_shards: int = None, workers: int = None,
+                            capacities=None, timings: dict = None) -> tuple:
+    """
+    Function to assign students to projects based on their preferences in parallel shards of projects
+
+    Every student starts in their first preference and each project's target number of students is
+    chosen for the whole cohort, as in assign_students.assign_students. Projects are then split into
+    shards, and each shard's students are moved between the shard's projects in its own worker
+    process. Finally, the reconciliation runs assign_students.assign_students_projects on the
+    projects still above their target, whose students' next preferences were in other shards, so
+    every project ends at its target. The more students' preferences stay within groups of
+    projects, i.e. departments, the more of the work is done in parallel.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary of projects mapped to the students assigned to the project
+    num_shards: int
+        Number of shards of projects; defaults to the number of workers
+    workers: int
+        Number of worker processes; defaults to the number of CPUs
+    capacities: tuple or dict
+        Fewest and most students of every project as in capacities.project_capacities;
+        every project has 3 or 4 students if not provided
+    timings: dict
+        If provided, the nanoseconds spent in the initial assignment, choosing each project's
+        number of students, splitting projects into shards, moving students within shards
+        and the reconciliation are added to it under initial_assignment, solve_capacities,
+        partition, shards and reconciliation
+
+    Returns
+    -------
+    tuple
+        First entry is projects dictionary where each project has been assigned between its fewest and most students
+        Second entry is sum_preferences; lower value means more students got higher preferences (1st, 2nd 3rd)
+    """
+    # If the projects' capacities can't fit the students, return None
+    minimums, maximums = project_capacities(projects, capacities)
+    if capacity_error(len(students), minimums, maximums) is not None:
+        return None
+    workers = workers or os.cpu_count() or 1
+    num_shards = num_shards or workers
+    start = time.perf_counter_ns()
+    # Call helper function to assign student to their first preference
+    projects = assign_students.initial_assignment(students, projects)
+    sum_preferences = len(students)
+    roster = Roster(projects)
+    start = assign_students.record_phase(timings, "initial_assignment", start)
+    # Choose how many students each project ends up with for the whole cohort
+    sorted_projects = assign_students.sort_projects_by_size(roster)
+    targets = solve_targets(sorted_projects, minimums, maximums, len(students))
+    start = assign_students.record_phase(timings, "solve_capacities", start)
+    # Split projects into shards, keeping each shard's projects in order of their number of students
+    shard_of = partition_projects(students, sorted_projects, num_shards)
+    shards = [([], [], {}) for shard in range(num_shards)]
+    orders = {}
+    # Shards are only sent to worker processes if there are several of both
+    pooled = workers > 1 and num_shards > 1
+    for project in sorted_projects:
+        shard = shard_of[project]
+        overfull, rosters, openings = shards[shard]
+        openings[project] = targets[project] - roster.size(project)
+        if openings[project] < 0:
+            orders[project] = roster.students(project)
+            overfull.append(project)
+            if pooled:
+                # Send workers only the preferences they can use, not every student's whole preferences
+                rosters.append([shard_preferences(students[student], shard_of, shard) for student in orders[project]])
+            else:
+                rosters.append([students[student] for student in orders[project]])
+    # Shards without students to move have nothing to do
+    shards = [shard for shard in shards if shard[0]]
+    start = assign_students.record_phase(timings, "partition", start)
+    # Move students within each shard, in this process if there is one worker, which avoids starting a pool
+    if not pooled or len(shards) <= 1:
+        results = [resolve_shard(shard) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+            results = list(executor.map(resolve_shard, shards))
+    for (overfull, rosters, openings), moves in zip(shards, results):
+        for project, project_moves in zip(overfull, moves):
+            for position, next_preference, preference in project_moves:
+                roster.move(orders[project][position], project, next_preference)
+                sum_preferences += preference
+    start = assign_students.record_phase(timings, "shards", start)
+    # Move the students left in projects with too many students across shards
+    roster, sum_preferences = assign_students.assign_students_projects(students, roster, sorted_projects, targets,
+                                                                       sum_preferences)
+    projects = roster.to_projects(projects)
+    assign_students.record_phase(timings, "reconciliation", start)
+    return (projects, sum_preferences)
@@ -0,0 +1,191 @@
+import sys
+import argparse
+import itertools
+import numpy as np
+import assign_students
+from capacities import project_capacities
+from export_assignments import assignment_table
+
+# Number of blocking swaps and improving moves listed as examples in a report
+DEFAULT_EXAMPLES = 5
+
+
+def preferred_projects(students: dict, projects: dict, table: tuple) -> tuple:
+    """
+    Helper function to list every project a student ranks above the project they were assigned
+
+    Only the preferences before each student's own project are looked at, so the work grows with
+    how far students are from their first preference instead of with the number of projects.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them
+    table: tuple
+        Project assignments indexed by export_assignments.assignment_table
+
+    Returns
+    -------
+    tuple
+        First entry is the array of student indexes, one per project a student prefers
+        Second entry is the array of the index of the project the student prefers
+    """
+    student_rank = np.asarray(table[1], dtype=np.intp)
+    # Number of preferences each student ranks above their project
+    counts = student_rank - 1
+    students_index = np.repeat(np.arange(len(student_rank)), counts)
+    # Position of each preference in its student's preferences
+    starts = np.cumsum(counts) - counts
+    positions = np.arange(len(students_index)) - np.repeat(starts, counts)
+    project_index = {project: index for index, project in enumerate(projects)}
+    if hasattr(students, "preferences"):
+        # Students loaded from a binary students file are looked up in their preference matrix at once
+        renumber = np.array([project_index.get(project, -1) for project in students.project_labels], dtype=np.intp)
+        wanted = renumber[students.preferences[students_index, positions]]
+    else:
+        listed = itertools.chain.from_iterable(preferences[:rank - 1] for preferences, rank
+                                               in zip(students.values(), table[1]))
+        wanted = np.fromiter((project_index.get(project, -1) for project in listed), dtype=np.intp,
+                             count=len(students_index))
+    # Leave out projects students listed that aren't being assigned
+    kept = wanted >= 0
+    return (students_index[kept], wanted[kept])
+
+
+def find_blocking_pairs(students: dict, projects: dict, capacities=None, examples: int = DEFAULT_EXAMPLES,
+                        registry=None) -> dict:
+    """
+    Function to check whether any students would rather swap projects or move to a project with room
+
+    Two students block an assignment when each prefers the other's project to their own, since
+    swapping them keeps every project's size and lowers the sum of preferences. A student can
+    improve by moving when they prefer a project below its most students, and their own project
+    is above its fewest students. Rather than comparing every pair of students, the students in
+    each project who prefer each other project are counted, so a project pair with a and b such
+    students in each direction holds a * b blocking pairs.
+
+    Parameters
+    ----------
+    students: dict
+        Dictionary of students mapped to their preferences
+    projects: dict
+        Dictionary containing projects mapped to the students assigned to them, as returned by assign_students
+    capacities: tuple or dict
+        Fewest and most students of every project as in capacities.project_capacities;
+        every project has 3 or 4 students if not provided
+    examples: int
+        Most blocking pairs and improving moves to list
+    registry: Registry
+        If provided, the registry.Registry students and projects are given by ID in, so the
+        examples are listed by name and label
+
+    Returns
+    -------
+    dict
+        Number of students, blocking_pairs, improving_moves and students_with_moves, and lists of
+        example swaps (student, project, other student, other project) and moves (student, project,
+        project they prefer), where projects in the lists are labels from projects
+    """
+    table = assignment_table(students, projects)
+    num_projects = len(projects)
+    student_project = np.asarray(table[0], dtype=np.int64)
+    envious, wanted = preferred_projects(students, projects, table)
+    held = student_project[envious]
+    # Count the students of each project who prefer each other project
+    keys, first, counts = np.unique(held * num_projects + wanted, return_index=True, return_counts=True)
+    # Find the students who prefer the opposite way, counting each pair of projects once
+    reverse = (keys % num_projects) * num_projects + keys // num_projects
+    match = np.searchsorted(keys, reverse)
+    match[match == len(keys)] = 0
+    blocking = (keys[match] == reverse) & (keys // num_projects < keys % num_projects)
+    blocking_pairs = int((counts[blocking] * counts[match[blocking]]).sum())
+    # Moves are possible into projects below their most students out of projects above their fewest
+    minimums, maximums = project_capacities(projects, capacities)
+    sizes = np.bincount(student_project, minlength=num_projects)
+    has_room = sizes < np.array([maximums[project] for project in projects])
+    can_leave = sizes > np.array([minimums[project] for project in projects])
+    moves = has_room[wanted] & can_leave[held]
+    # Describe the first few blocking pairs and moves by name
+    names = list(students) if registry is None else registry.student_names(students)
+    project_labels = list(projects) if registry is None else [registry.project_labels[project] for project in projects]
+    swap_examples = []
+    for index in np.flatnonzero(blocking)[:examples].tolist():
+        student, other = envious[first[index]], envious[first[match[index]]]
+        swap_examples.append((names[student], project_labels[student_project[student]],
+                              names[other], project_labels[student_project[other]]))
+    move_examples = [(names[envious[index]], project_labels[held[index]], project_labels[wanted[index]])
+                     for index in np.flatnonzero(moves)[:examples].tolist()]
+    return {"students": len(names), "blocking_pairs": blocking_pairs, "improving_moves": int(moves.sum()),
+            "students_with_moves": len(np.unique(envious[moves])), "swaps": swap_examples, "moves": move_examples}
+
+
+def print_stability_report(report: dict, file=sys.stdout) -> None:
+    """
+    Helper function to print the counts and examples found by find_blocking_pairs
+
+    Parameters
+    ----------
+    report: dict
+        Report returned by find_blocking_pairs
+    file: file
+        File to print the report to
+
+    Returns
+    -------
+    None
+    """
+    print("Blocking pairs:", report["blocking_pairs"], "Improving moves:", report["improving_moves"],
+          "(" + str(report["students_with_moves"]) + " of " + str(report["students"]) + " students)", file=file)
+    for student, project, other, other_project in report["swaps"]:
+        print("  " + str(student), "in project", project, "and", other, "in project", other_project,
+              "would both rather swap", file=file)
+    for student, project, preferred in report["moves"]:
+        print("  " + str(student), "in project", project, "would rather move to project", preferred, file=file)
+
+
+def load_project_assignments(path_to_file: str) -> dict:
+    """
+    Helper function to read project assignments written by assign_students.write_project_assignments
+
+    Parameters
+    ----------
+    path_to_file: str
+        Path to the file containing a project followed by its students separated by commas on each line
+
+    Returns
+    -------
+    dict
+        Projects mapped to the students assigned to them
+    """
+    projects = {}
+    with open(path_to_file) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            project, _, members = line.rstrip("\n").partition(" ")
+            projects[int(project)] = members.split(",") if members else []
+    return projects
+
+
+if __name__ == "__main__":
+    # Read in command line arguments
+    parser = argparse.ArgumentParser(description="Find students who would rather swap or move projects")
+    parser.add_argument("path_to_file", help="file name containing students")
+    parser.add_argument("assignments", help="project assignments file written by assign_students.py")
+    parser.add_argument("--examples", type=int, default=DEFAULT_EXAMPLES,
+                        help="most blocking pairs and improving moves to list")
+    args = parser.parse_args()
+    # Call helper functions to read the students and their project assignments
+    students = assign_students.load_students(args.path_to_file)
+    projects = load_project_assignments(args.assignments)
+    try:
+        report = find_blocking_pairs(students, projects, examples=args.examples)
+    except ValueError as error:
+        print("Can't check project assignments:", error, file=sys.stderr)
+        sys.exit(1)
+    print_stability_report(report)
+    # Fail if any students would rather swap, so the check can gate a batch of assignments
+    if report["blocking_pairs"]:
+        sys.exit(2)
@@ -0,0 +1,175 @@
+import random
+import pytest
+import assign_students
+import local_search
+from roster import Roster
+from capacities import project_capacities
+from cascade_stats import CascadeStats
+from incremental_assignment import IncrementalAssignment
+
+# Number of random cohorts each check runs on
+NUM_COHORTS = 200
+
+
+def generate_cohort(rng: random.Random, full: bool = False) -> tuple:
+    """
+    Helper function to generate a random cohort that fits in projects of 3 or 4 students
+
+    Projects are given skewed popularity so some projects have far too many first choices, and
+    unless full is set students list every project, a few projects or a third of them.
+
+    Returns
+    -------
+    tuple
+        First entry is the dictionary of students mapped to their preferences
+        Second entry is the list of projects
+    """
+    num_projects = rng.randint(3, 30)
+    num_students = rng.randint(3 * num_projects, 4 * num_projects)
+    num_ranks = num_projects if full else rng.choice([num_projects, max(1, num_projects // 3), 3])
+    popularity = [rng.random() ** 3 for _ in range(num_projects)]
+    students = {}
+    for student in range(num_students):
+        # Draw the student's preferences from the most to the least popular, with some noise
+        order = sorted(range(1, num_projects + 1), key=lambda project: -popularity[project - 1] * rng.random())
+        students["Student " + str(student)] = order[:num_ranks]
+    return (students, list(range(1, num_projects + 1)))
+
+
+def generate_capacities(rng: random.Random, projects: list, num_students: int):
+    """
+    Helper function to give some projects other sizes than 3 or 4 students, or None to keep them
+
+    The sizes always have room for every student.
+    """
+    if rng.random() < 0.5:
+        return None
+    capacities = {project: (rng.randint(1, 3), rng.randint(4, 6)) for project in projects}
+    while sum(maximum for minimum, maximum in capacities.values()) < num_students:
+        capacities[rng.choice(projects)] = (1, num_students)
+    return capacities
+
+
+def preference(preferences: list, project) -> int:
+    """
+    Helper function to look up a student's preference for a project, where 1 is their first preference
+    and a project they didn't list comes after every project they listed
+    """
+    return local_search.preference_rank(preferences, project) + 1
+
+
+def check_assignment(students: dict, projects: dict, sum_preferences: int, capacities=None) -> None:
+    """
+    Helper function to check every student has one project, every project is within its
+    capacities and sum_preferences is the sum of each student's preference for their project
+    """
+    minimums, maximums = project_capacities(projects, capacities)
+    assigned = [student for members in projects.values() for student in members]
+    assert sorted(assigned) == sorted(students)
+    for project, members in projects.items():
+        assert minimums[project] <= len(members) <= maximums[project]
+    assert sum_preferences == sum(preference(students[student], project)
+                                  for project, members in projects.items() for student in members)
+
+
+def rescan_assign_students_projects(students: dict, roster: Roster, sorted_projects: list, targets: dict,
+                                    sum_preferences: int, stats: CascadeStats = None) -> tuple:
+    """
+    Cascade assign_students used before it kept students in queues by their next preference
+
+    Every student of a project with too many students tries their next preference in the order
+    they were assigned to it, one preference at a time, rescanning the project for each preference.
+    """
+    for project in sorted_projects:
+        num_preference = 1
+        while roster.size(project) > targets[project]:
+            for student in roster.students(project):
+                preferences = students[student]
+                if num_preference < len(preferences):
+                    next_preference, rank = preferences[num_preference], num_preference
+                else:
+                    next_preference, rank = assign_students.least_loaded_project(preferences, roster, targets)
+                if roster.size(next_preference) < targets[next_preference]:
+                    sum_preferences += rank
+                    roster.move(student, project, next_preference)
+                    if roster.size(project) <= targets[project]:
+                        break
+            num_preference += 1
+    return (roster, sum_preferences)
+
+
+def test_numpy_engine_matches_dict_engine():
+    pytest.importorskip("numpy")
+    rng = random.Random(1)
+    for _ in range(NUM_COHORTS):
+        students, project_list = generate_cohort(rng, full=True)
+        capacities = generate_capacities(rng, project_list, len(students))
+        expected = assign_students.assign_students(students, assign_students.initalize_projects(students, project_list),
+                                                   capacities=capacities)
+        result = assign_students.assign_students(students, assign_students.initalize_projects(students, project_list),
+                                                 use_numpy=True, capacities=capacities)
+        # The same students end up in the same projects in the same order
+        assert result == expected
+        check_assignment(students, *result, capacities)
+
+
+def test_queue_cascade_matches_rescan_cascade(monkeypatch):
+    rng = random.Random(2)
+    cohorts = [generate_cohort(rng) for _ in range(NUM_COHORTS)]
+    results = []
+    for students, project_list in cohorts:
+        projects = assign_students.initalize_projects(students, project_list)
+        results.append(assign_students.assign_students(students, projects, stats=CascadeStats()))
+    monkeypatch.setattr(assign_students, "assign_students_projects", rescan_assign_students_projects)
+    for (students, project_list), result in zip(cohorts, results):
+        expected = assign_students.assign_students(students, assign_students.initalize_projects(students, project_list))
+        assert result == expected
+        check_assignment(students, *result)
+
+
+def test_demand_order_matches_size_order():
+    demand_index = pytest.importorskip("demand_index")
+    rng = random.Random(3)
+    for _ in range(NUM_COHORTS):
+        students, project_list = generate_cohort(rng)
+        capacities = generate_capacities(rng, project_list, len(students))
+        expected = assign_students.assign_students(students, assign_students.initalize_projects(students, project_list),
+                                                   capacities=capacities)
+        projects = assign_students.initalize_projects(students, project_list)
+        demand = demand_index.build_demand_index(students, projects)
+        assert assign_students.assign_students(students, projects, capacities=capacities, demand=demand) == expected
+
+
+def test_incremental_repair_keeps_sizes_and_exact_sum():
+    rng = random.Random(4)
+    for _ in range(NUM_COHORTS):
+        students, project_list = generate_cohort(rng)
+        projects, sum_preferences = assign_students.assign_students(
+            students, assign_students.initalize_projects(students, project_list))
+        assignment = IncrementalAssignment(students, projects, sum_preferences)
+        for change in range(10):
+            names = list(students)
+            # Drop, add and change a few students, as long as the projects can still hold 3 or 4 each
+            removed = rng.sample(names, rng.randint(0, min(3, len(students) - 3 * len(project_list))))
+            num_added = rng.randint(0, 4 * len(project_list) - len(students) + len(removed))
+            added = {"Joined " + str(change) + " " + str(student):
+                     rng.sample(project_list, rng.randint(1, min(4, len(project_list))))
+                     for student in range(min(num_added, 3))}
+            changed = {student: rng.sample(project_list, rng.randint(1, len(project_list)))
+                       for student in rng.sample([name for name in names if name not in removed], 2)}
+            # The assignment updates students with the changes
+            _, sum_preferences = assignment.apply(added, removed, changed)
+            check_assignment(students, assignment.to_projects(), sum_preferences)
+
+
+def test_local_search_never_raises_sum():
+    rng = random.Random(5)
+    for _ in range(NUM_COHORTS):
+        students, project_list = generate_cohort(rng)
+        capacities = generate_capacities(rng, project_list, len(students))
+        projects, sum_preferences = assign_students.assign_students(
+            students, assign_students.initalize_projects(students, project_list), capacities=capacities)
+        improved, improved_sum = local_search.improve_assignment(students, projects, sum_preferences,
+                                                                 capacities=capacities)
+        assert improved_sum <= sum_preferences
+        check_assignment(students, improved, improved_sum, capacities)